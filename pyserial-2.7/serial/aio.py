@@ -0,0 +1,288 @@
+#! python
+#
+# Python Serial Port Extension for Win32, Linux, BSD, Jython
+# see __init__.py
+#
+# This module provides asyncio transports for serial ports. Requires Python
+# 3.4 or newer and a POSIX system for native ports.
+#
+# this is distributed under a free software license, see license.txt
+
+"""\
+asyncio support for serial ports.
+
+create_serial_connection() opens a port and connects it to a protocol
+instance, like loop.create_connection() does for TCP. Several ports can then
+be served by one event loop instead of one blocking reader per device:
+
+    class Output(asyncio.Protocol):
+        def data_received(self, data):
+            print(data)
+
+    connect = serial.aio.create_serial_connection(loop, Output, "/dev/ttyUSB0", baudrate=115200)
+    transport, protocol = loop.run_until_complete(connect)
+    loop.run_forever()
+
+Besides native ports the URLs ``loop://`` and ``socket://<host>:<port>`` are
+accepted. loop:// is served by an in-memory transport, socket:// by the
+TCP transport of the event loop. The in-memory transport takes no options,
+loop:// URLs with options (logging, buffersize) are rejected.
+"""
+
+import asyncio
+import os
+import errno
+
+import serial
+from serial.serialutil import SerialException, to_bytes
+
+
+class SerialTransport(asyncio.Transport):
+    """asyncio transport for a serial port that has a file descriptor. The
+    port is read and written through the event loop, the Serial instance is
+    only used to open, configure and close it."""
+
+    # maximum number of bytes read per readiness callback
+    max_size = 4096
+
+    def __init__(self, loop, protocol, serial_instance):
+        super(SerialTransport, self).__init__({'serial': serial_instance})
+        self._loop = loop
+        self._protocol = protocol
+        self._serial = serial_instance
+        self._fd = serial_instance.fileno()
+        self._write_buffer = bytearray()
+        self._closing = False
+        self._reading = True
+        self._writing_paused = False
+        self.set_write_buffer_limits()
+        self._loop.call_soon(self._protocol.connection_made, self)
+        self._loop.call_soon(self._loop.add_reader, self._fd, self._read_ready)
+
+    @property
+    def serial(self):
+        """The underlying Serial instance."""
+        return self._serial
+
+    def __repr__(self):
+        return '%s(%r, %r)' % (self.__class__.__name__, self._protocol, self._serial)
+
+    #  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -
+
+    def is_closing(self):
+        return self._closing
+
+    def close(self):
+        """Close the transport after sending what is buffered. The protocol's
+        connection_lost() is called with None afterwards."""
+        if self._closing:
+            return
+        self._closing = True
+        self._loop.remove_reader(self._fd)
+        if not self._write_buffer:
+            self._loop.call_soon(self._call_connection_lost, None)
+
+    def abort(self):
+        """Close the transport immediately, discarding buffered data."""
+        self._abort(None)
+
+    def _abort(self, exc):
+        self._closing = True
+        self._loop.remove_reader(self._fd)
+        if self._write_buffer:
+            self._loop.remove_writer(self._fd)
+            del self._write_buffer[:]
+        self._loop.call_soon(self._call_connection_lost, exc)
+
+    def _fatal_error(self, exc):
+        if isinstance(exc, OSError) and not isinstance(exc, SerialException):
+            exc = SerialException('serial transport failed: %s' % (exc,))
+        self._abort(exc)
+
+    def _call_connection_lost(self, exc):
+        try:
+            self._protocol.connection_lost(exc)
+        finally:
+            self._serial.close()
+            self._protocol = None
+            self._loop = None
+
+    #  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -
+
+    def pause_reading(self):
+        if self._reading and not self._closing:
+            self._reading = False
+            self._loop.remove_reader(self._fd)
+
+    def resume_reading(self):
+        if not self._reading and not self._closing:
+            self._reading = True
+            self._loop.add_reader(self._fd, self._read_ready)
+
+    def _read_ready(self):
+        try:
+            data = os.read(self._fd, self.max_size)
+        except OSError as e:
+            if e.errno not in (errno.EAGAIN, errno.EINTR):
+                self._fatal_error(e)
+            return
+        if not data:
+            # see PosixSerial.read()
+            self._fatal_error(SerialException('device reports readiness to read but returned no data (device disconnected or multiple access on port?)'))
+            return
+        self._protocol.data_received(data)
+
+    #  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -
+
+    def set_write_buffer_limits(self, high=None, low=None):
+        if high is None:
+            if low is None:
+                high = 64 * 1024
+            else:
+                high = 4 * low
+        if low is None:
+            low = high // 4
+        if not high >= low >= 0:
+            raise ValueError('high (%r) must be >= low (%r) must be >= 0' % (high, low))
+        self._high_water = high
+        self._low_water = low
+        self._maybe_pause_protocol()
+
+    def get_write_buffer_size(self):
+        return len(self._write_buffer)
+
+    def can_write_eof(self):
+        return False
+
+    def write(self, data):
+        """Send data. What can not be written immediately is buffered and
+        sent when the port becomes writable."""
+        if self._closing:
+            return
+        data = to_bytes(data)
+        if not self._write_buffer:
+            try:
+                n = os.write(self._fd, data)
+            except OSError as e:
+                if e.errno not in (errno.EAGAIN, errno.EINTR):
+                    self._fatal_error(e)
+                    return
+                n = 0
+            if n == len(data):
+                return
+            data = memoryview(data)[n:]
+            self._loop.add_writer(self._fd, self._write_ready)
+        self._write_buffer += data
+        self._maybe_pause_protocol()
+
+    def _write_ready(self):
+        try:
+            n = os.write(self._fd, self._write_buffer)
+        except OSError as e:
+            if e.errno not in (errno.EAGAIN, errno.EINTR):
+                self._fatal_error(e)
+            return
+        del self._write_buffer[:n]
+        self._maybe_resume_protocol()
+        if not self._write_buffer:
+            self._loop.remove_writer(self._fd)
+            if self._closing:
+                self._call_connection_lost(None)
+
+    def _maybe_pause_protocol(self):
+        if not self._writing_paused and len(self._write_buffer) > self._high_water:
+            self._writing_paused = True
+            self._protocol.pause_writing()
+
+    def _maybe_resume_protocol(self):
+        if self._writing_paused and len(self._write_buffer) <= self._low_water:
+            self._writing_paused = False
+            self._protocol.resume_writing()
+
+
+class LoopbackTransport(asyncio.Transport):
+    """asyncio transport for loop:// URLs. Everything written is passed back
+    to the protocol's data_received() in a later iteration of the event
+    loop."""
+
+    def __init__(self, loop, protocol):
+        super(LoopbackTransport, self).__init__()
+        self._loop = loop
+        self._protocol = protocol
+        self._pending = bytearray()     # written, not yet delivered
+        self._closing = False
+        self._reading = True
+        self._loop.call_soon(self._protocol.connection_made, self)
+
+    def is_closing(self):
+        return self._closing
+
+    def close(self):
+        if self._closing:
+            return
+        self._closing = True
+        self._loop.call_soon(self._protocol.connection_lost, None)
+
+    abort = close
+
+    def pause_reading(self):
+        self._reading = False
+
+    def resume_reading(self):
+        if not self._reading:
+            self._reading = True
+            if self._pending:
+                self._loop.call_soon(self._deliver)
+
+    def get_write_buffer_size(self):
+        return 0
+
+    def can_write_eof(self):
+        return False
+
+    def write(self, data):
+        if self._closing:
+            return
+        data = to_bytes(data)
+        if not self._pending:
+            self._loop.call_soon(self._deliver)
+        self._pending += data
+
+    def _deliver(self):
+        if self._closing or not self._reading or not self._pending:
+            return
+        data = bytes(self._pending)
+        del self._pending[:]
+        self._protocol.data_received(data)
+
+
+def create_serial_connection(loop, protocol_factory, url, *args, **kwargs):
+    """Open the port given by url and connect it to a protocol instance
+    created by protocol_factory. Other arguments are passed to
+    serial.serial_for_url() for native ports. Returns a future whose result
+    is the tuple (transport, protocol)."""
+    url_nocase = url.lower()
+    if url_nocase.startswith('socket://'):
+        host, port = serial.serial_for_url(url, do_not_open=True).fromURL(url)
+        return loop.create_task(loop.create_connection(protocol_factory, host, port))
+    # loop.create_future() is only available from Python 3.5.2 on
+    future = asyncio.Future(loop=loop)
+    try:
+        if url_nocase.startswith('loop://') and url[7:].strip('/'):
+            raise SerialException('loop:// options are not supported with asyncio: %r' % (url,))
+        protocol = protocol_factory()
+        if url_nocase.startswith('loop://'):
+            transport = LoopbackTransport(loop, protocol)
+        else:
+            serial_instance = serial.serial_for_url(url, *args, **kwargs)
+            try:
+                serial_instance.fileno()
+            except AttributeError:
+                serial_instance.close()
+                raise SerialException('%s has no file descriptor, it can not be used with asyncio' % (url,))
+            transport = SerialTransport(loop, protocol, serial_instance)
+    except Exception as e:
+        future.set_exception(e)
+    else:
+        future.set_result((transport, protocol))
+    return future
@@ -0,0 +1,194 @@
+#! python
+#
+# Python Serial Port Extension for Win32, Linux, BSD, Jython
+# see __init__.py
+#
+# This module records the traffic of a serial port into a journal file that
+# the replay:// URL handler plays back.
+#
+# this is distributed under a free software license, see license.txt
+
+"""\
+Recording of serial port traffic.
+
+JournalSerial wraps an open port and tees every byte read from and written to
+it into a journal, together with the time it was seen:
+
+    port = serial.journal.JournalSerial(serial.Serial('/dev/ttyUSB0', 115200), 'imu.jrnl')
+    ...
+    port.close()
+
+The journal can then stand in for the device:
+
+    port = serial.serial_for_url('replay://speed=100/file=imu.jrnl')
+
+A journal is a header (``JOURNAL_HEADER``) followed by one record per read or
+write call: timestamp in seconds on the monotonic clock (float64), direction
+(``READ`` or ``WRITE``), data length (uint32) and the data, all little
+endian. Records of a direction are in the order the data passed the port.
+"""
+
+import struct
+import threading
+
+from serial.serialutil import SerialException, to_bytes, LF, monotonic
+
+JOURNAL_MAGIC = b'SERJRNL'
+JOURNAL_VERSION = 1
+JOURNAL_HEADER = struct.Struct('<7sB')
+RECORD_HEADER = struct.Struct('<dBI')
+
+# directions, as seen from the host
+READ = 0
+WRITE = 1
+
+
+class JournalWriter(object):
+    """Writes journal records, from any number of threads."""
+
+    def __init__(self, filename):
+        self._file = open(filename, 'wb')
+        self._file.write(JOURNAL_HEADER.pack(JOURNAL_MAGIC, JOURNAL_VERSION))
+        self._lock = threading.Lock()
+
+    def write(self, direction, data, timestamp=None):
+        if timestamp is None:
+            timestamp = monotonic()
+        header = RECORD_HEADER.pack(timestamp, direction, len(data))
+        self._lock.acquire()
+        try:
+            self._file.write(header)
+            self._file.write(data)
+        finally:
+            self._lock.release()
+
+    def flush(self):
+        self._lock.acquire()
+        try:
+            self._file.flush()
+        finally:
+            self._lock.release()
+
+    def close(self):
+        self._lock.acquire()
+        try:
+            self._file.close()
+        finally:
+            self._lock.release()
+
+
+class JournalReader(object):
+    """Iterates over the records of a journal as (timestamp, direction, data)
+    tuples. A record cut short at the end of the file, as left behind by a
+    program that was killed, ends the journal."""
+
+    def __init__(self, filename):
+        self._file = open(filename, 'rb')
+        header = self._file.read(JOURNAL_HEADER.size)
+        if len(header) < JOURNAL_HEADER.size or \
+                JOURNAL_HEADER.unpack(header) != (JOURNAL_MAGIC, JOURNAL_VERSION):
+            self._file.close()
+            raise SerialException('%s is not a serial journal' % (filename,))
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        header = self._file.read(RECORD_HEADER.size)
+        if len(header) == RECORD_HEADER.size:
+            timestamp, direction, length = RECORD_HEADER.unpack(header)
+            data = self._file.read(length)
+            if len(data) == length:
+                return timestamp, direction, data
+        raise StopIteration
+
+    next = __next__
+
+    def close(self):
+        self._file.close()
+
+
+class JournalSerial(object):
+    """Wraps a Serial instance and records its traffic. Everything but
+    reading (read, readinto, readIntoRing, readline), writing and closing is
+    passed through to the wrapped port."""
+
+    def __init__(self, serial_instance, filename):
+        self.serial = serial_instance
+        self.journal = JournalWriter(filename)
+
+    def read(self, size=1):
+        data = self.serial.read(size)
+        if data:
+            self.journal.write(READ, data)
+        return data
+
+    def readinto(self, b):
+        n = self.serial.readinto(b)
+        if n:
+            try:
+                data = memoryview(b)[:n].tobytes()
+            except TypeError:
+                # array.array on Python 2 does not support memoryview
+                data = b[:n].tostring()
+            self.journal.write(READ, data)
+        return n
+
+    def readIntoRing(self, ring):
+        # the data goes to the start of the free space
+        segments = ring.writableSegments()
+        n = self.serial.readIntoRing(ring)
+        if n:
+            data = bytearray()
+            for segment in segments:
+                data += segment[:n - len(data)].tobytes()
+            self.journal.write(READ, bytes(data))
+        return n
+
+    def readline(self, size=None, eol=LF):
+        """read a line with the readline() of the wrapped port, the line is
+        journaled as one record."""
+        if eol == LF:
+            # io based ports only take the size
+            if size is None:
+                line = self.serial.readline()
+            else:
+                line = self.serial.readline(size)
+        else:
+            line = self.serial.readline(size, eol)
+        if line:
+            self.journal.write(READ, line)
+        return line
+
+    def write(self, data):
+        data = to_bytes(data)
+        n = self.serial.write(data)
+        if data:
+            self.journal.write(WRITE, data)
+        return n
+
+    def close(self):
+        self.serial.close()
+        self.journal.close()
+
+    def __getattr__(self, name):
+        return getattr(self.serial, name)
+
+
+def dump(filename):
+    """print the records of a journal"""
+    journal = JournalReader(filename)
+    start = None
+    try:
+        for timestamp, direction, data in journal:
+            if start is None:
+                start = timestamp
+            print('%10.6f %s %r' % (timestamp - start, '<>'[direction], data))
+    finally:
+        journal.close()
+
+
+if __name__ == '__main__':
+    import sys
+    for filename in sys.argv[1:]:
+        dump(filename)
@@ -12,7 +12,8 @@
 #
 # references: http://www.easysw.com/~mike/serial/serial.html
 
-import sys, os, fcntl, termios, struct, select, errno, time
+import sys, os, fcntl, termios, struct, select, errno, time, threading
+import collections, itertools
 from serial.serialutil import *
 
 # Do check the Python version as some constants have moved.
@@ -276,6 +277,23 @@ class PosixSerial(SerialBase):
     done with termios and fcntl. Runs on Linux and many other Un*x like
     systems."""
 
+    # upper limit for the number of bytes fetched with one os.read when the
+    # receive buffer is filled. the fd is non-blocking so a read returns
+    # whatever the driver has waiting, up to this size.
+    READ_CHUNK_SIZE = 4096
+
+    # maximum number of queued chunks handed to the OS with one writev
+    WRITE_QUEUE_IOV_MAX = 64
+
+    # seconds close() waits for the write queue beyond its transmission time
+    # when there is no writeTimeout
+    WRITE_QUEUE_DRAIN_SLACK = 1.0
+
+    # size of the write queue in bytes, 0 when write() blocks, see
+    # setWriteQueueSize(). the thread sending the queue, if one is running
+    _tx_queue_size = 0
+    _tx_thread = None
+
     def open(self):
         """Open port with current settings. This may throw a SerialException
            if the port cannot be opened."""
@@ -284,6 +302,10 @@ class PosixSerial(SerialBase):
         if self._isOpen:
             raise SerialException("Port is already open.")
         self.fd = None
+        # data that was read from the port but not yet returned, see readline()
+        self._rx_buffer = bytearray()
+        # file object wrapping fd, used by readinto() if os.readv is missing
+        self._fileio = None
         # open
         try:
             self.fd = os.open(self.portstr, os.O_RDWR|os.O_NOCTTY|os.O_NONBLOCK)
@@ -306,6 +328,8 @@ class PosixSerial(SerialBase):
         else:
             self._isOpen = True
         self.flushInput()
+        if self._tx_queue_size:
+            self._startWriter()
 
 
     def _reconfigurePort(self):
@@ -433,6 +457,8 @@ class PosixSerial(SerialBase):
     def close(self):
         """Close port"""
         if self._isOpen:
+            if self._tx_thread is not None:
+                self._stopWriter()
             if self.fd is not None:
                 os.close(self.fd)
                 self.fd = None
@@ -447,7 +473,21 @@ class PosixSerial(SerialBase):
         """Return the number of characters currently in the input buffer."""
         #~ s = fcntl.ioctl(self.fd, TERMIOS.FIONREAD, TIOCM_zero_str)
         s = fcntl.ioctl(self.fd, TIOCINQ, TIOCM_zero_str)
-        return struct.unpack('I',s)[0]
+        return len(self._rx_buffer) + struct.unpack('I',s)[0]
+
+    def _waitReadable(self, timeout):
+        """internal - wait up to timeout seconds (None: forever) until the
+        port is ready to read. Returns a true value when it is ready, a false
+        one on timeout."""
+        ready,_,_ = select.select([self.fd],[],[], timeout)
+        return ready
+
+    def _waitWritable(self, timeout):
+        """internal - wait up to timeout seconds (None: forever) until the
+        port is ready to write. Returns a true value when it is ready, a false
+        one on timeout."""
+        _, ready, _ = select.select([], [self.fd], [], timeout)
+        return ready
 
     # select based implementation, proved to work on many systems
     def read(self, size=1):
@@ -456,9 +496,13 @@ class PosixSerial(SerialBase):
            until the requested number of bytes is read."""
         if not self._isOpen: raise portNotOpenError
         read = bytearray()
+        if self._rx_buffer:
+            # serve data that readline() has buffered first
+            read = self._rx_buffer[:size]
+            del self._rx_buffer[:size]
         while len(read) < size:
             try:
-                ready,_,_ = select.select([self.fd],[],[], self._timeout)
+                ready = self._waitReadable(self._timeout)
                 # If select was used with a timeout, and the timeout occurs, it
                 # returns with empty lists -> thus abort read operation.
                 # For timeout == 0 (non-blocking operation) also abort when there
@@ -485,10 +529,164 @@ class PosixSerial(SerialBase):
                     raise SerialException('read failed: %s' % (e,))
         return bytes(read)
 
+    def _readv(self, buffers):
+        """internal - read from the port straight into the given list of
+        writable buffers (filled in order, until the driver has no more data).
+        Returns the number of bytes read, None if nothing was available."""
+        if hasattr(os, 'readv'):
+            return os.readv(self.fd, buffers)
+        if self._fileio is None:
+            import io
+            self._fileio = io.FileIO(self.fd, 'r', closefd=False)
+        total = None
+        for buffer in buffers:
+            n = self._fileio.readinto(buffer)
+            if n is None:
+                break
+            total = (total or 0) + n
+            if n < len(buffer):
+                break
+        return total
+
+    def readinto(self, b):
+        """Read up to len(b) bytes into the writable buffer b, straight from
+        the port without intermediate copies. If a timeout is set it may
+        return less characters as requested. With no timeout it will block
+        until the buffer is filled. Returns the number of bytes read."""
+        if not self._isOpen: raise portNotOpenError
+        try:
+            view = memoryview(b)
+        except TypeError:
+            # e.g. array.array on Python 2 does not support memoryview
+            return SerialBase.readinto(self, b)
+        size = len(view)
+        n = 0
+        if self._rx_buffer:
+            # serve data that readline() has buffered first
+            n = min(size, len(self._rx_buffer))
+            view[:n] = self._rx_buffer[:n]
+            del self._rx_buffer[:n]
+        while n < size:
+            try:
+                ready = self._waitReadable(self._timeout)
+                if not ready:
+                    break   # timeout
+                count = self._readv([view[n:]])
+                if count is None:
+                    continue
+                if not count:
+                    # see read()
+                    raise SerialException('device reports readiness to read but returned no data (device disconnected or multiple access on port?)')
+                n += count
+            except select.error, e:
+                # ignore EAGAIN errors. all other errors are shown
+                if e[0] != errno.EAGAIN:
+                    raise SerialException('read failed: %s' % (e,))
+            except OSError, e:
+                # ignore EAGAIN errors. all other errors are shown
+                if e.errno != errno.EAGAIN:
+                    raise SerialException('read failed: %s' % (e,))
+        return n
+
+    def readIntoRing(self, ring):
+        """Wait for data (respecting the timeout) and read what is available,
+        up to the free space of the RingBuffer ring, straight into its
+        storage. Returns the number of bytes added to ring."""
+        if not self._isOpen: raise portNotOpenError
+        if self._rx_buffer:
+            # serve data that readline() has buffered first
+            n = ring.write(self._rx_buffer)
+            del self._rx_buffer[:n]
+            return n
+        if not ring.free():
+            return 0
+        while True:
+            try:
+                ready = self._waitReadable(self._timeout)
+                if not ready:
+                    return 0    # timeout
+                count = self._readv(ring.writableSegments())
+                if count is None:
+                    continue
+                if not count:
+                    # see read()
+                    raise SerialException('device reports readiness to read but returned no data (device disconnected or multiple access on port?)')
+                ring.commit(count)
+                return count
+            except select.error, e:
+                # ignore EAGAIN errors. all other errors are shown
+                if e[0] != errno.EAGAIN:
+                    raise SerialException('read failed: %s' % (e,))
+            except OSError, e:
+                # ignore EAGAIN errors. all other errors are shown
+                if e.errno != errno.EAGAIN:
+                    raise SerialException('read failed: %s' % (e,))
+
+    def _fillReadBuffer(self, timeout):
+        """internal - wait up to timeout seconds for the port to become
+        readable and append everything the driver has waiting to the receive
+        buffer with one os.read. Returns the number of bytes added, 0 on
+        timeout."""
+        while True:
+            try:
+                ready = self._waitReadable(timeout)
+                if not ready:
+                    return 0    # timeout
+                buf = os.read(self.fd, self.READ_CHUNK_SIZE)
+                if not buf:
+                    # see read()
+                    raise SerialException('device reports readiness to read but returned no data (device disconnected or multiple access on port?)')
+                self._rx_buffer.extend(buf)
+                return len(buf)
+            except select.error, e:
+                # ignore EAGAIN errors. all other errors are shown
+                if e[0] != errno.EAGAIN:
+                    raise SerialException('read failed: %s' % (e,))
+            except OSError, e:
+                # ignore EAGAIN errors. all other errors are shown
+                if e.errno != errno.EAGAIN:
+                    raise SerialException('read failed: %s' % (e,))
+
+    def readline(self, size=None, eol=LF):
+        """read a line which is terminated with end-of-line (eol) character
+        ('\n' by default) or until timeout. Data is fetched from the driver in
+        blocks and searched for eol, bytes following the line are kept in a
+        receive buffer and returned by the next read() or readline() call."""
+        if not self._isOpen: raise portNotOpenError
+        if size is not None and size < 0:
+            size = None     # no limit, as for io.IOBase.readline()
+        buf = self._rx_buffer
+        leneol = len(eol)
+        start = 0
+        while True:
+            end = buf.find(eol, start)
+            if end >= 0:
+                end += leneol
+                break
+            if size is not None and len(buf) >= size:
+                end = size
+                break
+            # eol may be split across two blocks, so the next search has to
+            # start a bit before the end of what was already scanned
+            start = max(0, len(buf) - leneol + 1)
+            if not self._fillReadBuffer(self._timeout):
+                end = len(buf)  # timeout, return what was received so far
+                break
+        if size is not None and end > size:
+            end = size
+        line = bytes(buf[:end])
+        del buf[:end]
+        return line
+
     def write(self, data):
         """Output the given string over the serial port."""
         if not self._isOpen: raise portNotOpenError
         d = to_bytes(data)
+        if self._tx_thread is not None:
+            self._queueWrite(d)
+            return len(data)
+        # slicing a memoryview does not copy the rest on partial writes
+        d = memoryview(d)
         tx_len = len(d)
         if self._writeTimeout is not None and self._writeTimeout > 0:
             timeout = time.time() + self._writeTimeout
@@ -503,12 +701,12 @@ class PosixSerial(SerialBase):
                     timeleft = timeout - time.time()
                     if timeleft < 0:
                         raise writeTimeoutError
-                    _, ready, _ = select.select([], [self.fd], [], timeleft)
+                    ready = self._waitWritable(timeleft)
                     if not ready:
                         raise writeTimeoutError
                 else:
                     # wait for write operation
-                    _, ready, _ = select.select([], [self.fd], [], None)
+                    ready = self._waitWritable(None)
                     if not ready:
                         raise SerialException('write failed (select)')
                 d = d[n:]
@@ -518,20 +716,204 @@ class PosixSerial(SerialBase):
                     raise SerialException('write failed: %s' % (v,))
         return len(data)
 
+    #  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -
+
+    def setWriteQueueSize(self, size):
+        """Change the write mode. With a size > 0 write() puts the data in a
+        queue holding up to size bytes and returns immediately, a background
+        thread sends the queue whenever the port is writable. write() only
+        blocks (for at most writeTimeout) when the queue is full. A larger
+        write is accepted when the queue is empty. 0 selects blocking writes."""
+        try:
+            size = int(size)
+        except TypeError:
+            raise ValueError("Not a valid write queue size: %r" % (size,))
+        if size < 0:
+            raise ValueError("Not a valid write queue size: %r" % (size,))
+        if self._tx_thread is not None:
+            self._stopWriter()
+        self._tx_queue_size = size
+        if self._isOpen and size:
+            self._startWriter()
+
+    def getWriteQueueSize(self):
+        """Get the current write queue size."""
+        return self._tx_queue_size
+
+    writeQueueSize = property(getWriteQueueSize, setWriteQueueSize, doc="Write queue size setting, 0 for blocking write()")
+
+    def _startWriter(self):
+        """internal - set up the write queue and start the thread sending it"""
+        self._tx_lock = threading.Condition()
+        self._tx_queue = collections.deque()    # memoryviews, oldest first
+        self._tx_queued = 0                     # number of bytes in queue
+        self._tx_flushes = 0                    # incremented by flushOutput
+        self._tx_error = None
+        self._tx_alive = True
+        self._tx_thread = threading.Thread(target=self._writer)
+        self._tx_thread.setDaemon(True)
+        self._tx_thread.start()
+
+    def _stopWriter(self):
+        """internal - send what is queued and stop the writer thread. Unsent
+        data is discarded. The wait is limited to writeTimeout, without one
+        to the time the queue takes on the line plus WRITE_QUEUE_DRAIN_SLACK,
+        so a stalled port (e.g. held by flow control) cannot block close()."""
+        timeout = self._writeTimeout
+        if timeout is None:
+            # 10 bits per byte: start, 8 data and stop bit
+            timeout = self._tx_queued * 10.0 / (self._baudrate or 1) + self.WRITE_QUEUE_DRAIN_SLACK
+        try:
+            self._waitWriteQueue(timeout)
+        except SerialException:
+            pass
+        self._tx_lock.acquire()
+        try:
+            self._tx_alive = False
+            self._tx_queue.clear()
+            self._tx_queued = 0
+            self._tx_lock.notifyAll()
+        finally:
+            self._tx_lock.release()
+        self._tx_thread.join()
+        self._tx_thread = None
+
+    def _writev(self, chunks):
+        """internal - write the list of chunks with one system call, return
+        the number of bytes written"""
+        if hasattr(os, 'writev'):
+            return os.writev(self.fd, chunks)
+        if len(chunks) == 1:
+            return os.write(self.fd, chunks[0])
+        data = bytearray()
+        for chunk in chunks:
+            data += chunk
+        return os.write(self.fd, data)
+
+    def _writer(self):
+        """internal - thread sending the write queue"""
+        lock = self._tx_lock
+        while True:
+            lock.acquire()
+            try:
+                while self._tx_alive and not self._tx_queue:
+                    lock.wait()
+                if not self._tx_alive:
+                    return
+                chunks = list(itertools.islice(self._tx_queue, self.WRITE_QUEUE_IOV_MAX))
+                flushes = self._tx_flushes
+            finally:
+                lock.release()
+            try:
+                # limited wait, so that _stopWriter is noticed
+                if not self._waitWritable(0.1):
+                    continue
+                n = self._writev(chunks)
+            except OSError, e:
+                if e.errno == errno.EAGAIN:
+                    continue
+                error = SerialException('write failed: %s' % (e,))
+            except (SerialException, select.error), e:
+                error = SerialException('write failed: %s' % (e,))
+            else:
+                error = None
+            lock.acquire()
+            try:
+                if error is not None:
+                    self._tx_error = error
+                    self._tx_queue.clear()
+                    self._tx_queued = 0
+                elif flushes == self._tx_flushes:
+                    # remove what was sent, cutting a partly sent chunk
+                    self._tx_queued -= n
+                    while n:
+                        chunk = self._tx_queue[0]
+                        if len(chunk) <= n:
+                            self._tx_queue.popleft()
+                            n -= len(chunk)
+                        else:
+                            self._tx_queue[0] = chunk[n:]
+                            n = 0
+                lock.notifyAll()
+                if error is not None:
+                    return
+            finally:
+                lock.release()
+
+    def _queueWrite(self, d):
+        """internal - append data to the write queue, wait while it is full"""
+        if self._writeTimeout is not None and self._writeTimeout > 0:
+            timeout = time.time() + self._writeTimeout
+        else:
+            timeout = None
+        self._tx_lock.acquire()
+        try:
+            while True:
+                if self._tx_error is not None:
+                    raise self._tx_error
+                if not self._tx_queued or self._tx_queued + len(d) <= self._tx_queue_size:
+                    break
+                if timeout:
+                    timeleft = timeout - time.time()
+                    if timeleft < 0:
+                        raise writeTimeoutError
+                    self._tx_lock.wait(timeleft)
+                else:
+                    self._tx_lock.wait()
+            self._tx_queue.append(memoryview(d))
+            self._tx_queued += len(d)
+            self._tx_lock.notifyAll()
+        finally:
+            self._tx_lock.release()
+
+    def _waitWriteQueue(self, timeout=None):
+        """internal - wait until the write queue is sent"""
+        if timeout is not None:
+            timeout = time.time() + timeout
+        self._tx_lock.acquire()
+        try:
+            while self._tx_queue:
+                if timeout is not None:
+                    timeleft = timeout - time.time()
+                    if timeleft < 0:
+                        raise writeTimeoutError
+                    self._tx_lock.wait(timeleft)
+                else:
+                    self._tx_lock.wait()
+            if self._tx_error is not None:
+                raise self._tx_error
+        finally:
+            self._tx_lock.release()
+
+    #  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -
+
     def flush(self):
         """Flush of file like objects. In this case, wait until all data
            is written."""
+        if not self._isOpen: raise portNotOpenError
+        if self._tx_thread is not None:
+            self._waitWriteQueue()
         self.drainOutput()
 
     def flushInput(self):
         """Clear input buffer, discarding all that is in the buffer."""
         if not self._isOpen: raise portNotOpenError
+        del self._rx_buffer[:]
         termios.tcflush(self.fd, TERMIOS.TCIFLUSH)
 
     def flushOutput(self):
         """Clear output buffer, aborting the current output and
         discarding all that is in the buffer."""
         if not self._isOpen: raise portNotOpenError
+        if self._tx_thread is not None:
+            self._tx_lock.acquire()
+            try:
+                self._tx_queue.clear()
+                self._tx_queued = 0
+                self._tx_flushes += 1
+                self._tx_lock.notifyAll()
+            finally:
+                self._tx_lock.release()
         termios.tcflush(self.fd, TERMIOS.TCOFLUSH)
 
     def sendBreak(self, duration=0.25):
@@ -593,6 +975,8 @@ class PosixSerial(SerialBase):
         """Return the number of characters currently in the output buffer."""
         #~ s = fcntl.ioctl(self.fd, TERMIOS.FIONREAD, TIOCM_zero_str)
         s = fcntl.ioctl(self.fd, TIOCOUTQ, TIOCM_zero_str)
+        if self._tx_thread is not None:
+            return self._tx_queued + struct.unpack('I',s)[0]
         return struct.unpack('I',s)[0]
 
     def drainOutput(self):
@@ -663,6 +1047,10 @@ class PosixPollSerial(Serial):
            until the requested number of bytes is read."""
         if self.fd is None: raise portNotOpenError
         read = bytearray()
+        if self._rx_buffer:
+            # serve data that readline() has buffered first
+            read = self._rx_buffer[:size]
+            del self._rx_buffer[:size]
         poll = select.poll()
         poll.register(self.fd, select.POLLIN|select.POLLERR|select.POLLHUP|select.POLLNVAL)
         if size > 0:
@@ -682,6 +1070,60 @@ class PosixPollSerial(Serial):
         return bytes(read)
 
 
+if hasattr(select, 'epoll'):
+
+    class PosixEpollSerial(Serial):
+        """epoll based implementation, Linux only. The epoll objects are
+        created when the port is opened and the fd stays registered until it
+        is closed, so a read or write does not need to set up anything before
+        waiting. Read and write readiness use separate epoll objects, a level
+        triggered write registration would otherwise wake up every wait for
+        incoming data."""
+
+        def open(self):
+            """Open port with current settings. This may throw a
+               SerialException if the port cannot be opened."""
+            Serial.open(self)
+            self._epoll_in = select.epoll()
+            self._epoll_in.register(self.fd, select.EPOLLIN|select.EPOLLERR|select.EPOLLHUP)
+            self._epoll_out = select.epoll()
+            self._epoll_out.register(self.fd, select.EPOLLOUT|select.EPOLLERR|select.EPOLLHUP)
+
+        def close(self):
+            """Close port"""
+            was_open = self._isOpen
+            # closes the fd, the write queue may still need _epoll_out
+            Serial.close(self)
+            if was_open:
+                self._epoll_in.close()
+                self._epoll_out.close()
+
+        def _wait(self, epoll, timeout):
+            """internal - wait for an event on the given epoll object"""
+            if timeout is None:
+                timeout = -1
+            while True:
+                try:
+                    events = epoll.poll(timeout)
+                except IOError, e:
+                    # retry when interrupted by a signal, like select
+                    # does with EAGAIN in read()
+                    if e.errno != errno.EINTR:
+                        raise SerialException('epoll failed: %s' % (e,))
+                else:
+                    break
+            for fd, event in events:
+                if event & (select.EPOLLERR|select.EPOLLHUP):
+                    raise SerialException('device reports error (epoll)')
+            return events
+
+        def _waitReadable(self, timeout):
+            return self._wait(self._epoll_in, timeout)
+
+        def _waitWritable(self, timeout):
+            return self._wait(self._epoll_out, timeout)
+
+
 if __name__ == '__main__':
     s = Serial(0,
                  baudrate=19200,        # baud rate
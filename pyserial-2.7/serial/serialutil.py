@@ -97,6 +97,70 @@ PARITY_NAMES = {
 }
 
 
+def _clock_gettime_monotonic_ns():
+    """CLOCK_MONOTONIC through ctypes, for Python 2. Returns a function
+    returning the clock in ns, None if not available."""
+    import ctypes
+    import ctypes.util
+    import sys
+    if sys.platform.startswith('linux'):
+        CLOCK_MONOTONIC = 1
+    elif sys.platform == 'darwin':
+        CLOCK_MONOTONIC = 6
+    else:
+        return None
+
+    class timespec(ctypes.Structure):
+        _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+    clock_gettime = None
+    # older glibc versions have clock_gettime in librt
+    for name in ('c', 'rt'):
+        path = ctypes.util.find_library(name)
+        if path is None:
+            continue
+        try:
+            clock_gettime = ctypes.CDLL(path, use_errno=True).clock_gettime
+            break
+        except (OSError, AttributeError):
+            continue
+    if clock_gettime is None:
+        return None
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+    t = timespec()
+    if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(t)) != 0:
+        return None
+
+    def monotonic_ns():
+        if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(t)) != 0:
+            raise OSError(ctypes.get_errno(), 'clock_gettime failed')
+        return t.tv_sec * 1000000000 + t.tv_nsec
+
+    return monotonic_ns
+
+# monotonic() in seconds and monotonic_ns() in ns read a clock that is not
+# stepped with the wall clock (NTP, date). Python 2 has neither, there they
+# use CLOCK_MONOTONIC and, where that is not available, the wall clock.
+import time as _time
+try:
+    monotonic = _time.monotonic
+except AttributeError:
+    monotonic_ns = _clock_gettime_monotonic_ns()
+    if monotonic_ns is None:
+        monotonic = _time.time
+        def monotonic_ns():
+            return int(_time.time() * 1e9)
+    else:
+        def monotonic():
+            return monotonic_ns() * 1e-9
+else:
+    try:
+        monotonic_ns = _time.monotonic_ns
+    except AttributeError:
+        def monotonic_ns():
+            return int(_time.monotonic() * 1e9)
+
+
 class SerialException(IOError):
     """Base class for serial port related exceptions."""
 
@@ -162,6 +226,8 @@ class FileLike(object):
     def readline(self, size=None, eol=LF):
         """read a line which is terminated with end-of-line (eol) character
         ('\n' by default) or until timeout."""
+        if size is not None and size < 0:
+            size = None     # no limit, as for io.IOBase.readline()
         leneol = len(eol)
         line = bytearray()
         while True:
@@ -218,6 +284,90 @@ class FileLike(object):
         return False
 
 
+class RingBuffer(object):
+    """A byte FIFO with a fixed capacity, kept in one preallocated bytearray.
+
+    Data is added either with write() or by filling the memoryviews returned
+    by writableSegments() directly (e.g. with readinto) and calling commit()
+    afterwards. It is taken out with read() or by using the memoryviews from
+    readableSegments() followed by consume(). There are at most two segments
+    as the free space or the data may wrap around the end of the storage.
+
+    The class does no locking, users sharing it between threads have to
+    protect it themselves.
+    """
+
+    def __init__(self, capacity):
+        if capacity <= 0:
+            raise ValueError("Not a valid capacity: %r" % (capacity,))
+        self.capacity = capacity
+        self._buffer = bytearray(capacity)
+        self._view = memoryview(self._buffer)
+        self._start = 0     # index of the oldest byte
+        self._count = 0     # number of bytes stored
+
+    def __len__(self):
+        return self._count
+
+    def free(self):
+        """Return the number of bytes that can be added."""
+        return self.capacity - self._count
+
+    def clear(self):
+        """Discard all data."""
+        self._start = 0
+        self._count = 0
+
+    def _segments(self, start, length):
+        end = start + length
+        if end <= self.capacity:
+            if not length:
+                return []
+            return [self._view[start:end]]
+        return [self._view[start:], self._view[:end - self.capacity]]
+
+    def writableSegments(self):
+        """Return a list of memoryviews covering the free space, in order."""
+        return self._segments((self._start + self._count) % self.capacity, self.free())
+
+    def readableSegments(self):
+        """Return a list of memoryviews covering the stored data, in order."""
+        return self._segments(self._start, self._count)
+
+    def commit(self, n):
+        """Mark n bytes of the free space as filled (see writableSegments)."""
+        if not 0 <= n <= self.free():
+            raise ValueError("Not a valid size: %r" % (n,))
+        self._count += n
+
+    def consume(self, n):
+        """Drop the n oldest bytes (see readableSegments)."""
+        if not 0 <= n <= self._count:
+            raise ValueError("Not a valid size: %r" % (n,))
+        self._start = (self._start + n) % self.capacity
+        self._count -= n
+
+    def write(self, data):
+        """Add as much of data as fits, return the number of bytes added."""
+        if not isinstance(data, memoryview):
+            data = memoryview(to_bytes(data))
+        n = 0
+        for segment in self.writableSegments():
+            chunk = min(len(segment), len(data) - n)
+            segment[:chunk] = data[n:n + chunk]
+            n += chunk
+        self.commit(n)
+        return n
+
+    def read(self, size):
+        """Remove up to size bytes and return them."""
+        data = bytearray()
+        for segment in self.readableSegments():
+            data += segment[:size - len(data)].tobytes()
+        self.consume(len(data))
+        return bytes(data)
+
+
 class SerialBase(object):
     """Serial port base class. Provides __init__ function and properties to
        get/set port settings."""
@@ -14,6 +14,8 @@
 # URL format:    loop://[option[/option...]]
 # options:
 # - "debug" print diagnostic messages
+# - "buffersize=<n>" capacity of the loop back buffer in bytes, writes block
+#   while it is full
 
 from serial.serialutil import *
 import threading
@@ -35,14 +37,18 @@ class LoopbackSerial(SerialBase):
     BAUDRATES = (50, 75, 110, 134, 150, 200, 300, 600, 1200, 1800, 2400, 4800,
                  9600, 19200, 38400, 57600, 115200)
 
+    # default capacity of the loop back buffer, see "buffersize" URL option
+    BUFFER_SIZE = 65536
+
     def open(self):
         """Open port with current settings. This may throw a SerialException
            if the port cannot be opened."""
         if self._isOpen:
             raise SerialException("Port is already open.")
         self.logger = None
-        self.buffer_lock = threading.Lock()
-        self.loop_buffer = bytearray()
+        self.buffer_size = self.BUFFER_SIZE
+        # readers and writers wait on it for data / free space
+        self.buffer_lock = threading.Condition()
         self.cts = False
         self.dsr = False
 
@@ -51,6 +57,7 @@ class LoopbackSerial(SerialBase):
         # not that there is anything to open, but the function applies the
         # options found in the URL
         self.fromURL(self.port)
+        self.loop_buffer = RingBuffer(self.buffer_size)
 
         # not that there anything to configure...
         self._reconfigurePort()
@@ -98,6 +105,10 @@ class LoopbackSerial(SerialBase):
                     self.logger = logging.getLogger('pySerial.loop')
                     self.logger.setLevel(LOGGER_LEVELS[value])
                     self.logger.debug('enabled logging')
+                elif option == 'buffersize':
+                    self.buffer_size = int(value)
+                    if self.buffer_size <= 0:
+                        raise ValueError('buffersize must be > 0: %r' % (value,))
                 else:
                     raise ValueError('unknown option: %r' % (option,))
         except ValueError, e:
@@ -124,19 +135,28 @@ class LoopbackSerial(SerialBase):
         else:
             timeout = None
         data = bytearray()
-        while size > 0:
-            self.buffer_lock.acquire()
-            try:
-                block = to_bytes(self.loop_buffer[:size])
-                del self.loop_buffer[:size]
-            finally:
-                self.buffer_lock.release()
-            data += block
-            size -= len(block)
-            # check for timeout now, after data has been read.
-            # useful for timeout = 0 (non blocking) read
-            if timeout and time.time() > timeout:
-                break
+        self.buffer_lock.acquire()
+        try:
+            while size > 0:
+                block = self.loop_buffer.read(size)
+                if block:
+                    data += block
+                    size -= len(block)
+                    # wake up writers waiting for free space
+                    self.buffer_lock.notifyAll()
+                    if not size:
+                        break
+                # check for timeout now, after data has been read.
+                # useful for timeout = 0 (non blocking) read
+                if timeout is None:
+                    self.buffer_lock.wait()
+                else:
+                    timeleft = timeout - time.time()
+                    if timeleft <= 0:
+                        break
+                    self.buffer_lock.wait(timeleft)
+        finally:
+            self.buffer_lock.release()
         return bytes(data)
 
     def write(self, data):
@@ -153,9 +173,29 @@ class LoopbackSerial(SerialBase):
         if self._writeTimeout is not None and time_used_to_send > self._writeTimeout:
             time.sleep(self._writeTimeout) # must wait so that unit test succeeds
             raise writeTimeoutError
+        if self._writeTimeout is not None:
+            timeout = time.time() + self._writeTimeout
+        else:
+            timeout = None
+        view = memoryview(data)
         self.buffer_lock.acquire()
         try:
-            self.loop_buffer += data
+            while True:
+                n = self.loop_buffer.write(view)
+                if n:
+                    view = view[n:]
+                    # wake up readers waiting for data
+                    self.buffer_lock.notifyAll()
+                if not len(view):
+                    break
+                # buffer full, wait until a reader makes room
+                if timeout is None:
+                    self.buffer_lock.wait()
+                else:
+                    timeleft = timeout - time.time()
+                    if timeleft <= 0:
+                        raise writeTimeoutError
+                    self.buffer_lock.wait(timeleft)
         finally:
             self.buffer_lock.release()
         return len(data)
@@ -167,7 +207,8 @@ class LoopbackSerial(SerialBase):
             self.logger.info('flushInput()')
         self.buffer_lock.acquire()
         try:
-            del self.loop_buffer[:]
+            self.loop_buffer.clear()
+            self.buffer_lock.notifyAll()
         finally:
             self.buffer_lock.release()
 
@@ -0,0 +1,304 @@
+#! python
+#
+# Python Serial Port Extension for Win32, Linux, BSD, Jython
+# see __init__.py
+#
+# This module implements a port that plays back a journal recorded with
+# serial.journal.JournalSerial. Reads return the data the device sent, at the
+# times it arrived or faster, writes are accepted and dropped.
+#
+# this is distributed under a free software license, see license.txt
+#
+# URL format:    replay://[option/...]file=<path>
+# options:
+# - "logging=<level>" print diagnostic messages
+# - "speed=<factor>" play back <factor> times faster than recorded (default
+#   1, real time). 0 delivers all data as fast as it is read.
+# - "file=<path>" the journal, must be the last option: the rest of the URL is
+#   the path, slashes included
+#
+# When the journal is exhausted, a read that got no data raises a
+# SerialException, like a device that was disconnected.
+#
+# journalTime() returns the recorded time of the data last read, so a program
+# under test can run on the recorded timeline whatever the playback speed.
+
+from serial.serialutil import *
+from serial.journal import JournalReader, READ
+import collections
+import threading
+import logging
+
+# map log level names to constants. used in fromURL()
+LOGGER_LEVELS = {
+    'debug': logging.DEBUG,
+    'info': logging.INFO,
+    'warning': logging.WARNING,
+    'error': logging.ERROR,
+    }
+
+
+class ReplaySerial(SerialBase):
+    """Serial port implementation that plays back a journal."""
+
+    BAUDRATES = (50, 75, 110, 134, 150, 200, 300, 600, 1200, 1800, 2400, 4800,
+                 9600, 19200, 38400, 57600, 115200, 230400, 460800, 921600)
+
+    # number of records inWaiting() looks ahead at most
+    LOOKAHEAD = 64
+
+    def open(self):
+        """Open port with current settings. This may throw a SerialException
+           if the port cannot be opened."""
+        if self._isOpen:
+            raise SerialException("Port is already open.")
+        self.logger = None
+        if self._port is None:
+            raise SerialException("Port must be configured before it can be used.")
+        filename, self.speed = self.fromURL(self.port)
+        try:
+            self.journal = JournalReader(filename)
+        except (IOError, OSError), e:
+            raise SerialException('could not open journal %r: %s' % (filename, e))
+        self.bytes_written = 0
+        # records due or about to be due: [due time, data, recorded time]
+        self._chunks = collections.deque()
+        self._journal_time = None
+        self._exhausted = False
+        self._first_timestamp = None
+        self._closed = threading.Event()
+        self._lock = threading.Lock()
+        self._start = monotonic()
+        self._isOpen = True
+
+    def _reconfigurePort(self):
+        """Set communication parameters on opened port. Nothing to do for a
+        journal."""
+        if self.logger:
+            self.logger.info('_reconfigurePort()')
+
+    def close(self):
+        """Close port"""
+        if self._isOpen:
+            self._isOpen = False
+            self._closed.set()
+            self.journal.close()
+
+    def makeDeviceName(self, port):
+        raise SerialException("there is no sensible way to turn numbers into URLs")
+
+    def fromURL(self, url):
+        """extract the journal file name and the speed from an URL string"""
+        if url.lower().startswith("replay://"): url = url[9:]
+        filename = None
+        speed = 1.0
+        try:
+            while url:
+                option, separator, url = url.partition('/')
+                if '=' in option:
+                    option, value = option.split('=', 1)
+                else:
+                    value = None
+                if not option:
+                    pass
+                elif option == 'file':
+                    # the rest of the URL is the path
+                    filename = value + separator + url
+                    break
+                elif option == 'logging':
+                    logging.basicConfig()   # XXX is that good to call it here?
+                    self.logger = logging.getLogger('pySerial.replay')
+                    self.logger.setLevel(LOGGER_LEVELS[value])
+                    self.logger.debug('enabled logging')
+                elif option == 'speed':
+                    speed = float(value)
+                    if speed < 0:
+                        raise ValueError('speed must be >= 0: %r' % (value,))
+                else:
+                    raise ValueError('unknown option: %r' % (option,))
+            if not filename:
+                raise ValueError('no journal file given')
+        except (ValueError, TypeError, KeyError), e:
+            raise SerialException('expected a string in the form "[replay://][option/...]file=<path>": %s' % e)
+        return filename, speed
+
+    #  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -
+
+    def _load(self):
+        """internal - queue the next record read from the device, return
+        False at the end of the journal"""
+        if self._exhausted:
+            return False
+        for timestamp, direction, data in self.journal:
+            if direction != READ:
+                continue
+            if self._first_timestamp is None:
+                self._first_timestamp = timestamp
+            if self.speed:
+                due = self._start + (timestamp - self._first_timestamp) / self.speed
+            else:
+                due = 0.0
+            self._chunks.append([due, data, timestamp])
+            return True
+        self._exhausted = True
+        if self.logger:
+            self.logger.info('end of journal')
+        return False
+
+    def inWaiting(self):
+        """Return the number of characters currently in the input buffer."""
+        if not self._isOpen: raise portNotOpenError
+        self._lock.acquire()
+        try:
+            now = monotonic()
+            n = 0
+            for i in range(self.LOOKAHEAD):
+                if i == len(self._chunks) and not self._load():
+                    break
+                due, data, timestamp = self._chunks[i]
+                if due > now:
+                    break
+                n += len(data)
+            return n
+        finally:
+            self._lock.release()
+
+    def read(self, size=1):
+        """Read size bytes from the serial port. If a timeout is set it may
+        return less characters as requested. With no timeout it will block
+        until the requested number of bytes is read."""
+        if not self._isOpen: raise portNotOpenError
+        if self._timeout is not None:
+            timeout = monotonic() + self._timeout
+        else:
+            timeout = None
+        data = bytearray()
+        self._lock.acquire()
+        try:
+            while size > 0 and self._isOpen:
+                if not self._chunks and not self._load():
+                    if not data:
+                        raise SerialException('end of journal')
+                    break
+                chunk = self._chunks[0]
+                due = chunk[0]
+                now = monotonic()
+                if due > now:
+                    if timeout is not None and timeout <= now:
+                        break
+                    # wait without the lock, close() may interrupt
+                    self._lock.release()
+                    try:
+                        self._closed.wait(min(due, timeout or due) - now)
+                    finally:
+                        self._lock.acquire()
+                    continue
+                block = chunk[1][:size]
+                data += block
+                self._journal_time = chunk[2]
+                size -= len(block)
+                if len(block) < len(chunk[1]):
+                    chunk[1] = chunk[1][len(block):]
+                else:
+                    self._chunks.popleft()
+        finally:
+            self._lock.release()
+        return bytes(data)
+
+    def journalTime(self):
+        """Recorded time (seconds on the monotonic clock of the recording)
+        of the data last returned by read(), None before the first read."""
+        return self._journal_time
+
+    def write(self, data):
+        """Output the given string over the serial port. The device of a
+        journal does not listen, the data is counted and dropped."""
+        if not self._isOpen: raise portNotOpenError
+        data = to_bytes(data)
+        self.bytes_written += len(data)
+        return len(data)
+
+    def flushInput(self):
+        """Clear input buffer, discarding what is due."""
+        if not self._isOpen: raise portNotOpenError
+        if self.logger:
+            self.logger.info('flushInput()')
+        self._lock.acquire()
+        try:
+            now = monotonic()
+            while self._chunks and self._chunks[0][0] <= now:
+                self._chunks.popleft()
+        finally:
+            self._lock.release()
+
+    def flushOutput(self):
+        """Clear output buffer, aborting the current output and
+        discarding all that is in the buffer."""
+        if not self._isOpen: raise portNotOpenError
+        if self.logger:
+            self.logger.info('flushOutput()')
+
+    def sendBreak(self, duration=0.25):
+        """Send break condition. Timed, returns to idle state after given
+        duration."""
+        if not self._isOpen: raise portNotOpenError
+
+    def setBreak(self, level=True):
+        """Set break: Controls TXD. When active, to transmitting is
+        possible."""
+        if not self._isOpen: raise portNotOpenError
+
+    def setRTS(self, level=True):
+        """Set terminal status line: Request To Send"""
+        if not self._isOpen: raise portNotOpenError
+
+    def setDTR(self, level=True):
+        """Set terminal status line: Data Terminal Ready"""
+        if not self._isOpen: raise portNotOpenError
+
+    def getCTS(self):
+        """Read terminal status line: Clear To Send"""
+        if not self._isOpen: raise portNotOpenError
+        return True
+
+    def getDSR(self):
+        """Read terminal status line: Data Set Ready"""
+        if not self._isOpen: raise portNotOpenError
+        return True
+
+    def getRI(self):
+        """Read terminal status line: Ring Indicator"""
+        if not self._isOpen: raise portNotOpenError
+        return False
+
+    def getCD(self):
+        """Read terminal status line: Carrier Detect"""
+        if not self._isOpen: raise portNotOpenError
+        return True
+
+    # - - - platform specific - - -
+    # None so far
+
+
+# assemble Serial class with the platform specific implementation and the base
+# for file-like behavior. for Python 2.6 and newer, that provide the new I/O
+# library, derive from io.RawIOBase
+try:
+    import io
+except ImportError:
+    # classic version with our own file-like emulation
+    class Serial(ReplaySerial, FileLike):
+        pass
+else:
+    # io library present
+    class Serial(ReplaySerial, io.RawIOBase):
+        pass
+
+
+# simple client test
+if __name__ == '__main__':
+    import sys
+    s = Serial('replay://speed=0/file=%s' % sys.argv[1])
+    sys.stdout.write('%s\n' % s)
+    sys.stdout.write("read: %r\n" % s.read(s.inWaiting()))
+    s.close()
@@ -0,0 +1,492 @@
+#! python
+#
+# Python Serial Port Extension for Win32, Linux, BSD, Jython
+# see __init__.py
+#
+# This module implements a simulated serial link. Data written to the port is
+# delivered to a device model on the far end of the link and what the model
+# sends comes back, paced by the baud rate and delayed/corrupted according to
+# the URL options. All random decisions use a seeded generator, so runs with
+# the same seed and the same traffic see the same errors.
+#
+# this is distributed under a free software license, see license.txt
+#
+# URL format:    sim://[option[/option...]]
+# options:
+# - "logging=<level>" print diagnostic messages
+# - "latency=<s>" additional delay of each transfer in seconds
+# - "jitter=<s>" random delay in seconds (uniform, 0..jitter) added to the
+#   latency, the byte order is preserved
+# - "drop=<p>" probability that a byte is lost
+# - "flip=<p>" probability that a bit of a byte is inverted
+# - "seed=<n>" seed of the random generators (default 0)
+# - "buffersize=<n>" size of the receive buffer in bytes, data arriving while
+#   it is full is lost like on an overrun
+# - "device=<name>" device model on the far end, a name from DEVICES or a
+#   "module.Class" path. default: "echo", which sends everything back
+# any other option is passed to the device model as keyword argument (string)
+#
+# Device models derive from Device. They get the link in connection_made(),
+# receive data in data_received() and can use link.write(), link.call_later(),
+# link.time() and link.random. All device callbacks run in one thread.
+
+from serial.serialutil import *
+import threading
+import heapq
+import random
+import time
+import logging
+
+# map log level names to constants. used in fromURL()
+LOGGER_LEVELS = {
+    'debug': logging.DEBUG,
+    'info': logging.INFO,
+    'warning': logging.WARNING,
+    'error': logging.ERROR,
+    }
+
+
+class Device(object):
+    """Base class for device models on the far end of a sim:// link."""
+
+    def connection_made(self, link):
+        """Called when the port is opened."""
+        self.link = link
+
+    def data_received(self, data):
+        """Called with data sent by the host once it has crossed the link."""
+
+    def connection_lost(self):
+        """Called when the port is closed."""
+
+
+class EchoDevice(Device):
+    """Device model that sends back everything it receives, like loop://."""
+
+    def data_received(self, data):
+        self.link.write(data)
+
+
+# device models selectable with the "device" option
+DEVICES = {
+    'echo': EchoDevice,
+    }
+
+
+class SimLink(object):
+    """The simulated wire between the port and the device model. It keeps the
+    timeline of pending transfers and runs the device callbacks in its own
+    thread."""
+
+    def __init__(self, port, device, latency, jitter, drop, flip, seed):
+        self.port = port
+        self.device = device
+        self.latency = latency
+        self.jitter = jitter
+        self.drop = drop
+        self.flip = flip
+        # separate generators per direction keep the errors of one direction
+        # independent of the timing of the other one
+        self._rng_to_device = random.Random(seed * 3)
+        self._rng_to_host = random.Random(seed * 3 + 1)
+        # for use by the device model
+        self.random = random.Random(seed * 3 + 2)
+        self._lock = threading.Condition()
+        self._events = []       # heap of (time, sequence, function, args)
+        self._sequence = 0
+        # time at which the line is idle again, per direction
+        self._line_free = {'device': 0.0, 'host': 0.0}
+        # last delivery time per direction, jitter must not reorder data
+        self._last_delivery = {'device': 0.0, 'host': 0.0}
+        self._alive = True
+        self._thread = threading.Thread(target=self._run)
+        self._thread.setDaemon(True)
+        self._thread.start()
+        self.call_later(0, self.device.connection_made, self)
+
+    def time(self):
+        """Current time of the link."""
+        return time.time()
+
+    def close(self):
+        self._lock.acquire()
+        try:
+            self._alive = False
+            self._lock.notifyAll()
+        finally:
+            self._lock.release()
+        if threading.currentThread() is not self._thread:
+            self._thread.join()
+        self.device.connection_lost()
+
+    def call_later(self, delay, function, *args):
+        """Run function(*args) in the link thread after delay seconds."""
+        self._schedule(self.time() + delay, function, args)
+
+    def _schedule(self, when, function, args):
+        self._lock.acquire()
+        try:
+            self._sequence += 1
+            heapq.heappush(self._events, (when, self._sequence, function, args))
+            self._lock.notifyAll()
+        finally:
+            self._lock.release()
+
+    def _run(self):
+        """thread running the scheduled events"""
+        while True:
+            self._lock.acquire()
+            try:
+                while self._alive:
+                    if self._events:
+                        timeleft = self._events[0][0] - self.time()
+                        if timeleft <= 0:
+                            break
+                        self._lock.wait(timeleft)
+                    else:
+                        self._lock.wait()
+                if not self._alive:
+                    return
+                when, sequence, function, args = heapq.heappop(self._events)
+            finally:
+                self._lock.release()
+            try:
+                function(*args)
+            except Exception:
+                # keep the link running, a broken device model should not
+                # silently stop all traffic
+                logging.getLogger('pySerial.sim').exception('error in device model')
+
+    def _impair(self, data, rng):
+        """apply byte drops and bit flips"""
+        if not self.drop and not self.flip:
+            return data
+        result = bytearray()
+        for byte in bytearray(data):
+            if self.drop and rng.random() < self.drop:
+                continue
+            if self.flip and rng.random() < self.flip:
+                byte ^= 1 << rng.randrange(8)
+            result.append(byte)
+        return bytes(result)
+
+    def _transfer(self, direction, data, rng, function):
+        """schedule delivery of data in the given direction"""
+        now = self.time()
+        self._lock.acquire()
+        try:
+            # the bytes of one write leave the line back to back, the data
+            # is delivered when the last one is through
+            start = max(now, self._line_free[direction])
+            done = start + len(data) * self.port._charTime()
+            self._line_free[direction] = done
+            delay = self.latency
+            if self.jitter:
+                delay += rng.uniform(0, self.jitter)
+            when = max(done + delay, self._last_delivery[direction])
+            self._last_delivery[direction] = when
+            data = self._impair(data, rng)
+        finally:
+            self._lock.release()
+        if data:
+            self._schedule(when, function, (data,))
+
+    def toDevice(self, data):
+        """called by the port for data written by the host"""
+        self._transfer('device', data, self._rng_to_device, self.device.data_received)
+
+    def write(self, data):
+        """Send data from the device model to the host."""
+        self._transfer('host', to_bytes(data), self._rng_to_host, self.port._received)
+
+
+class SimSerial(SerialBase):
+    """Serial port implementation that simulates a link to a device model."""
+
+    BAUDRATES = (50, 75, 110, 134, 150, 200, 300, 600, 1200, 1800, 2400, 4800,
+                 9600, 19200, 38400, 57600, 115200, 230400, 460800, 921600)
+
+    # default size of the receive buffer, see "buffersize" URL option
+    BUFFER_SIZE = 65536
+
+    # device model instance to use instead of the "device" URL option, can be
+    # set before the port is opened
+    device = None
+
+    def open(self):
+        """Open port with current settings. This may throw a SerialException
+           if the port cannot be opened."""
+        if self._isOpen:
+            raise SerialException("Port is already open.")
+        self.logger = None
+        self.cts = False
+        self.dsr = False
+
+        if self._port is None:
+            raise SerialException("Port must be configured before it can be used.")
+        options = self.fromURL(self.port)
+        self.buffer_lock = threading.Condition()
+        self.rx_buffer = RingBuffer(options['buffersize'])
+        device = self.device
+        if device is None:
+            device = self._createDevice(options['device'], options['device_options'])
+        self._reconfigurePort()
+        self.link = SimLink(self, device, options['latency'], options['jitter'],
+                options['drop'], options['flip'], options['seed'])
+        # all things set up get, now a clean start
+        self._isOpen = True
+        if not self._rtscts:
+            self.setRTS(True)
+            self.setDTR(True)
+        self.flushInput()
+        self.flushOutput()
+
+    def _reconfigurePort(self):
+        """Set communication parameters on opened port. The settings are used
+        to calculate the transfer time of the data."""
+        if not isinstance(self._baudrate, (int, long)) or not 0 < self._baudrate < 2**32:
+            raise ValueError("invalid baudrate: %r" % (self._baudrate))
+        if self.logger:
+            self.logger.info('_reconfigurePort()')
+
+    def _charTime(self):
+        """internal - time in seconds to transfer one character"""
+        bits = 1 + self._bytesize + self._stopbits
+        if self._parity != PARITY_NONE:
+            bits += 1
+        return float(bits) / self._baudrate
+
+    def close(self):
+        """Close port"""
+        if self._isOpen:
+            self._isOpen = False
+            self.link.close()
+            self.buffer_lock.acquire()
+            try:
+                self.buffer_lock.notifyAll()
+            finally:
+                self.buffer_lock.release()
+
+    def makeDeviceName(self, port):
+        raise SerialException("there is no sensible way to turn numbers into URLs")
+
+    def _createDevice(self, name, options):
+        """internal - instantiate a device model by name or module path"""
+        if name in DEVICES:
+            factory = DEVICES[name]
+        elif '.' in name:
+            module_name, class_name = name.rsplit('.', 1)
+            try:
+                module = __import__(module_name, fromlist=[class_name])
+                factory = getattr(module, class_name)
+            except (ImportError, AttributeError), e:
+                raise SerialException('could not load device model %r: %s' % (name, e))
+        else:
+            raise SerialException('unknown device model: %r' % (name,))
+        try:
+            return factory(**options)
+        except (TypeError, ValueError), e:
+            raise SerialException('invalid options for device model %r: %s' % (name, e))
+
+    def fromURL(self, url):
+        """extract the link and device options from an URL string"""
+        if url.lower().startswith("sim://"): url = url[6:]
+        options = {
+            'latency': 0.0,
+            'jitter': 0.0,
+            'drop': 0.0,
+            'flip': 0.0,
+            'seed': 0,
+            'buffersize': self.BUFFER_SIZE,
+            'device': 'echo',
+            'device_options': {},
+            }
+        try:
+            for option in url.split('/'):
+                if '=' in option:
+                    option, value = option.split('=', 1)
+                else:
+                    value = None
+                if not option:
+                    pass
+                elif option == 'logging':
+                    logging.basicConfig()   # XXX is that good to call it here?
+                    self.logger = logging.getLogger('pySerial.sim')
+                    self.logger.setLevel(LOGGER_LEVELS[value])
+                    self.logger.debug('enabled logging')
+                elif option in ('latency', 'jitter'):
+                    options[option] = float(value)
+                    if options[option] < 0:
+                        raise ValueError('%s must be >= 0: %r' % (option, value))
+                elif option in ('drop', 'flip'):
+                    options[option] = float(value)
+                    if not 0 <= options[option] <= 1:
+                        raise ValueError('%s must be a probability: %r' % (option, value))
+                elif option == 'seed':
+                    options['seed'] = int(value)
+                elif option == 'buffersize':
+                    options['buffersize'] = int(value)
+                    if options['buffersize'] <= 0:
+                        raise ValueError('buffersize must be > 0: %r' % (value,))
+                elif option == 'device':
+                    options['device'] = value
+                elif value is not None:
+                    options['device_options'][option] = value
+                else:
+                    raise ValueError('unknown option: %r' % (option,))
+        except (ValueError, TypeError, KeyError), e:
+            raise SerialException('expected a string in the form "[sim://][option[/option...]]": %s' % e)
+        return options
+
+    #  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -
+
+    def _received(self, data):
+        """internal - called by the link when data for the host arrives"""
+        self.buffer_lock.acquire()
+        try:
+            n = self.rx_buffer.write(data)
+            if n < len(data) and self.logger:
+                self.logger.warning('receive buffer overrun, %d bytes lost' % (len(data) - n,))
+            self.buffer_lock.notifyAll()
+        finally:
+            self.buffer_lock.release()
+
+    def inWaiting(self):
+        """Return the number of characters currently in the input buffer."""
+        if not self._isOpen: raise portNotOpenError
+        return len(self.rx_buffer)
+
+    def read(self, size=1):
+        """Read size bytes from the serial port. If a timeout is set it may
+        return less characters as requested. With no timeout it will block
+        until the requested number of bytes is read."""
+        if not self._isOpen: raise portNotOpenError
+        if self._timeout is not None:
+            timeout = time.time() + self._timeout
+        else:
+            timeout = None
+        data = bytearray()
+        self.buffer_lock.acquire()
+        try:
+            while size > 0 and self._isOpen:
+                block = self.rx_buffer.read(size)
+                if block:
+                    data += block
+                    size -= len(block)
+                    if not size:
+                        break
+                if timeout is None:
+                    self.buffer_lock.wait()
+                else:
+                    timeleft = timeout - time.time()
+                    if timeleft <= 0:
+                        break
+                    self.buffer_lock.wait(timeleft)
+        finally:
+            self.buffer_lock.release()
+        return bytes(data)
+
+    def write(self, data):
+        """Output the given string over the serial port. The data is handed
+        to the link and the call returns immediately."""
+        if not self._isOpen: raise portNotOpenError
+        data = to_bytes(data)
+        if data:
+            self.link.toDevice(data)
+        return len(data)
+
+    def flushInput(self):
+        """Clear input buffer, discarding all that is in the buffer."""
+        if not self._isOpen: raise portNotOpenError
+        if self.logger:
+            self.logger.info('flushInput()')
+        self.buffer_lock.acquire()
+        try:
+            self.rx_buffer.clear()
+        finally:
+            self.buffer_lock.release()
+
+    def flushOutput(self):
+        """Clear output buffer, aborting the current output and
+        discarding all that is in the buffer."""
+        if not self._isOpen: raise portNotOpenError
+        if self.logger:
+            self.logger.info('flushOutput()')
+
+    def sendBreak(self, duration=0.25):
+        """Send break condition. Timed, returns to idle state after given
+        duration."""
+        if not self._isOpen: raise portNotOpenError
+
+    def setBreak(self, level=True):
+        """Set break: Controls TXD. When active, to transmitting is
+        possible."""
+        if not self._isOpen: raise portNotOpenError
+        if self.logger:
+            self.logger.info('setBreak(%r)' % (level,))
+
+    def setRTS(self, level=True):
+        """Set terminal status line: Request To Send"""
+        if not self._isOpen: raise portNotOpenError
+        if self.logger:
+            self.logger.info('setRTS(%r) -> state of CTS' % (level,))
+        self.cts = level
+
+    def setDTR(self, level=True):
+        """Set terminal status line: Data Terminal Ready"""
+        if not self._isOpen: raise portNotOpenError
+        if self.logger:
+            self.logger.info('setDTR(%r) -> state of DSR' % (level,))
+        self.dsr = level
+
+    def getCTS(self):
+        """Read terminal status line: Clear To Send"""
+        if not self._isOpen: raise portNotOpenError
+        return self.cts
+
+    def getDSR(self):
+        """Read terminal status line: Data Set Ready"""
+        if not self._isOpen: raise portNotOpenError
+        return self.dsr
+
+    def getRI(self):
+        """Read terminal status line: Ring Indicator"""
+        if not self._isOpen: raise portNotOpenError
+        return False
+
+    def getCD(self):
+        """Read terminal status line: Carrier Detect"""
+        if not self._isOpen: raise portNotOpenError
+        return True
+
+    # - - - platform specific - - -
+    # None so far
+
+
+# assemble Serial class with the platform specific implementation and the base
+# for file-like behavior. for Python 2.6 and newer, that provide the new I/O
+# library, derive from io.RawIOBase
+try:
+    import io
+except ImportError:
+    # classic version with our own file-like emulation
+    class Serial(SimSerial, FileLike):
+        pass
+else:
+    # io library present
+    class Serial(SimSerial, io.RawIOBase):
+        pass
+
+
+# simple client test
+if __name__ == '__main__':
+    import sys
+    s = Serial('sim://latency=0.01/jitter=0.005')
+    sys.stdout.write('%s\n' % s)
+
+    sys.stdout.write("write...\n")
+    s.write("hello\n")
+    s.flush()
+    sys.stdout.write("read: %s\n" % s.read(6))
+
+    s.close()
@@ -0,0 +1,124 @@
+#! /usr/bin/env python
+# Python Serial Port Extension for Win32, Linux, BSD, Jython
+# see __init__.py
+#
+# this is distributed under a free software license, see license.txt
+
+"""\
+Some tests for the serial module.
+Part of pyserial (http://pyserial.sf.net)
+
+Tests for the asyncio support in serial.aio. Requires Python 3.4.2+, the
+module is skipped on older versions. No hardware is required, a pseudo
+terminal pair is used as native port.
+"""
+
+import unittest
+import os
+import asyncio
+import serial
+import serial.aio
+
+
+class Collector(asyncio.Protocol):
+    """protocol that stores what it receives"""
+
+    def __init__(self):
+        self.transport = None
+        self.received = bytearray()
+        self.lost = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.received += data
+
+    def connection_lost(self, exc):
+        self.lost = (exc,)
+
+
+class Test_AsyncIO(unittest.TestCase):
+    """Test create_serial_connection"""
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def run_until(self, condition, timeout=2.0):
+        deadline = self.loop.time() + timeout
+        while not condition() and self.loop.time() < deadline:
+            self.loop.run_until_complete(asyncio.sleep(0.01))
+        self.failUnless(condition())
+
+    def test_native(self):
+        """read and write a native port"""
+        master, slave = os.openpty()
+        try:
+            connect = serial.aio.create_serial_connection(self.loop, Collector, os.ttyname(slave), baudrate=115200)
+            transport, protocol = self.loop.run_until_complete(connect)
+            self.run_until(lambda: protocol.transport is transport)
+            os.write(master, b'hello')
+            self.run_until(lambda: protocol.received == b'hello')
+            transport.write(b'world')
+            self.failUnlessEqual(os.read(master, 5), b'world')
+            transport.close()
+            self.run_until(lambda: protocol.lost == (None,))
+            self.failIf(transport.serial.isOpen())
+        finally:
+            os.close(master)
+            os.close(slave)
+
+    def test_loop(self):
+        """loop:// echoes what is written"""
+        connect = serial.aio.create_serial_connection(self.loop, Collector, 'loop://')
+        transport, protocol = self.loop.run_until_complete(connect)
+        transport.write(b'hello')
+        transport.write([0x20, 0x21])
+        self.run_until(lambda: protocol.received == b'hello !')
+        transport.pause_reading()
+        transport.write(b'x')
+        self.loop.run_until_complete(asyncio.sleep(0.05))
+        self.failUnlessEqual(protocol.received, b'hello !')
+        transport.resume_reading()
+        self.run_until(lambda: protocol.received == b'hello !x')
+        transport.close()
+        self.run_until(lambda: protocol.lost == (None,))
+
+    def test_loop_options(self):
+        """loop:// options are rejected, not ignored"""
+        connect = serial.aio.create_serial_connection(self.loop, Collector, 'loop://buffersize=16')
+        self.failUnlessRaises(serial.SerialException, self.loop.run_until_complete, connect)
+        connect = serial.aio.create_serial_connection(self.loop, Collector, 'loop:///')
+        transport, protocol = self.loop.run_until_complete(connect)
+        transport.close()
+
+    def test_socket(self):
+        """socket:// connects to a TCP server"""
+        server = self.loop.run_until_complete(
+                self.loop.create_server(Collector, '127.0.0.1', 0))
+        try:
+            port = server.sockets[0].getsockname()[1]
+            connect = serial.aio.create_serial_connection(self.loop, Collector, 'socket://127.0.0.1:%d' % (port,))
+            transport, protocol = self.loop.run_until_complete(connect)
+            transport.write(b'hello')
+            transport.close()
+            self.run_until(lambda: protocol.lost is not None)
+        finally:
+            server.close()
+            self.loop.run_until_complete(server.wait_closed())
+
+    def test_bad_port(self):
+        """errors are reported through the future"""
+        connect = serial.aio.create_serial_connection(self.loop, Collector, '/dev/nonexistent')
+        self.failUnlessRaises(serial.SerialException, self.loop.run_until_complete, connect)
+
+
+if __name__ == '__main__':
+    import sys
+    sys.stdout.write(__doc__)
+    sys.argv[1:] = ['-v']
+    # When this module is executed from the command-line, it runs all its tests
+    unittest.main()
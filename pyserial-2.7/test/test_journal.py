@@ -0,0 +1,172 @@
+#! /usr/bin/env python
+# Python Serial Port Extension for Win32, Linux, BSD, Jython
+# see __init__.py
+#
+# this is distributed under a free software license, see license.txt
+
+"""\
+Some tests for the serial module.
+Part of pyserial (http://pyserial.sf.net)
+
+Tests for serial.journal and the replay:// URL handler. No hardware is
+required.
+"""
+
+import unittest
+import os
+import tempfile
+import time
+import sys
+import serial
+from serial import journal
+
+if sys.version_info >= (3, 0):
+    def data(string):
+        return bytes(string, 'latin1')
+else:
+    def data(string): return string
+
+
+class Test_Journal(unittest.TestCase):
+    """Record traffic and play it back"""
+
+    def setUp(self):
+        fd, self.filename = tempfile.mkstemp(suffix='.jrnl')
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def record(self, chunks, interval=0.0):
+        """write the chunks to a loop:// port and read them back"""
+        s = journal.JournalSerial(serial.serial_for_url('loop://', timeout=1), self.filename)
+        for chunk in chunks:
+            s.write(data(chunk))
+            self.failUnlessEqual(s.read(len(chunk)), data(chunk))
+            time.sleep(interval)
+        s.close()
+
+    def test_record(self):
+        """reads and writes are journaled in order"""
+        self.record(["hello\n", "world\n"])
+        reader = journal.JournalReader(self.filename)
+        records = [(direction, d) for timestamp, direction, d in reader]
+        reader.close()
+        self.failUnlessEqual(records, [
+                (journal.WRITE, data("hello\n")), (journal.READ, data("hello\n")),
+                (journal.WRITE, data("world\n")), (journal.READ, data("world\n"))])
+
+    def test_readline(self):
+        """readline of the wrapper is journaled too"""
+        s = journal.JournalSerial(serial.serial_for_url('loop://', timeout=1), self.filename)
+        s.write(data("1.5,2.5\n3"))
+        self.failUnlessEqual(s.readline(), data("1.5,2.5\n"))
+        s.close()
+        reader = journal.JournalReader(self.filename)
+        records = [(direction, d) for timestamp, direction, d in reader]
+        reader.close()
+        # one record per line, not per byte
+        self.failUnlessEqual(records, [
+                (journal.WRITE, data("1.5,2.5\n3")), (journal.READ, data("1.5,2.5\n"))])
+        s = serial.serial_for_url('replay://speed=0/file=%s' % self.filename, timeout=1)
+        self.failUnlessEqual(s.readline(), data("1.5,2.5\n"))
+        s.close()
+
+    def test_readinto(self):
+        """readinto and readIntoRing of the wrapper are journaled too"""
+        master, slave = os.openpty()
+        try:
+            s = journal.JournalSerial(serial.Serial(os.ttyname(slave), timeout=0.2), self.filename)
+            os.write(master, data("abcdefgh"))
+            time.sleep(0.05)
+            b = bytearray(3)
+            self.failUnlessEqual(s.readinto(b), 3)
+            ring = serial.RingBuffer(4)
+            ring.write(data("xxx"))
+            ring.read(3)
+            # the free space wraps around the end of the ring
+            self.failUnlessEqual(s.readIntoRing(ring), 4)
+            s.close()
+        finally:
+            os.close(master)
+            os.close(slave)
+        reader = journal.JournalReader(self.filename)
+        records = [(direction, d) for timestamp, direction, d in reader]
+        reader.close()
+        self.failUnlessEqual(records, [(journal.READ, data("abc")), (journal.READ, data("defg"))])
+
+    def test_monotonic(self):
+        """journal timestamps are on the monotonic clock"""
+        self.record(["a"])
+        reader = journal.JournalReader(self.filename)
+        timestamp = list(reader)[0][0]
+        reader.close()
+        self.failUnless(0 <= serial.serialutil.monotonic() - timestamp < 5)
+
+    def test_replay_fast(self):
+        """speed=0 delivers everything at once, then reports the end"""
+        self.record(["abc", "defg"], interval=0.2)
+        s = serial.serial_for_url('replay://speed=0/file=%s' % self.filename)
+        t1 = time.time()
+        self.failUnlessEqual(s.inWaiting(), 7)
+        self.failUnlessEqual(s.read(7), data("abcdefg"))
+        self.failUnless(time.time() - t1 < 0.1)
+        self.failUnlessRaises(serial.SerialException, s.read, 1)
+        s.close()
+
+    def test_replay_speed(self):
+        """data arrives on the recorded timeline, scaled by speed"""
+        self.record(["abc", "defg"], interval=0.4)
+        s = serial.serial_for_url('replay://speed=2/file=%s' % self.filename)
+        t1 = time.time()
+        self.failUnlessEqual(s.read(3), data("abc"))
+        self.failUnlessEqual(s.inWaiting(), 0)
+        self.failUnlessEqual(s.read(4), data("defg"))
+        self.failUnless(0.15 < time.time() - t1 < 0.4)
+        s.close()
+
+    def test_journal_time(self):
+        """journalTime() follows the recorded timeline at any speed"""
+        self.record(["abc", "defg"], interval=0.3)
+        reader = journal.JournalReader(self.filename)
+        times = [timestamp for timestamp, direction, d in reader if direction == journal.READ]
+        reader.close()
+        s = serial.serial_for_url('replay://speed=0/file=%s' % self.filename)
+        self.failUnlessEqual(s.journalTime(), None)
+        s.read(3)
+        self.failUnlessEqual(s.journalTime(), times[0])
+        s.read(4)
+        self.failUnlessEqual(s.journalTime(), times[1])
+        self.failUnless(0.25 < s.journalTime() - times[0] < 0.5)
+        s.close()
+
+    def test_replay_timeout(self):
+        """a read times out before the data is due"""
+        self.record(["a", "b"], interval=1.0)
+        s = serial.serial_for_url('replay://file=%s' % self.filename, timeout=0.1)
+        self.failUnlessEqual(s.read(2), data("a"))
+        s.close()
+
+    def test_writes_dropped(self):
+        """writes to a replayed port are counted and dropped"""
+        self.record(["a"])
+        s = serial.serial_for_url('replay://file=%s' % self.filename)
+        self.failUnlessEqual(s.write(data("xyz")), 3)
+        self.failUnlessEqual(s.bytes_written, 3)
+        s.close()
+
+    def test_bad_urls(self):
+        """invalid URLs and files are reported"""
+        self.failUnlessRaises(serial.SerialException, serial.serial_for_url, 'replay://')
+        self.failUnlessRaises(serial.SerialException, serial.serial_for_url, 'replay://speed=-1/file=%s' % self.filename)
+        self.failUnlessRaises(serial.SerialException, serial.serial_for_url, 'replay://bogus/file=%s' % self.filename)
+        # empty file, no header
+        self.failUnlessRaises(serial.SerialException, serial.serial_for_url, 'replay://file=%s' % self.filename)
+
+
+if __name__ == '__main__':
+    import sys
+    sys.stdout.write(__doc__)
+    sys.argv[1:] = ['-v']
+    # When this module is executed from the command-line, it runs all its tests
+    unittest.main()
@@ -0,0 +1,82 @@
+#! /usr/bin/env python
+# Python Serial Port Extension for Win32, Linux, BSD, Jython
+# see __init__.py
+#
+# this is distributed under a free software license, see license.txt
+
+"""\
+Some tests for the serial module.
+Part of pyserial (http://pyserial.sf.net)
+
+Tests for the buffer of the loop:// URL handler. No hardware is required.
+"""
+
+import unittest
+import threading
+import time
+import sys
+import os
+import serial
+
+if sys.version_info >= (3, 0):
+    def data(string):
+        return bytes(string, 'latin1')
+else:
+    def data(string): return string
+
+
+class Test_LoopBuffer(unittest.TestCase):
+    """Test the loop back buffer"""
+
+    def test_blocking_read(self):
+        """read waits for data written by another thread"""
+        s = serial.serial_for_url('loop://', timeout=None)
+        writer = threading.Timer(0.1, s.write, (data("hello"),))
+        writer.start()
+        self.failUnlessEqual(s.read(5), data("hello"))
+        writer.join()
+        s.close()
+
+    def test_read_timeout(self):
+        """read with timeout sleeps instead of spinning"""
+        s = serial.serial_for_url('loop://', timeout=0.5)
+        t1 = time.time()
+        c1 = sum(os.times()[:2])
+        self.failUnlessEqual(s.read(1), data(""))
+        self.failUnless(time.time() - t1 >= 0.45)
+        self.failUnless(sum(os.times()[:2]) - c1 < 0.25)
+        s.close()
+
+    def test_buffersize(self):
+        """writes wait for free space in a full buffer"""
+        s = serial.serial_for_url('loop://buffersize=16', timeout=1)
+        payload = data("0123456789") * 10
+        reader = threading.Thread(target=lambda: received.append(s.read(len(payload))))
+        received = []
+        reader.start()
+        self.failUnlessEqual(s.write(payload), len(payload))
+        reader.join()
+        self.failUnlessEqual(received, [payload])
+        s.close()
+
+    def test_write_timeout(self):
+        """write times out when the buffer stays full"""
+        s = serial.serial_for_url('loop://buffersize=16', timeout=1, writeTimeout=0.2)
+        s.write(data("x") * 16)
+        self.failUnlessRaises(serial.SerialTimeoutException, s.write, data("y"))
+        s.flushInput()
+        s.write(data("y"))
+        self.failUnlessEqual(s.read(1), data("y"))
+        s.close()
+
+    def test_bad_buffersize(self):
+        """invalid buffersize option"""
+        self.failUnlessRaises(serial.SerialException, serial.serial_for_url, 'loop://buffersize=0')
+
+
+if __name__ == '__main__':
+    import sys
+    sys.stdout.write(__doc__)
+    sys.argv[1:] = ['-v']
+    # When this module is executed from the command-line, it runs all its tests
+    unittest.main()
@@ -0,0 +1,283 @@
+#! /usr/bin/env python
+# Python Serial Port Extension for Win32, Linux, BSD, Jython
+# see __init__.py
+#
+# this is distributed under a free software license, see license.txt
+
+"""\
+Some tests for the serial module.
+Part of pyserial (http://pyserial.sf.net)
+
+Tests for features specific to the POSIX implementation. No hardware is
+required, a pseudo terminal pair is used as the serial port and the test
+writes to / reads from its master side.
+"""
+
+import unittest
+import time
+import sys
+import os
+import serial
+
+if sys.version_info >= (3, 0):
+    def data(string):
+        return bytes(string, 'latin1')
+else:
+    def data(string): return string
+
+
+class Test_PosixReadline(unittest.TestCase):
+    """Test the buffered readline of PosixSerial"""
+
+    serial_class = serial.Serial
+
+    def setUp(self):
+        self.master, slave = os.openpty()
+        self.s = self.serial_class(os.ttyname(slave), timeout=1)
+        os.close(slave)
+
+    def tearDown(self):
+        self.s.close()
+        os.close(self.master)
+
+    def feed(self, text):
+        os.write(self.master, data(text))
+        time.sleep(0.05)    # let it pass the tty layer
+
+    def test_lines_from_one_block(self):
+        """Several lines received at once are split up"""
+        self.feed("1.5,2.5\n3.5,4.5\n5.5,")
+        self.failUnlessEqual(self.s.readline(), data("1.5,2.5\n"))
+        self.failUnlessEqual(self.s.readline(), data("3.5,4.5\n"))
+        # the rest stays in the buffer and is counted as waiting
+        self.failUnlessEqual(self.s.inWaiting(), 4)
+        self.feed("6.5\n")
+        self.failUnlessEqual(self.s.readline(), data("5.5,6.5\n"))
+
+    def test_read_after_readline(self):
+        """read() returns buffered data first"""
+        self.feed("abc\ndef")
+        self.failUnlessEqual(self.s.readline(), data("abc\n"))
+        self.failUnlessEqual(self.s.read(2), data("de"))
+        self.failUnlessEqual(self.s.read(1), data("f"))
+
+    def test_split_eol(self):
+        """eol sequence split across two blocks"""
+        self.feed("abc\r")
+        self.s.timeout = 0.2
+        self.failUnlessEqual(self.s.readline(eol=data("\r\n")), data("abc\r"))
+        self.feed("def\r")
+        self.feed("\nghi")
+        self.failUnlessEqual(self.s.readline(eol=data("\r\n")), data("def\r\n"))
+
+    def test_size(self):
+        """readline stops at size"""
+        self.feed("abcdef\n")
+        self.failUnlessEqual(self.s.readline(size=4), data("abcd"))
+        self.failUnlessEqual(self.s.readline(), data("ef\n"))
+
+    def test_negative_size(self):
+        """a negative size means no limit"""
+        self.feed("abc\ndef\n")
+        self.failUnlessEqual(self.s.readline(-1), data("abc\n"))
+        self.failUnlessEqual(self.s.readline(), data("def\n"))
+
+    def test_timeout(self):
+        """readline returns partial line on timeout"""
+        self.s.timeout = 0.2
+        self.feed("abc")
+        self.failUnlessEqual(self.s.readline(), data("abc"))
+        self.failUnlessEqual(self.s.readline(), data(""))
+
+    def test_flush_input(self):
+        """flushInput discards buffered data"""
+        self.feed("abc\ndef\n")
+        self.s.readline()
+        self.s.flushInput()
+        self.failUnlessEqual(self.s.inWaiting(), 0)
+
+
+class Test_PosixReadinto(unittest.TestCase):
+    """Test readinto and readIntoRing of PosixSerial"""
+
+    def setUp(self):
+        self.master, slave = os.openpty()
+        self.s = serial.Serial(os.ttyname(slave), timeout=0.2)
+        os.close(slave)
+
+    def tearDown(self):
+        self.s.close()
+        os.close(self.master)
+
+    def feed(self, text):
+        os.write(self.master, data(text))
+        time.sleep(0.05)    # let it pass the tty layer
+
+    def test_readinto(self):
+        """readinto fills a bytearray and a memoryview slice"""
+        self.feed("hello world")
+        b = bytearray(5)
+        self.failUnlessEqual(self.s.readinto(b), 5)
+        self.failUnlessEqual(bytes(b), data("hello"))
+        b = bytearray(10)
+        self.failUnlessEqual(self.s.readinto(memoryview(b)[2:8]), 6)
+        self.failUnlessEqual(bytes(b), data("\0\0 world\0\0"))
+
+    def test_readinto_timeout(self):
+        """readinto returns partial data on timeout"""
+        self.feed("abc")
+        b = bytearray(8)
+        self.failUnlessEqual(self.s.readinto(b), 3)
+        self.failUnlessEqual(bytes(b[:3]), data("abc"))
+
+    def test_readinto_after_readline(self):
+        """readinto returns buffered data first"""
+        self.feed("abc\ndef")
+        self.s.readline()
+        b = bytearray(3)
+        self.failUnlessEqual(self.s.readinto(b), 3)
+        self.failUnlessEqual(bytes(b), data("def"))
+
+    def test_readinto_array(self):
+        """readinto with an array"""
+        import array
+        self.feed("ab")
+        a = array.array('b', [0, 0])
+        self.failUnlessEqual(self.s.readinto(a), 2)
+        self.failUnlessEqual(a.tolist(), [97, 98])
+
+    def test_read_into_ring(self):
+        """readIntoRing wraps around the end of the ring"""
+        ring = serial.RingBuffer(8)
+        ring.write(data("xxxxxx"))
+        ring.read(6)
+        self.feed("0123456789")
+        self.failUnlessEqual(self.s.readIntoRing(ring), 8)
+        self.failUnlessEqual(ring.read(8), data("01234567"))
+        self.failUnlessEqual(self.s.readIntoRing(ring), 2)
+        self.failUnlessEqual(ring.read(8), data("89"))
+        # timeout
+        self.failUnlessEqual(self.s.readIntoRing(ring), 0)
+
+
+class Test_PosixWriteQueue(unittest.TestCase):
+    """Test the asynchronous write mode of PosixSerial"""
+
+    serial_class = serial.Serial
+
+    def setUp(self):
+        self.master, slave = os.openpty()
+        self.s = self.serial_class(os.ttyname(slave), timeout=1)
+        self.s.writeQueueSize = 64
+        os.close(slave)
+
+    def tearDown(self):
+        self.s.close()
+        os.close(self.master)
+
+    def receive(self, size):
+        received = bytearray()
+        while len(received) < size:
+            received += os.read(self.master, size - len(received))
+        return bytes(received)
+
+    def test_write(self):
+        """queued packets arrive in order"""
+        packets = [serial.to_bytes([255, i, 125, 125, 125, 0, 125, 125, 125, 0, 0, 251]) for i in range(50)]
+        for packet in packets:
+            self.failUnlessEqual(self.s.write(packet), 12)
+        self.failUnlessEqual(self.receive(12 * 50), data("").join(packets))
+        self.s.flush()
+        self.failUnlessEqual(self.s.outWaiting(), 0)
+
+    def test_large_write(self):
+        """a write larger than the queue is accepted"""
+        payload = data("x") * 1000
+        self.s.write(payload)
+        self.failUnlessEqual(self.receive(1000), payload)
+
+    def test_write_timeout(self):
+        """write times out while the queue is full"""
+        self.s.writeTimeout = 0.2
+        # the pty stops accepting data when nobody reads the other end
+        self.s.write(data("x") * 100000)
+        self.failUnlessRaises(serial.SerialTimeoutException, self.s.write, data("z"))
+        self.s.flushOutput()
+        self.s.write(data("z"))
+
+    def test_close_stalled(self):
+        """close does not wait forever for a queue that is not accepted"""
+        self.s.baudrate = 921600
+        self.s.write(data("x") * 100000)
+        t1 = time.time()
+        self.s.close()
+        # the queue takes ~1.1s at this rate, plus WRITE_QUEUE_DRAIN_SLACK
+        self.failUnless(time.time() - t1 < 3)
+
+    def test_switch_mode(self):
+        """switching back to blocking writes"""
+        self.s.write(data("abc"))
+        self.s.writeQueueSize = 0
+        self.s.write(data("def"))
+        self.failUnlessEqual(self.receive(6), data("abcdef"))
+
+    def test_reopen(self):
+        """the write queue is restarted when the port is reopened"""
+        self.s.close()
+        self.s.open()
+        self.s.write(data("abc"))
+        self.failUnlessEqual(self.receive(3), data("abc"))
+
+
+if hasattr(serial, 'PosixEpollSerial'):
+
+    class Test_EpollReadline(Test_PosixReadline):
+        """Test the buffered readline with the epoll based implementation"""
+
+        serial_class = serial.PosixEpollSerial
+
+    class Test_EpollWriteQueue(Test_PosixWriteQueue):
+        """Test the asynchronous write mode with the epoll based implementation"""
+
+        serial_class = serial.PosixEpollSerial
+
+    class Test_Epoll(unittest.TestCase):
+        """Test read and write of the epoll based implementation"""
+
+        def setUp(self):
+            self.master, slave = os.openpty()
+            self.s = serial.PosixEpollSerial(os.ttyname(slave), timeout=0.2)
+            os.close(slave)
+
+        def tearDown(self):
+            self.s.close()
+            os.close(self.master)
+
+        def test_read(self):
+            """read data and time out"""
+            os.write(self.master, data("hello"))
+            self.failUnlessEqual(self.s.read(5), data("hello"))
+            t1 = time.time()
+            self.failUnlessEqual(self.s.read(1), data(""))
+            t2 = time.time()
+            self.failUnless(0.1 < t2 - t1 < 1.0)
+
+        def test_write(self):
+            """write data"""
+            self.s.write(data("hello"))
+            self.failUnlessEqual(os.read(self.master, 5), data("hello"))
+
+        def test_reopen(self):
+            """epoll objects are renewed on reopen"""
+            self.s.close()
+            self.s.open()
+            self.s.write(data("x"))
+            self.failUnlessEqual(os.read(self.master, 1), data("x"))
+
+
+if __name__ == '__main__':
+    import sys
+    sys.stdout.write(__doc__)
+    sys.argv[1:] = ['-v']
+    # When this module is executed from the command-line, it runs all its tests
+    unittest.main()
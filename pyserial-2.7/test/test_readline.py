@@ -59,6 +59,12 @@ class Test_Readline(unittest.TestCase):
         # this time we will get a timeout
         self.failUnlessEqual(self.s.readline(), serial.to_bytes([]))
 
+    def test_readline_negative_size(self):
+        """a negative size means no limit"""
+        self.s.write(serial.to_bytes([0x61, 0x62, 0x63, 0x0a, 0x64, 0x65, 0x66, 0x0a]))
+        self.failUnlessEqual(self.s.readline(-1), serial.to_bytes([0x61, 0x62, 0x63, 0x0a]))
+        self.failUnlessEqual(self.s.readline(), serial.to_bytes([0x64, 0x65, 0x66, 0x0a]))
+
     def test_readlines(self):
         """Test readlines method"""
         self.s.write(serial.to_bytes([0x31, 0x0a, 0x32, 0x0a, 0x33, 0x0a]))
@@ -0,0 +1,81 @@
+#! /usr/bin/env python
+# Python Serial Port Extension for Win32, Linux, BSD, Jython
+# see __init__.py
+#
+# this is distributed under a free software license, see license.txt
+
+"""\
+Some tests for the serial module.
+Part of pyserial (http://pyserial.sf.net)
+
+Tests for the RingBuffer helper class. No hardware is required.
+"""
+
+import unittest
+import sys
+import serial
+
+if sys.version_info >= (3, 0):
+    def data(string):
+        return bytes(string, 'latin1')
+else:
+    def data(string): return string
+
+
+class Test_RingBuffer(unittest.TestCase):
+    """Test RingBuffer"""
+
+    def test_write_read(self):
+        """data comes out in order"""
+        ring = serial.RingBuffer(8)
+        self.failUnlessEqual(ring.write(data("abc")), 3)
+        self.failUnlessEqual(len(ring), 3)
+        self.failUnlessEqual(ring.free(), 5)
+        self.failUnlessEqual(ring.read(2), data("ab"))
+        self.failUnlessEqual(ring.read(10), data("c"))
+        self.failUnlessEqual(ring.read(10), data(""))
+
+    def test_full(self):
+        """write stops when the ring is full"""
+        ring = serial.RingBuffer(4)
+        self.failUnlessEqual(ring.write(data("abcdef")), 4)
+        self.failUnlessEqual(ring.write(data("x")), 0)
+        self.failUnlessEqual(ring.read(4), data("abcd"))
+
+    def test_wrap(self):
+        """data and free space wrap around the end of the storage"""
+        ring = serial.RingBuffer(4)
+        ring.write(data("abc"))
+        ring.read(2)
+        self.failUnlessEqual(len(ring.writableSegments()), 2)
+        self.failUnlessEqual(ring.write(data("def")), 3)
+        self.failUnlessEqual(len(ring.readableSegments()), 2)
+        self.failUnlessEqual(ring.read(4), data("cdef"))
+
+    def test_commit_consume(self):
+        """segments filled and emptied in place"""
+        ring = serial.RingBuffer(4)
+        segment = ring.writableSegments()[0]
+        segment[:2] = data("ab")
+        ring.commit(2)
+        self.failUnlessEqual(ring.readableSegments()[0].tobytes(), data("ab"))
+        ring.consume(1)
+        self.failUnlessEqual(ring.read(4), data("b"))
+        self.failUnlessRaises(ValueError, ring.commit, 5)
+        self.failUnlessRaises(ValueError, ring.consume, 1)
+
+    def test_clear(self):
+        """clear discards data"""
+        ring = serial.RingBuffer(4)
+        ring.write(data("abc"))
+        ring.clear()
+        self.failUnlessEqual(len(ring), 0)
+        self.failUnlessEqual(ring.free(), 4)
+
+
+if __name__ == '__main__':
+    import sys
+    sys.stdout.write(__doc__)
+    sys.argv[1:] = ['-v']
+    # When this module is executed from the command-line, it runs all its tests
+    unittest.main()
@@ -0,0 +1,118 @@
+#! /usr/bin/env python
+# Python Serial Port Extension for Win32, Linux, BSD, Jython
+# see __init__.py
+#
+# this is distributed under a free software license, see license.txt
+
+"""\
+Some tests for the serial module.
+Part of pyserial (http://pyserial.sf.net)
+
+Tests for the sim:// URL handler. No hardware is required.
+"""
+
+import unittest
+import time
+import sys
+import serial
+from serial.urlhandler import protocol_sim
+
+if sys.version_info >= (3, 0):
+    def data(string):
+        return bytes(string, 'latin1')
+else:
+    def data(string): return string
+
+
+class Responder(protocol_sim.Device):
+    """answers each received chunk with a fixed reply"""
+
+    def __init__(self, reply='ok'):
+        self.reply = data(reply)
+        self.received = []
+
+    def data_received(self, data):
+        self.received.append(data)
+        self.link.write(self.reply)
+
+
+class Test_Sim(unittest.TestCase):
+    """Test the simulated link"""
+
+    def test_echo(self):
+        """the default device sends data back"""
+        s = serial.serial_for_url('sim://', timeout=1)
+        s.write(data("hello"))
+        self.failUnlessEqual(s.read(5), data("hello"))
+        s.close()
+
+    def test_pacing(self):
+        """transfer time follows the baud rate"""
+        s = serial.serial_for_url('sim://', baudrate=115200, timeout=2)
+        payload = data("x") * 1152      # 0.1 s at 115200 8N1
+        t1 = time.time()
+        s.write(payload)
+        self.failUnlessEqual(s.read(len(payload)), payload)
+        # there and back again
+        self.failUnless(0.19 < time.time() - t1 < 0.5)
+        s.close()
+
+    def test_latency(self):
+        """latency delays the data"""
+        s = serial.serial_for_url('sim://latency=0.1/jitter=0.02', timeout=1)
+        t1 = time.time()
+        s.write(data("a"))
+        s.write(data("b"))
+        self.failUnlessEqual(s.read(2), data("ab"))
+        self.failUnless(0.19 < time.time() - t1 < 0.5)
+        s.close()
+
+    def test_drop(self):
+        """all bytes are dropped"""
+        s = serial.serial_for_url('sim://drop=1', timeout=0.2)
+        s.write(data("hello"))
+        self.failUnlessEqual(s.read(5), data(""))
+        s.close()
+
+    def test_seed(self):
+        """errors repeat with the same seed"""
+        results = []
+        for i in range(2):
+            s = serial.serial_for_url('sim://flip=0.3/drop=0.1/seed=42', timeout=0.3)
+            s.write(data("0123456789") * 10)
+            results.append(s.read(100))
+            s.close()
+        self.failUnlessEqual(results[0], results[1])
+        self.failIfEqual(results[0], data("0123456789") * 10)
+
+    def test_device_instance(self):
+        """a device model instance set before opening"""
+        s = serial.serial_for_url('sim://', timeout=1, do_not_open=True)
+        s.device = Responder()
+        s.open()
+        s.write(data("ping"))
+        self.failUnlessEqual(s.read(2), data("ok"))
+        self.failUnlessEqual(s.device.received, [data("ping")])
+        s.close()
+
+    def test_device_option(self):
+        """a device model given by path, with options"""
+        s = serial.serial_for_url('sim://device=test_sim.Responder/reply=pong', timeout=1)
+        s.write(data("ping"))
+        self.failUnlessEqual(s.read(4), data("pong"))
+        s.close()
+
+    def test_bad_options(self):
+        """invalid options are reported"""
+        self.failUnlessRaises(serial.SerialException, serial.serial_for_url, 'sim://drop=2')
+        self.failUnlessRaises(serial.SerialException, serial.serial_for_url, 'sim://device=nothere')
+        self.failUnlessRaises(serial.SerialException, serial.serial_for_url, 'sim://bogus')
+        self.failUnlessRaises(serial.SerialException, serial.serial_for_url, 'sim://color=blue')
+
+
+if __name__ == '__main__':
+    import sys
+    sys.stdout.write(__doc__)
+    sys.argv[1:] = ['-v']
+    # When this module is executed from the command-line, it runs all its tests
+    unittest.main()
@@ -0,0 +1,198 @@
+#!/usr/bin/python
+
+'''
+Offline tuning of the depth and heading PID gains.
+
+The vehicle is simulated as a second order plant per axis (inertia, linear
+damping, thrust per unit of deflection) and controlled by pid.PID with the
+same output limits and control period as AUV.run. Every gain set is scored
+on a step response by rise time (10-90 %), overshoot and ITAE (integral of
+time times absolute error). The gain grid is evaluated on a multiprocessing
+pool, the best points can then be refined with Nelder-Mead.
+
+    $ python auto_tune.py depth --P 0:10:21 --I 0:2:11 --D 0:10:21 --refine 4
+'''
+
+import argparse
+import multiprocessing
+import sys
+from collections import namedtuple
+
+import pid
+
+# Deflection limits around the centre, as in AUV.
+OUTPUT_LIMIT = 125
+
+plant = namedtuple("plant", "inertia damping gain step duration")
+
+# Rough models of the vehicle: depth in metres, heading in degrees.
+PLANTS = {
+    'depth': plant(inertia=35.0, damping=60.0, gain=0.5, step=1.3,
+        duration=30.0),
+    'heading': plant(inertia=4.0, damping=6.0, gain=2.0, step=45.0,
+        duration=20.0),
+    }
+
+result = namedtuple("result", "P I D rise_time overshoot itae")
+
+
+def simulate(model, P, I, D, Tf=0.05, period=0.05):
+    '''
+    Step response of the plant controlled with the given gains. Returns a
+    result, rise time is None if the response never reaches 90 %.
+    '''
+    controller = pid.PID(P, I, D, Tf=Tf, Output_min=-OUTPUT_LIMIT,
+        Output_max=OUTPUT_LIMIT)
+    controller.setPoint(model.step)
+    low, high = 0.1 * model.step, 0.9 * model.step
+    position = velocity = 0.0
+    t = 0.0
+    t_low = t_high = None
+    peak = 0.0
+    itae = 0.0
+    for n in xrange(int(model.duration / period)):
+        t = n * period
+        u = controller.updateTimed(position, t)
+        # Semi-implicit Euler, the plant moves until the next sample.
+        force = model.gain * u - model.damping * velocity
+        velocity += force / model.inertia * period
+        position += velocity * period
+        itae += t * abs(model.step - position) * period
+        peak = max(peak, position)
+        if t_low is None and position >= low:
+            t_low = t
+        if t_high is None and position >= high:
+            t_high = t
+    rise_time = None
+    if t_low is not None and t_high is not None:
+        rise_time = t_high - t_low
+    overshoot = max(0.0, (peak - model.step) / model.step * 100)
+    return result(P, I, D, rise_time, overshoot, itae)
+
+
+def evaluate(args):
+    axis, P, I, D = args
+    return simulate(PLANTS[axis], P, I, D)
+
+
+def cost(r):
+    return r.itae
+
+
+def frange(spec):
+    '''
+    Values of a "start:stop:count" range, stop included, or a single value.
+    '''
+    parts = [float(x) for x in spec.split(':')]
+    if len(parts) == 1:
+        return parts
+    start, stop, count = parts[0], parts[1], int(parts[2])
+    if count < 2:
+        return [start]
+    return [start + (stop - start) * i / (count - 1) for i in xrange(count)]
+
+
+def nelder_mead(f, x0, step=1.0, iterations=200, tolerance=1e-6):
+    '''
+    Minimise f over a vector with the Nelder-Mead simplex method.
+    '''
+    n = len(x0)
+    simplex = [list(x0)]
+    for i in xrange(n):
+        x = list(x0)
+        x[i] += step
+        simplex.append(x)
+    values = [f(x) for x in simplex]
+    for _ in xrange(iterations):
+        order = sorted(range(n + 1), key=lambda i: values[i])
+        simplex = [simplex[i] for i in order]
+        values = [values[i] for i in order]
+        if abs(values[-1] - values[0]) <= tolerance:
+            break
+        centroid = [sum(x[i] for x in simplex[:-1]) / n for i in xrange(n)]
+        worst = simplex[-1]
+        reflected = [c + (c - w) for c, w in zip(centroid, worst)]
+        f_reflected = f(reflected)
+        if f_reflected < values[0]:
+            expanded = [c + 2 * (c - w) for c, w in zip(centroid, worst)]
+            f_expanded = f(expanded)
+            if f_expanded < f_reflected:
+                simplex[-1], values[-1] = expanded, f_expanded
+            else:
+                simplex[-1], values[-1] = reflected, f_reflected
+        elif f_reflected < values[-2]:
+            simplex[-1], values[-1] = reflected, f_reflected
+        else:
+            contracted = [c + 0.5 * (w - c) for c, w in zip(centroid, worst)]
+            f_contracted = f(contracted)
+            if f_contracted < values[-1]:
+                simplex[-1], values[-1] = contracted, f_contracted
+            else:
+                # Shrink towards the best point.
+                best = simplex[0]
+                for i in xrange(1, n + 1):
+                    simplex[i] = [b + 0.5 * (x - b)
+                        for b, x in zip(best, simplex[i])]
+                    values[i] = f(simplex[i])
+    best = min(range(n + 1), key=lambda i: values[i])
+    return simplex[best]
+
+
+def refine(args):
+    '''
+    Nelder-Mead from a grid point. The gains are kept within 0 and the
+    upper bounds of the grid, unbounded gains end in bang-bang control.
+    '''
+    axis, start, bounds = args
+    model = PLANTS[axis]
+    clip = lambda x: [min(abs(v), b) for v, b in zip(x, bounds)]
+    f = lambda x: cost(simulate(model, *clip(x)))
+    x = nelder_mead(f, [start.P, start.I, start.D],
+        step=max(start.P, start.D, 1.0) * 0.2)
+    return simulate(model, *clip(x))
+
+
+def format_result(r):
+    rise_time = '%.2f s' % r.rise_time if r.rise_time is not None else '-'
+    return ('P=%-7.3f I=%-7.3f D=%-7.3f rise=%-8s overshoot=%5.1f %% '
+        'ITAE=%.3f' % (r.P, r.I, r.D, rise_time, r.overshoot, r.itae))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tune PID gains offline.')
+    parser.add_argument('axis', choices=sorted(PLANTS))
+    parser.add_argument('--P', default='0:10:21', help='start:stop:count')
+    parser.add_argument('--I', default='0:2:11', help='start:stop:count')
+    parser.add_argument('--D', default='0:10:21', help='start:stop:count')
+    parser.add_argument('--refine', type=int, default=0, metavar='N',
+        help='refine the N best grid points with Nelder-Mead')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    P, I, D = frange(args.P), frange(args.I), frange(args.D)
+    bounds = (max(P), max(I), max(D))
+    jobs = [(args.axis, p, i, d) for p in P for i in I for d in D]
+    processes = args.processes or multiprocessing.cpu_count()
+    pool = multiprocessing.Pool(processes)
+    try:
+        chunksize = max(1, len(jobs) // (4 * processes))
+        results = pool.map(evaluate, jobs, chunksize)
+        results.sort(key=cost)
+        if args.refine:
+            refined = pool.map(refine,
+                [(args.axis, r, bounds) for r in results[:args.refine]])
+            results = sorted(results + refined, key=cost)
+    finally:
+        pool.close()
+        pool.join()
+
+    print "%d simulations of %s" % (len(jobs), args.axis)
+    for r in results[:args.top]:
+        print format_result(r)
+    best = results[0]
+    print "\n[%s_PID]\nP = %g\nI = %g\nD = %g" % (
+        args.axis.upper(), best.P, best.I, best.D)
+
+if __name__ == '__main__':
+    sys.exit(main())
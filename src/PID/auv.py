@@ -1,11 +1,18 @@
 #!/usr/bin/python
 
 import serial
+import serial.journal
 import time
 import sys
+import threading
 import configs
 import logging
+import log_utils
 import pid
+from command_frame import CommandFrame
+import telemetry
+from realtime import LatestValue, RateScheduler
+from latency import StageTimers, perf_counter_ns
 
 class AUV(object):
 
@@ -25,84 +32,64 @@ class AUV(object):
     def __init__(self):
         self.init_logging()
 
-        self.auv_data = [
-        self.START, # start byte
-        125,        # roll
-        125,        # pitch
-        125,        # yaw
-        125,        # throttle
-        0,          # button
-        125,        # hat
-        125,        # manipulator
-        125,        # manipulator
-        0,          # manipulator
-        0,          # manipulator
-        self.STOP   # stop byte
-    ]
+        self.frame = CommandFrame()
         
         self.connect_to_imu()
         self.init_depth_pid()
         self.init_heading_pid()
+        self.init_control()
         self.connet_to_auv()
 
     def init_logging(self):
-        cfg = configs.parse_config_section("Logging")
-        logging_enabled = cfg['enabled']
-        logging_level = cfg['level']
-        log_to_file = cfg['log_to_file']
-        log_to_console = cfg['log_to_console']
-
-        if logging_level.lower() == "critical":
-            level = logging.CRITICAL
-        elif logging_level.lower() == "info":
-            level = logging.INFO
-        elif logging_level.lower() == "warning":
-            level = logging.WARNING
-        elif logging_level.lower() == "error":
-            level = logging.ERROR
-        else:
-            level = logging.DEBUG
-
-        self.logger = logging.getLogger(__name__)
-        self.logger.setLevel(level)
-        log_formatter = logging.Formatter("[%(levelname)s]: %(message)s")
-
-        if log_to_file == "True":
-            # Truncate existing log.
-            with open('auv.log', 'w'):
-                pass
-            file_handler = logging.FileHandler("auv.log")
-            file_handler.setFormatter(log_formatter)
-            self.logger.addHandler(file_handler)
-        if log_to_console == "True":
-            console_handler = logging.StreamHandler()
-            console_handler.setFormatter(log_formatter)
-            self.logger.addHandler(console_handler)
-
-        if logging_enabled == "False":
-            logging.disable(logging.CRITICAL)
+        self.logger, self.log_listener = log_utils.setup_logger(__name__,
+            "auv.log")
+        # Checked once, the loops skip building debug messages when off.
+        self.debug = self.logger.isEnabledFor(logging.DEBUG)
 
         self.logger.info("\n---------- Logging started %s, %s ----------\n", 
             time.strftime("%d.%m.%y"), time.strftime("%H:%M:%S"))
 
     def init_depth_pid(self):
         cfg = configs.parse_config_section("DEPTH_PID")
-        p = float(cfg['P'])
-        i = float(cfg['I'])
-        d = float(cfg['D'])
-
-        self.depth_pid = pid.PID(p, i, d)
+        p = float(cfg['p'])
+        i = float(cfg['i'])
+        d = float(cfg['d'])
+        tf = float(cfg.get('tf', 0.0))
+
+        # The output is the deflection from CENTER.
+        self.depth_pid = pid.PID(p, i, d, Tf=tf, 
+            Output_min=self.MIN_DEFLECTION - self.CENTER, 
+            Output_max=self.MAX_DEFLECTION - self.CENTER)
         self.depth_pid.setPoint(1.3)
 
     def init_heading_pid(self):
         cfg = configs.parse_config_section("HEADING_PID")
-        p = float(cfg['P'])
-        i = float(cfg['I'])
-        d = float(cfg['D'])
-
-        self.heading_pid = pid.PID(p, i, d)
+        p = float(cfg['p'])
+        i = float(cfg['i'])
+        d = float(cfg['d'])
+        tf = float(cfg.get('tf', 0.0))
+
+        # The output is the deflection from CENTER.
+        self.heading_pid = pid.PID(p, i, d, Tf=tf, 
+            Output_min=self.MIN_DEFLECTION - self.CENTER, 
+            Output_max=self.MAX_DEFLECTION - self.CENTER)
         self.heading_pid.setPoint(0.0)
 
+    def init_control(self):
+        cfg = configs.parse_config_section("Control")
+        # Control loop period and the age (s) at which an IMU sample is
+        # considered lost.
+        self.period = float(cfg['period'])
+        self.imu_timeout = float(cfg['imu_timeout'])
+        self.stats_interval = float(cfg['stats_interval'])
+
+        # Newest samples of the reader threads.
+        self.imu_sample = LatestValue()
+        self.auv_sample = LatestValue()
+
+        # Latency of the stages of the readers and the control loop.
+        self.timers = StageTimers()
+
     def connet_to_auv(self):
 
         # Read configs.
@@ -112,13 +99,21 @@ class AUV(object):
         self.logger.debug("AUV com port = %s", port)
         self.logger.debug("AUV baud rate = %d", baud_rate)
 
+        # "legacy" is the START ... STOP frame, "telemetry" the framed and
+        # checksummed protocol of telemetry.py.
+        self.protocol = cfg.get('auv_protocol', 'legacy')
+        self.logger.debug("AUV protocol = %s", self.protocol)
+        if self.protocol == 'telemetry':
+            self.telemetry_encoder = telemetry.TelemetryEncoder()
+            self.telemetry_decoder = telemetry.TelemetryDecoder()
+
         # Check if comport is connected. If not, wait one second and perform
         # another check. This check goes on continuously until the vehicle is 
         # connected.
         self.logger.info("Looking for port %s", port)
-        self.auv = self.connect_to_serial_port(port, baud_rate)
+        self.auv = self.connect_to_serial_port(port, baud_rate, 'auv')
 
-    def connet_to_imu(self):
+    def connect_to_imu(self):
 
         # Read configs.
         cfg = configs.parse_config_section("Communication")
@@ -131,15 +126,16 @@ class AUV(object):
         # another check. This check goes on continuously until the vehicle is 
         # connected.
         self.logger.info("Looking for port %s", port)
-        self.imu = self.connect_to_serial_port(port, baud_rate)
+        self.imu = self.connect_to_serial_port(port, baud_rate, 'imu')
 
-    def connect_to_serial_port(self, port, baud_rate):
+    def connect_to_serial_port(self, port, baud_rate, name):
         com_port_connected = False
         while not com_port_connected:
             try:
-                # Open Serial Connection to the AUV.
+                # Open Serial Connection to the AUV. port can also be a URL,
+                # e.g. replay://speed=100/file=dive_imu.jrnl.
                 # timeout=None makes Serial.read() a blocking function.
-                ser = serial.Serial(port=port, baudrate=baud_rate, 
+                ser = serial.serial_for_url(port, baudrate=baud_rate, 
                     timeout=None, writeTimeout=None)
                 com_port_connected = True
             except (OSError, serial.serialutil.SerialException):
@@ -149,6 +145,13 @@ class AUV(object):
                     time.sleep(1)
                 except KeyboardInterrupt:
                     sys.exit("\nProgram closed by user.")
+
+        # Record the traffic of the port, to replay it later.
+        journal = configs.parse_config_section("Communication").get('journal')
+        if journal:
+            filename = "%s_%s.jrnl" % (journal, name)
+            self.logger.info("Recording %s to %s", port, filename)
+            ser = serial.journal.JournalSerial(ser, filename)
         return ser
 
     def remap(self, value, left_min, left_max, right_min, right_max):
@@ -164,10 +167,12 @@ class AUV(object):
         return int(value_converted)
 
     def prepare_auv_data(self):
-        self.auv_data[1] = self.CENTER
-        self.auv_data[2] = self.CENTER
-        self.auv_data[3] = self.heading_pid.update(self.heading)
-        self.auv_data[4] = self.depth_pid.update(self.depth)
+        self.frame.set_roll(self.CENTER)
+        self.frame.set_pitch(self.CENTER)
+        self.frame.set_yaw(self.CENTER + self.heading_pid.updateTimed(
+            self.heading, self.imu_time))
+        self.frame.set_throttle(self.CENTER + self.depth_pid.updateTimed(
+            self.depth, self.imu_time))
 
     # Convert byte to int.
     def bytes_to_int(self, str):
@@ -176,34 +181,199 @@ class AUV(object):
     def read_imu_state(self):
         imu_state = self.imu.readline()
         hdg, dpt = imu_state.split(",")
-        self.heading = float(hdg)
-        self.depth = float(dpt)
+        return float(hdg), float(dpt)
 
     def read_auv_state(self):
         # Wait for AUV to send stop byte.
         indata = self.bytes_to_int(self.auv.read())
         while(indata != self.STOP):
-            self.logger.debug("Input from AUV: %d", indata)
+            if self.debug:
+                self.logger.debug("Input from AUV: %d", indata)
             indata = self.bytes_to_int(self.auv.read())
 
+    def imu_reader(self):
+        while self.running:
+            t_request = perf_counter_ns()
+            self.imu.write('\n')
+            try:
+                state = self.read_imu_state()
+                self.timers.record('imu', perf_counter_ns() - t_request)
+            except ValueError:
+                self.logger.warning("Invalid IMU state")
+                continue
+            except serial.SerialException, e:
+                # Port gone, or the end of a replayed journal.
+                self.logger.warning("IMU port closed: %s", e)
+                self.running = False
+                break
+            self.imu_sample.publish(state)
+
+    def read_auv_telemetry(self):
+        # Wait for data, then take everything that has arrived.
+        data = self.auv.read(1)
+        waiting = self.auv.inWaiting()
+        if waiting:
+            data += self.auv.read(waiting)
+        return self.telemetry_decoder.feed(data)
+
+    def auv_reader(self):
+        while self.running:
+            try:
+                if self.protocol == 'telemetry':
+                    for record in self.read_auv_telemetry():
+                        if isinstance(record, telemetry.vehicle_state):
+                            self.auv_sample.publish(record)
+                else:
+                    t_wait = perf_counter_ns()
+                    self.read_auv_state()
+                    self.timers.record('wait_stop', perf_counter_ns() - t_wait)
+                    self.auv_sample.publish(True)
+            except serial.SerialException, e:
+                self.logger.warning("AUV port closed: %s", e)
+                self.running = False
+                break
+
+    def start_readers(self):
+        self.running = True
+        for target in (self.imu_reader, self.auv_reader):
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+
+    def control(self, now):
+        imu_time, state = self.imu_sample.get()
+        if imu_time is None or now - imu_time > self.imu_timeout:
+            # No recent IMU data: stop the controlled thrusters instead of
+            # acting on old measurements.
+            if not self.imu_lost:
+                self.logger.warning("IMU lost, holding heading and depth "
+                    "thrusters at center")
+                self.imu_lost = True
+            self.frame.set_roll(self.CENTER)
+            self.frame.set_pitch(self.CENTER)
+            self.frame.set_yaw(self.CENTER)
+            self.frame.set_throttle(self.CENTER)
+            return
+        if self.imu_lost:
+            self.logger.warning("IMU back")
+            self.imu_lost = False
+            # Start the PIDs afresh, the time since their last sample is
+            # not a sample period.
+            self.depth_pid.resetTiming()
+            self.heading_pid.resetTiming()
+        self.heading, self.depth = state
+        self.imu_time = imu_time
+        self.prepare_auv_data()
+
+    def log_stats(self, scheduler=None):
+        auv_age = self.auv_sample.age()
+        if scheduler is not None:
+            self.logger.info("Control loop: %d overruns, jitter %s, "
+                "AUV heard %s s ago", scheduler.overruns, scheduler.jitter, 
+                "never" if auv_age is None else "%.1f" % auv_age)
+            scheduler.reset_stats()
+        self.logger.info("Latency: %s", self.timers)
+        self.timers.reset()
+        if self.protocol == 'telemetry':
+            self.logger.info("AUV link: %d bad frames, %d lost messages", 
+                self.telemetry_decoder.errors, self.telemetry_decoder.lost)
+
+    def step(self, now):
+        # One period of the control loop at time now.
+        t_start = perf_counter_ns()
+        self.control(now)
+        t_pid = perf_counter_ns()
+        self.timers.record('pid', t_pid - t_start)
+
+        # Print the message for debugging purposes.
+        if self.debug:
+            self.logger.debug("Transmitting data to AUV: %s", 
+                self.frame.tolist())
+        # Write the data to the AUV.    
+        if self.protocol == 'telemetry':
+            self.auv.write(
+                self.telemetry_encoder.encode_command(self.frame))
+        else:
+            self.auv.write(self.frame.buffer)
+        t_end = perf_counter_ns()
+        self.timers.record('write', t_end - t_pid)
+        self.timers.record('loop', t_end - t_start)
+
+    def replay_imu(self):
+        # Next valid IMU sample of a replayed journal, with the time it was
+        # recorded. Raises SerialException at the end of the journal.
+        while True:
+            try:
+                state = self.read_imu_state()
+            except ValueError:
+                self.logger.warning("Invalid IMU state")
+                continue
+            return self.imu.journalTime(), state
+
+    def run_replay(self):
+        # The IMU port plays back a journal (replay://). The loop runs on the
+        # recorded time instead of the wall clock: every period it takes the
+        # samples recorded up to then, as fast as the journal is read, so a
+        # recorded dive is reproduced sample for sample at any speed.
+        self.logger.info("Replaying the IMU journal")
+        self.imu_lost = False
+        self.running = True
+        try:
+            sample_time, state = self.replay_imu()
+            now = sample_time
+            next_stats = now + self.stats_interval
+            while self.running:
+                while sample_time is not None and sample_time <= now:
+                    self.imu_sample.publish(state, sample_time)
+                    try:
+                        sample_time, state = self.replay_imu()
+                    except serial.SerialException:
+                        sample_time = None
+                if sample_time is None:
+                    self.logger.info("End of the IMU journal")
+                    break
+                self.step(now)
+                if now >= next_stats:
+                    self.log_stats()
+                    next_stats = now + self.stats_interval
+                now += self.period
+
+        except (KeyboardInterrupt, serial.SerialException):
+            pass
+        finally:
+            self.running = False
+            self.auv.close()
+            self.imu.close()
+            if self.log_listener is not None:
+                self.log_listener.stop()
+
     def run(self):
+        if hasattr(self.imu, 'journalTime'):
+            return self.run_replay()
+
+        # The sensors are read by their own threads, the control loop runs
+        # at a fixed rate on whatever samples are newest.
+        self.imu_lost = False
+        self.start_readers()
+        scheduler = RateScheduler(self.period)
+        next_stats = pid.monotonic() + self.stats_interval
         try:
-            running = True
-            while running:
-                self.read_auv_state()
-                self.imu.write('\n');
-                self.read_imu_state()
-                self.prepare_auv_data()
-
-                # Print the message for debugging purposes.
-                self.logger.debug("Transmitting data to AUV")
-                self.logger.debug(self.auv_data)
-                # Write the data to the AUV.    
-                self.auv.write(self.auv_data)
+            while self.running:
+                now = scheduler.wait()
+                self.step(now)
+
+                if now >= next_stats:
+                    self.log_stats(scheduler)
+                    next_stats = now + self.stats_interval
 
         except KeyboardInterrupt:
+            pass
+        finally:
+            self.running = False
             self.auv.close()
             self.imu.close()
+            if self.log_listener is not None:
+                self.log_listener.stop()
 
 # ------------------------------ MAIN ----------------------------------- #
 
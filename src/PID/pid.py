@@ -10,7 +10,20 @@
 #while True:
 #     pid = p.update(measurement_value)
 #
+#updateTimed() is a second update mode for loops without a fixed period. It takes the sample time into account,
+#low-pass filters the derivative, takes the derivative of the measurement instead of the error (no kick on setpoint
+#changes) and limits the output with back-calculation anti-windup:
 #
+#p=PID(3.0,0.4,1.2, Tf=0.05, Output_min=-125, Output_max=125)
+#while True:
+#     pid = p.updateTimed(measurement_value)
+#
+#
+
+# The clock of updateTimed(), CLOCK_MONOTONIC also on Python 2. Without it
+# the wall clock is used, updateTimed() then ignores samples that go back in
+# time.
+from serial.serialutil import monotonic
 
 
 class PID:
@@ -18,7 +31,8 @@ class PID:
 	Discrete PID control
 	"""
 
-	def __init__(self, P=2.0, I=0.0, D=1.0, Derivator=0, Integrator=0, Integrator_max=500, Integrator_min=-500):
+	def __init__(self, P=2.0, I=0.0, D=1.0, Derivator=0, Integrator=0, Integrator_max=500, Integrator_min=-500,
+			Tf=0.0, Output_min=None, Output_max=None, Kb=None):
 
 		self.Kp=P
 		self.Ki=I
@@ -31,6 +45,17 @@ class PID:
 		self.set_point=0.0
 		self.error=0.0
 
+		# updateTimed() state. Tf is the time constant of the derivative
+		# filter, Kb the back-calculation gain (default Ki/Kp).
+		self.Tf=Tf
+		self.Output_min=Output_min
+		self.Output_max=Output_max
+		self.Kb=Kb
+		self.Integral=0.0
+		self.D_state=0.0
+		self.last_time=None
+		self.last_value=None
+
 	def update(self,current_value):
 		"""
 		Calculate PID output value for given reference input and feedback
@@ -55,6 +80,66 @@ class PID:
 
 		return PID
 
+	def updateTimed(self,current_value,timestamp=None):
+		"""
+		Calculate PID output value for a feedback sampled at timestamp
+		(seconds, default now). The gains are per second.
+		"""
+
+		if timestamp is None:
+			timestamp = monotonic()
+
+		self.error = self.set_point - current_value
+
+		dt = 0.0
+		if self.last_time is not None and timestamp > self.last_time:
+			dt = timestamp - self.last_time
+			# Derivative of the measurement through a first order low-pass.
+			rate = -(current_value - self.last_value) / dt
+			alpha = self.Tf / (self.Tf + dt)
+			self.D_state = alpha * self.D_state + (1 - alpha) * rate
+		elif self.last_time is not None:
+			# Same or older sample, keep the state.
+			timestamp = self.last_time
+			current_value = self.last_value
+
+		self.P_value = self.Kp * self.error
+		self.I_value = self.Integral
+		self.D_value = self.Kd * self.D_state
+
+		value = self.P_value + self.I_value + self.D_value
+		output = value
+		if self.Output_max is not None and output > self.Output_max:
+			output = self.Output_max
+		elif self.Output_min is not None and output < self.Output_min:
+			output = self.Output_min
+
+		# Back-calculation: while the output is saturated the integral is
+		# driven towards the value that just reaches the limit.
+		Kb = self.Kb
+		if Kb is None:
+			Kb = self.Ki / self.Kp if self.Kp else 0.0
+		self.Integral += (self.Ki * self.error + Kb * (output - value)) * dt
+
+		if self.Integral > self.Integrator_max:
+			self.Integral = self.Integrator_max
+		elif self.Integral < self.Integrator_min:
+			self.Integral = self.Integrator_min
+
+		self.last_time = timestamp
+		self.last_value = current_value
+
+		return output
+
+	def resetTiming(self):
+		"""
+		Forget the last sample of updateTimed(), e.g. after a gap in the
+		measurements. The next update has no derivative and no integration.
+		"""
+		self.last_time=None
+		self.last_value=None
+		self.D_state=0.0
+
 	def setPoint(self,set_point):
 		"""
 		Initilize the setpoint of PID
@@ -62,6 +147,7 @@ class PID:
 		self.set_point = set_point
 		self.Integrator=0
 		self.Derivator=0
+		self.Integral=0.0
 
 	def setIntegrator(self, Integrator):
 		self.Integrator = Integrator
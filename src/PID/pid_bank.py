@@ -0,0 +1,121 @@
+#Vectorised version of pid.PID. A PIDBank holds N controllers in NumPy arrays and updates them all in one call.
+#The arithmetic is done in the same order as in PID.update, so each controller gives exactly the same output as
+#a PID object with the same gains and state.
+#
+#######	Example	#########
+#
+#bank=PIDBank(3, P=[2.0, 2.0, 1.5], I=0.0, D=1.0)
+#bank.setPoint([1.3, 0.0, 0.0])
+#while True:
+#     outputs = bank.update([depth, heading, pitch])
+#
+#
+
+import numpy as np
+
+
+class PIDBank:
+	"""
+	N discrete PID controllers
+	"""
+
+	def __init__(self, n, P=2.0, I=0.0, D=1.0, Derivator=0, Integrator=0, Integrator_max=500, Integrator_min=-500):
+
+		self.n=n
+		self.Kp=self._array(P)
+		self.Ki=self._array(I)
+		self.Kd=self._array(D)
+		self.Derivator=self._array(Derivator)
+		self.Integrator=self._array(Integrator)
+		self.Integrator_max=self._array(Integrator_max)
+		self.Integrator_min=self._array(Integrator_min)
+
+		self.set_point=self._array(0.0)
+		self.error=self._array(0.0)
+
+		# Work arrays, update() allocates nothing.
+		self.P_value=self._array(0.0)
+		self.I_value=self._array(0.0)
+		self.D_value=self._array(0.0)
+		self.output=self._array(0.0)
+		self._above=np.zeros(n, bool)
+		self._below=np.zeros(n, bool)
+
+	@classmethod
+	def fromPIDs(cls, pids):
+		"""
+		Create a bank with the gains, limits and state of PID objects
+		"""
+		bank = cls(len(pids),
+			P=[p.Kp for p in pids], I=[p.Ki for p in pids], D=[p.Kd for p in pids],
+			Derivator=[p.Derivator for p in pids], Integrator=[p.Integrator for p in pids],
+			Integrator_max=[p.Integrator_max for p in pids], Integrator_min=[p.Integrator_min for p in pids])
+		bank.set_point[:] = [p.set_point for p in pids]
+		bank.error[:] = [p.error for p in pids]
+		return bank
+
+	def _array(self, value):
+		a = np.empty(self.n, np.float64)
+		a[:] = value
+		return a
+
+	def update(self,current_values):
+		"""
+		Calculate the PID outputs for the given feedbacks. The returned array
+		is overwritten by the next call.
+		"""
+
+		np.subtract(self.set_point, current_values, out=self.error)
+
+		np.multiply(self.Kp, self.error, out=self.P_value)
+		np.subtract(self.error, self.Derivator, out=self.D_value)
+		np.multiply(self.Kd, self.D_value, out=self.D_value)
+		self.Derivator[:] = self.error
+
+		np.add(self.Integrator, self.error, out=self.Integrator)
+
+		# Same comparisons as PID.update: the upper limit wins if both are
+		# exceeded, NaN is passed through.
+		np.greater(self.Integrator, self.Integrator_max, out=self._above)
+		np.less(self.Integrator, self.Integrator_min, out=self._below)
+		np.copyto(self.Integrator, self.Integrator_min, where=self._below)
+		np.copyto(self.Integrator, self.Integrator_max, where=self._above)
+
+		np.multiply(self.Integrator, self.Ki, out=self.I_value)
+
+		np.add(self.P_value, self.I_value, out=self.output)
+		np.add(self.output, self.D_value, out=self.output)
+
+		return self.output
+
+	def setPoint(self,set_point,index=None):
+		"""
+		Initilize the setpoints of all controllers, or of the ones selected
+		by index
+		"""
+		if index is None:
+			index = slice(None)
+		self.set_point[index] = set_point
+		self.Integrator[index] = 0
+		self.Derivator[index] = 0
+
+	def setKp(self,P,index=None):
+		self.Kp[slice(None) if index is None else index] = P
+
+	def setKi(self,I,index=None):
+		self.Ki[slice(None) if index is None else index] = I
+
+	def setKd(self,D,index=None):
+		self.Kd[slice(None) if index is None else index] = D
+
+	def getPoint(self):
+		return self.set_point
+
+	def getError(self):
+		return self.error
+
+	def getIntegrator(self):
+		return self.Integrator
+
+	def getDerivator(self):
+		return self.Derivator
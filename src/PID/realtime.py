@@ -0,0 +1,97 @@
+#!/usr/bin/python
+
+'''
+Building blocks for fixed-rate control loops.
+
+LatestValue is a single slot that a reader thread overwrites with its newest
+sample. Publishing and reading replace or fetch one tuple, which is atomic in
+CPython, so neither side ever waits for the other.
+
+RateScheduler wakes a loop up at fixed deadlines on the monotonic clock and
+records how late each wakeup was (a latency.LatencyHistogram) and how many
+deadlines were missed.
+'''
+
+import time
+
+from latency import LatencyHistogram
+from pid import monotonic
+
+
+class LatestValue(object):
+    '''
+    Newest sample of a sensor, with the time it was taken.
+    '''
+
+    def __init__(self):
+        self._sample = (None, None)
+
+    def publish(self, value, timestamp=None):
+        if timestamp is None:
+            timestamp = monotonic()
+        self._sample = (timestamp, value)
+
+    def get(self):
+        '''
+        Return (timestamp, value), (None, None) before the first sample.
+        '''
+        return self._sample
+
+    def age(self, now=None):
+        '''
+        Seconds since the newest sample, None if there is none.
+        '''
+        timestamp = self._sample[0]
+        if timestamp is None:
+            return None
+        if now is None:
+            now = monotonic()
+        return now - timestamp
+
+
+class RateScheduler(object):
+    '''
+    Paces a loop at a fixed period:
+
+        scheduler = RateScheduler(0.05)
+        while True:
+            scheduler.wait()
+            ...
+
+    A deadline that has already passed when wait() is called is an
+    overrun. If the loop falls more than a period behind, the missed
+    deadlines are skipped instead of being run back to back.
+    '''
+
+    def __init__(self, period):
+        self.period = period
+        # Lateness of the wakeups, in ns.
+        self.jitter = LatencyHistogram()
+        self.overruns = 0
+        self.deadline = None
+
+    def wait(self):
+        now = monotonic()
+        if self.deadline is None:
+            self.deadline = now
+            return now
+        self.deadline += self.period
+        delay = self.deadline - now
+        if delay > self.period:
+            # The clock went backward (only possible without a monotonic
+            # clock): start over from now instead of sleeping the step.
+            self.deadline = now + self.period
+            delay = self.period
+        if delay > 0:
+            time.sleep(delay)
+            now = monotonic()
+        else:
+            self.overruns += 1
+            if -delay > self.period:
+                self.deadline = now
+        self.jitter.record((now - self.deadline) * 1e9)
+        return now
+
+    def reset_stats(self):
+        self.jitter.reset()
+        self.overruns = 0
@@ -0,0 +1,127 @@
+#!/usr/bin/python
+
+'''
+Pipelined acquisition of sonar scanlines.
+
+The reader thread keeps one mtSendData outstanding: as soon as a mtHeadData
+message has arrived the next one is requested, so the head pings again while
+the scanline is decoded. Messages are handed to the decoder thread through a
+bounded queue. When the decoder falls behind the oldest message is dropped,
+the head is never throttled.
+'''
+
+import threading
+import time
+import Queue
+from collections import namedtuple
+
+from sonar import MT_HEAD_DATA_ID
+
+# Scanlines waiting to be decoded.
+QUEUE_SIZE = 16
+
+scheduler_stats = namedtuple("scheduler_stats",
+    "pings dropped rate latency_mean latency_max")
+
+
+class PingScheduler(object):
+    '''
+    Runs the head in a pipeline. publish(params, sweep) is called in the
+    decoder thread for every scanline. If a recording.Recorder is given the
+    reader thread writes every message to it, with the time it was received,
+    before the queue: scanlines the decoder drops are recorded too. When
+    the port fails the reader ends and the exception is kept in error.
+    '''
+
+    def __init__(self, sonar, publish=None, queue_size=QUEUE_SIZE,
+            recorder=None):
+        self.sonar = sonar
+        self.publish = publish
+        self.recorder = recorder
+        self.queue = Queue.Queue(queue_size)
+        self.running = False
+        # Set when the reader thread ended on an error.
+        self.error = None
+        self.lock = threading.Lock()
+        self.reset_stats()
+
+    def start(self):
+        self.running = True
+        self.reader = threading.Thread(target=self._read)
+        self.decoder = threading.Thread(target=self._decode)
+        for thread in (self.reader, self.decoder):
+            thread.daemon = True
+            thread.start()
+
+    def stop(self, timeout=1.0):
+        '''
+        Stop both threads. The reader finishes when the outstanding
+        mtHeadData has arrived, it is abandoned after timeout seconds.
+        '''
+        self.running = False
+        self.reader.join(timeout)
+        self.queue.put(None)
+        self.decoder.join(timeout)
+
+    def reset_stats(self):
+        with self.lock:
+            self.started = time.time()
+            self.pings = 0
+            self.dropped = 0
+            self.latency_sum = 0.0
+            self.latency_max = 0.0
+
+    def stats(self):
+        '''
+        Pings decoded and dropped, decoded pings per second and the time the
+        scanlines spent in the queue (seconds) since the last reset.
+        '''
+        with self.lock:
+            elapsed = time.time() - self.started
+            rate = self.pings / elapsed if elapsed > 0 else 0.0
+            mean = self.latency_sum / self.pings if self.pings else 0.0
+            return scheduler_stats(self.pings, self.dropped, rate, mean,
+                self.latency_max)
+
+    def _read(self):
+        try:
+            self._read_pings()
+        except Exception as e:
+            # The port failed (SerialException, OSError), the owner of the
+            # scheduler finds out through error and reconnects.
+            self.error = e
+
+    def _read_pings(self):
+        self.sonar.send_data()
+        while self.running:
+            msg = self.sonar.read_message(MT_HEAD_DATA_ID)
+            received = time.time()
+            if self.running:
+                self.sonar.send_data()
+            if self.recorder is not None:
+                self.recorder.write_message(received, msg)
+            try:
+                self.queue.put_nowait((msg, received))
+            except Queue.Full:
+                try:
+                    self.queue.get_nowait()
+                except Queue.Empty:
+                    pass
+                with self.lock:
+                    self.dropped += 1
+                self.queue.put_nowait((msg, received))
+
+    def _decode(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            msg, received = item
+            latency = time.time() - received
+            params = self.sonar.decode_head_data(msg)
+            with self.lock:
+                self.pings += 1
+                self.latency_sum += latency
+                self.latency_max = max(self.latency_max, latency)
+            if self.publish is not None:
+                self.publish(params, self.sonar.sweep)
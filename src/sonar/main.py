@@ -7,18 +7,39 @@ Created on Jan 12, 2015
 '''
 
 from sonar import Sonar
+from acquisition import PingScheduler
+from recording import Recorder
 import time
+import sys
 
 def main():
-    sonar = Sonar()
+    # The port and a file to record to can be given on the command line, e.g.
+    # $ python main.py sim://device=sonar_sim.SonarDevice dive.snr
+    if len(sys.argv) > 1:
+        sonar = Sonar(sys.argv[1])
+    else:
+        sonar = Sonar()
     
+    sonar.send_version()
+    sonar.version_data()
+    sonar.head_command()
+    
+    recorder = None
+    if len(sys.argv) > 2:
+        recorder = Recorder(sys.argv[2])
+    
+    scheduler = PingScheduler(sonar, recorder=recorder)
+    scheduler.start()
     try:
         while True:
-            sonar.send_version()
-            sonar.version_data()
-            time.sleep(0.2)
+            time.sleep(1)
+            print scheduler.stats()
+            scheduler.reset_stats()
     except KeyboardInterrupt:
+        scheduler.stop()
         sonar.close()
+        if recorder is not None:
+            recorder.close()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/python
+
+'''
+Projection of polar sonar data (bearings x bins) to a Cartesian image.
+
+The pixel to (bearing, bin) mapping only depends on the head configuration
+and the image size, so it is computed once per configuration and kept in a
+small LRU cache. The pixels are grouped by bearing, a new scanline only
+rewrites the wedge of the image it covers.
+
+The head is in the centre of the image, bearing 3200 points up.
+'''
+
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Bearings are given in 1/16 gradian.
+BEARING_STEPS = 6400
+
+# Number of index maps kept in the cache.
+CACHE_SIZE = 8
+
+
+class IndexMap(object):
+    '''
+    Pixels of a size x size image that are within range, sorted by bearing.
+    The pixels of bearing row b are pixels[wedges[b]:wedges[b + 1]], the
+    bins they show are bins[wedges[b]:wedges[b + 1]].
+    '''
+
+    def __init__(self, n_bins, step_angle_size, size, scale=1.0):
+        self.n_bins = n_bins
+        self.step_angle_size = step_angle_size
+        self.n_bearings = BEARING_STEPS // step_angle_size
+        self.size = size
+
+        c = (size - 1) / 2.0
+        y, x = np.mgrid[0:size, 0:size]
+        dx = (x - c).ravel()
+        dy = (c - y).ravel()
+        r = (np.hypot(dx, dy) * (scale * n_bins / (size / 2.0))).astype(np.intp)
+        bearing = (np.arctan2(dx, dy) * (BEARING_STEPS / (2 * math.pi)) +
+            BEARING_STEPS / 2) % BEARING_STEPS
+        row = (bearing // step_angle_size).astype(np.intp) % self.n_bearings
+
+        inside = np.flatnonzero(r < n_bins)
+        order = inside[np.argsort(row[inside], kind='mergesort')]
+        self.pixels = order
+        self.rows = row[order]
+        self.bins = r[order]
+        self.index = self.rows * n_bins + self.bins
+        self.wedges = np.searchsorted(self.rows, np.arange(self.n_bearings + 1))
+
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def index_map(n_bins, step_angle_size, size, scale=1.0):
+    '''
+    The IndexMap of a configuration, from the cache if it has been used
+    recently. scale is the range shown by the image divided by the range of
+    the head.
+    '''
+    key = (n_bins, step_angle_size, size, scale)
+    with _cache_lock:
+        m = _cache.pop(key, None)
+        if m is None:
+            m = IndexMap(n_bins, step_angle_size, size, scale)
+            while len(_cache) >= CACHE_SIZE:
+                _cache.popitem(last=False)
+        _cache[key] = m
+        return m
+
+
+class Projection(object):
+    '''
+    Cartesian image of a polar array, updated wedge by wedge.
+    '''
+
+    def __init__(self, n_bins, step_angle_size, size, scale=1.0):
+        self.map = index_map(n_bins, step_angle_size, size, scale)
+        self.image = np.zeros((size, size), np.uint8)
+        self._flat = self.image.reshape(-1)
+
+    def update(self, polar, row):
+        '''
+        Redraw the pixels of one bearing row of the polar array.
+        '''
+        m = self.map
+        start, end = m.wedges[row], m.wedges[row + 1]
+        self._flat[m.pixels[start:end]] = polar[row].take(m.bins[start:end])
+
+    def render(self, polar):
+        '''
+        Redraw the whole image.
+        '''
+        self._flat[self.map.pixels] = polar.reshape(-1).take(self.map.index)
+        return self.image
@@ -0,0 +1,186 @@
+#!/usr/bin/python
+
+'''
+Recording and playback of raw mt-protocol messages.
+
+File layout (little endian):
+
+    header     magic "SONARREC", format version (uint16), 6 reserved bytes
+    records    time (double, seconds), length (uint32), the message as sent
+               by the head from '@' to LF
+    index      one entry per record: time (double), offset of the record
+               (uint64), length (uint32), command id (uint8), 3 pad bytes
+    footer     offset of the index (uint64), number of records (uint64),
+               magic "SONARTOC"
+
+The index and the footer are written by Recorder.close(). A file without
+them, e.g. after a crash, can still be played back: the reader rebuilds the
+index by walking the records.
+
+Recording.seek_time() and the ping lookups search the memory mapped index
+with a binary search, the messages themselves are only read when accessed.
+'''
+
+import mmap
+import struct
+
+import numpy as np
+
+from sonar import (MESSAGE_HEADER, LF, MIN_MESSAGE_LENGTH, MT_HEAD_DATA_ID,
+    message)
+
+MAGIC = 'SONARREC'
+TOC_MAGIC = 'SONARTOC'
+VERSION = 1
+
+FILE_HEADER = struct.Struct('<8sH6x')
+RECORD_HEADER = struct.Struct('<dI')
+INDEX_ENTRY = struct.Struct('<dQIB3x')
+FOOTER = struct.Struct('<QQ8s')
+
+INDEX_DTYPE = np.dtype([('time', '<f8'), ('offset', '<u8'),
+    ('length', '<u4'), ('command', 'u1'), ('pad', 'V3')])
+
+
+class Recorder(object):
+    '''
+    Writes messages to a recording file.
+    '''
+
+    def __init__(self, path):
+        self.file = open(path, 'wb')
+        self.file.write(FILE_HEADER.pack(MAGIC, VERSION))
+        self.offset = FILE_HEADER.size
+        self.index = bytearray()
+        self.count = 0
+
+    def write(self, timestamp, data):
+        '''
+        Append a raw message, from '@' to LF.
+        '''
+        self.file.write(RECORD_HEADER.pack(timestamp, len(data)))
+        self.file.write(data)
+        self.index += INDEX_ENTRY.pack(timestamp, self.offset, len(data),
+            ord(data[10]))
+        self.offset += RECORD_HEADER.size + len(data)
+        self.count += 1
+
+    def write_message(self, timestamp, msg):
+        '''
+        Append a message decoded by MessageDecoder, byte for byte as it was
+        received.
+        '''
+        self.write(timestamp, msg.raw)
+
+    def close(self):
+        self.file.write(self.index)
+        self.file.write(FOOTER.pack(self.offset, self.count, TOC_MAGIC))
+        self.file.close()
+
+
+class Recording(object):
+    '''
+    Random access to a recording file. recording[i] is the i-th message as
+    a (time, message) tuple.
+    '''
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if (len(self.mm) < FILE_HEADER.size or
+                FILE_HEADER.unpack_from(self.mm)[0] != MAGIC):
+            self.mm.close()
+            raise ValueError('%s is not a sonar recording' % path)
+        self.index = self._read_index()
+        self.times = self.index['time']
+        self._pings = self._ping_times = None
+
+    def _read_index(self):
+        if len(self.mm) >= FILE_HEADER.size + FOOTER.size:
+            index_offset, count, magic = FOOTER.unpack_from(self.mm,
+                len(self.mm) - FOOTER.size)
+            index_end = index_offset + count * INDEX_DTYPE.itemsize
+            if magic == TOC_MAGIC and index_end == len(self.mm) - FOOTER.size:
+                return np.frombuffer(self.mm, INDEX_DTYPE, int(count),
+                    int(index_offset))
+        return self._rebuild_index()
+
+    def _rebuild_index(self):
+        '''
+        Walk the records of a file that was not closed properly. A record
+        cut short at the end of the file is ignored.
+        '''
+        index = bytearray()
+        offset = FILE_HEADER.size
+        end = len(self.mm)
+        while offset + RECORD_HEADER.size + MIN_MESSAGE_LENGTH <= end:
+            timestamp, length = RECORD_HEADER.unpack_from(self.mm, offset)
+            start = offset + RECORD_HEADER.size
+            if (length < MIN_MESSAGE_LENGTH or start + length > end or
+                    self.mm[start + length - 1] != LF):
+                break
+            index += INDEX_ENTRY.pack(timestamp, offset, length,
+                ord(self.mm[start + 10]))
+            offset = start + length
+        return np.frombuffer(bytes(index), INDEX_DTYPE)
+
+    def close(self):
+        self.index = self.times = self._pings = self._ping_times = None
+        self.mm.close()
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, i):
+        entry = self.index[i]
+        start = int(entry['offset']) + RECORD_HEADER.size
+        end = start + int(entry['length'])
+        raw = self.mm[start:end]
+        (_, _, _, tx_nde, rx_nde, no_byte, cmd, seq,
+            nde) = MESSAGE_HEADER.unpack_from(raw)
+        return float(entry['time']), message(tx_nde, rx_nde, no_byte, cmd,
+            seq, nde, raw[MESSAGE_HEADER.size:-1], raw)
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self[i]
+
+    def raw(self, i):
+        '''
+        The i-th message as it was sent by the head.
+        '''
+        start = int(self.index[i]['offset']) + RECORD_HEADER.size
+        return self.mm[start:start + int(self.index[i]['length'])]
+
+    def seek_time(self, timestamp):
+        '''
+        Index of the first message at or after timestamp.
+        '''
+        return int(np.searchsorted(self.times, timestamp, 'left'))
+
+    def _index_pings(self):
+        if self._pings is None:
+            self._pings = np.flatnonzero(
+                self.index['command'] == ord(MT_HEAD_DATA_ID))
+            self._ping_times = self.times[self._pings]
+
+    @property
+    def pings(self):
+        '''
+        Message indices of the mtHeadData messages.
+        '''
+        self._index_pings()
+        return self._pings
+
+    def ping(self, n):
+        '''
+        The n-th mtHeadData message as a (time, message) tuple.
+        '''
+        return self[int(self.pings[n])]
+
+    def seek_ping_time(self, timestamp):
+        '''
+        Number of the first ping at or after timestamp.
+        '''
+        self._index_pings()
+        return int(np.searchsorted(self._ping_times, timestamp, 'left'))
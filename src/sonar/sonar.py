@@ -7,9 +7,13 @@ Created on Jan 12, 2015
 '''
 
 import serial
-from collections import namedtuple
+from collections import namedtuple, deque
 import binascii
-import sys
+import struct
+
+import numpy as np
+
+from projection import BEARING_STEPS, Projection
 
 HEADER = '\x40'
 LF = '\x0A'
@@ -21,6 +25,7 @@ NO_BYTE = '\x03'
 SEQ = '\x80'
 NDE = '\x02'
 
+MT_ALIVE_ID = '\x04'
 MT_ALIVE_LENGTH = 22
 
 MT_SEND_VERSION_ID = '\x17'
@@ -32,9 +37,72 @@ MT_BB_USER_DATA_ID = '\x06'
 MT_BB_USER_DATA_LENGTH = 264
 
 MT_SEND_DATA = '\x19'
+SEND_DATA_HEX_LENGTH = '\x30\x30\x30\x43'
+SEND_DATA_BIN_LENGTH = '\x0C\x00'
+SEND_DATA_NO_BYTE = '\x07'
+MT_HEAD_DATA_ID = '\x02'
+
+MT_HEAD_COMMAND_ID = '\x13'
+MT_HEAD_COMMAND_LENGTH = 82
+
+MT_REBOOT_ID = '\x10'
 
 REPLY_COMMAND_ID_IDX = 10
 
+# mtHeadCommand parameters, bytes 14-65 of the message (little endian).
+HEAD_COMMAND_PARAMS = struct.Struct('<BHBIIIIHHHHBBBBHHBBHHHHHBBH')
+head_command_params = namedtuple("head_command_params",
+    "v3b_params hd_ctrl hd_type tx_n1 tx_n2 rx_n1 rx_n2 tx_pulse_len "
+    "range_scale left_lim right_lim ad_span ad_low igain1 igain2 slope1 slope2 "
+    "mo_time step_angle_size ad_interval n_bins max_ad_buf lockout "
+    "minor_axis_dir major_axis_pan ctl2 scan_z")
+
+# mtHeadData parameters, bytes 14-44 of the message (little endian). The
+# scanline (dbytes bytes) follows.
+HEAD_DATA_PARAMS = struct.Struct('<HBBBHHIBHBBHHHHBHH')
+head_data_params = namedtuple("head_data_params",
+    "total_byte_count device_type head_status sweep_code hd_ctrl range_scale "
+    "tx_n gain slope ad_span ad_low heading_offset ad_interval left_lim "
+    "right_lim step_angle_size bearing dbytes")
+
+# Message header: '@', hex length, binary length, tx node, rx node, byte count,
+# command, sequence (0x80 = single packet) and node. The binary length counts
+# the bytes after its own field, so a message is bin_length + 6 bytes long.
+MESSAGE_HEADER = struct.Struct('<c4sHBBBcBB')
+MIN_MESSAGE_LENGTH = 14
+
+# raw is the whole message as received, from '@' to LF.
+message = namedtuple("message",
+    "tx_nde rx_nde no_byte command seq nde payload raw")
+
+# mtVersionData parameters: system type, CPU id, program length, checksum.
+VERSION_DATA_PARAMS = struct.Struct('<BIIH')
+version_data_params = namedtuple("version_data_params",
+    "system_type cpu_id program_length checksum")
+
+# mtAlive parameters: unused byte, head time (ms), motor position, HeadInf.
+ALIVE_PARAMS = struct.Struct('<BIHB')
+alive_params = namedtuple("alive_params",
+    "unused head_time motor_position head_inf")
+
+# HdCtrl bits.
+HD_CTRL_ADC8ON = 0x0001
+HD_CTRL_CONT = 0x0002
+
+# Bearings and limits are given in 1/16 gradian (BEARING_STEPS per turn).
+
+# Step angle sizes (1/16 gradian).
+STEP_HIGH = 4
+STEP_MEDIUM = 8
+STEP_LOW = 16
+STEP_ULTIMATE_LOW = 32
+
+# Speed of sound in water (m/s).
+SOUND_SPEED = 1500.0
+
+# ADInterval is given in units of 640 ns.
+AD_INTERVAL_UNIT = 640e-9
+
 command = namedtuple("command", 
     "header hex_length bin_length tx_nde rx_nde no_byte command seq nde lf")
 
@@ -47,113 +115,247 @@ BAUD_RATE = 115200
 # Com port
 COM_PORT = "COM5"
 
-# Open Serial Connection to the sonar
-# timeout=None makes Serial.read() a blocking function.
-sonar = serial.Serial(port=COM_PORT, baudrate=BAUD_RATE, timeout=None, writeTimeout=None)
+def build_message(cmd, payload='', tx_nde=ord(TX_NDE), rx_nde=ord(RX_NDE),
+        nde=ord(NDE)):
+    '''
+    Frame a payload as a mt-protocol message. The byte count only has one
+    byte, the binary length is the one to rely on for long messages.
+    '''
+    bin_length = len(payload) + 8
+    return (HEADER + '%04X' % bin_length + struct.pack('<H', bin_length) +
+        chr(tx_nde) + chr(rx_nde) + chr((len(payload) + 3) & 0xFF) + cmd +
+        SEQ + chr(nde) + payload + LF)
+
+
+class MessageDecoder(object):
+    '''
+    Streaming decoder of mt-protocol messages. feed() takes the data read
+    from the port in chunks of any size and returns the complete messages
+    found so far. Bytes that do not belong to a valid message (wrong hex
+    length, missing LF) are skipped.
+    '''
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.skipped = 0
+
+    def feed(self, data):
+        buf = self.buffer
+        buf += data
+        messages = []
+        pos = 0
+        while True:
+            start = buf.find(HEADER, pos)
+            if start < 0:
+                self.skipped += len(buf) - pos
+                pos = len(buf)
+                break
+            self.skipped += start - pos
+            if len(buf) - start < MESSAGE_HEADER.size:
+                pos = start
+                break
+            (_, hex_length, bin_length, tx_nde, rx_nde, no_byte, cmd, seq,
+                nde) = MESSAGE_HEADER.unpack_from(buf, start)
+            end = start + bin_length + 6
+            if (hex_length != '%04X' % bin_length or
+                    end - start < MIN_MESSAGE_LENGTH):
+                # A '@' inside the data of another message or line noise.
+                self.skipped += 1
+                pos = start + 1
+                continue
+            if end > len(buf):
+                pos = start
+                break
+            if buf[end - 1] != ord(LF):
+                self.skipped += 1
+                pos = start + 1
+                continue
+            raw = bytes(buf[start:end])
+            messages.append(message(tx_nde, rx_nde, no_byte, cmd, seq, nde,
+                raw[MESSAGE_HEADER.size:-1], raw))
+            pos = end
+        del buf[:pos]
+        return messages
+
+
+class SweepImage(object):
+    '''
+    The last complete sweep of the head. Scanlines are written into a polar
+    array with one row per bearing step and one column per bin, and into the
+    wedge of the Cartesian image they cover. scale is the range shown by the
+    image divided by the range of the head.
+    '''
+
+    def __init__(self, n_bins, step_angle_size=STEP_LOW, size=None, scale=1.0):
+        self.n_bins = n_bins
+        self.step_angle_size = step_angle_size
+        self.n_bearings = BEARING_STEPS // step_angle_size
+        self.size = size or 2 * n_bins
+        self.polar = np.zeros((self.n_bearings, n_bins), np.uint8)
+        self.projection = Projection(n_bins, step_angle_size, self.size, scale)
+
+    def update(self, bearing, data, adc8on=True):
+        '''
+        Store the bins of a scanline. data is the buffer holding the bins,
+        one byte per bin or, without adc8on, two 4 bit bins per byte with
+        the first bin in the low nibble.
+        '''
+        index = (bearing // self.step_angle_size) % self.n_bearings
+        row = self.polar[index]
+        packed = np.frombuffer(data, np.uint8)
+        if adc8on:
+            n = min(len(packed), self.n_bins)
+            row[:n] = packed[:n]
+        else:
+            n = min(len(packed), self.n_bins // 2)
+            np.left_shift(packed[:n], 4, row[0:2 * n:2])
+            np.bitwise_and(packed[:n], 0xF0, row[1:2 * n:2])
+        self.projection.update(self.polar, index)
+
+    def cartesian(self):
+        return self.projection.image
+
 
 class Sonar(object):
     '''
-    classdocs
+    Tritech sonar head connected to a serial port.
     '''
 
-    def __init__(self, params):
+    def __init__(self, port=COM_PORT, baud_rate=BAUD_RATE):
         '''
-        Constructor
+        Constructor. port may also be a pySerial URL, e.g.
+        "sim://device=sonar_sim.SonarDevice" to talk to the emulator.
         '''
+        # Open Serial Connection to the sonar
+        # timeout=None makes Serial.read() a blocking function.
+        self.sonar = serial.serial_for_url(port, baudrate=baud_rate, 
+            timeout=None, writeTimeout=None)
+        self.decoder = MessageDecoder()
+        self.messages = deque()
+        self.params = None
+        self.sweep = None
+
+    def close(self):
+        self.sonar.close()
         
     def send_command(self, cmd):
         # mtSendData is 18 bytes long, all the other commands are 14 bytes long.
         c = None
-        if cmd is not MT_SEND_DATA:
+        if cmd != MT_SEND_DATA:
             c = command(header=HEADER, 
                 hex_length=HEX_LENGHT, bin_length=BIN_LENGTH, tx_nde=TX_NDE, rx_nde=RX_NDE, 
                 no_byte=NO_BYTE, command=cmd, seq=SEQ, nde=NDE, lf=LF)
         else:
             c = send_data(header=HEADER, 
-                    hex_length=HEX_LENGHT, bin_length=BIN_LENGTH, tx_nde=TX_NDE, rx_nde=RX_NDE, 
-                    no_byte=NO_BYTE, command=cmd, seq=SEQ, nde=NDE, current_time=0, lf=LF)
-            
-        for b in c:
-            sonar.write(b)
-        
-    def read_message(self, length, command_id):
-        message = []
-        
-        while len(message) != length and message[REPLY_COMMAND_ID_IDX] != command_id:
-            message = []
+                    hex_length=SEND_DATA_HEX_LENGTH, bin_length=SEND_DATA_BIN_LENGTH, 
+                    tx_nde=TX_NDE, rx_nde=RX_NDE, no_byte=SEND_DATA_NO_BYTE, command=cmd, 
+                    seq=SEQ, nde=NDE, current_time=struct.pack('<I', 0), lf=LF)
             
-            indata = sonar.read()
-            while(indata != HEADER):
-                indata = sonar.read()
+        self.sonar.write(''.join(c))
         
-            message.append(self.bytes_to_hex(indata))
-        
-            indata = sonar.read()
-            while(indata != LF):
-                message.append(self.bytes_to_hex(indata))
-                indata = sonar.read()
-        
-            message.append(self.bytes_to_hex(indata))
-        
-        return message
-    
+    def read_message(self, command_id):
+        '''
+        Block until a message with the given command id arrives and return
+        it. Messages of other types received before it are discarded.
+        '''
+        while True:
+            while not self.messages:
+                # Wait for one byte, then take whatever else has arrived.
+                data = self.sonar.read(1)
+                waiting = self.sonar.inWaiting()
+                if waiting:
+                    data += self.sonar.read(waiting)
+                self.messages.extend(self.decoder.feed(data))
+            msg = self.messages.popleft()
+            if msg.command == command_id:
+                return msg
+
     def alive(self):
-        indata = binascii.hexlify(bytearray(sonar.read(22)))
-        for idx, b in enumerate(indata):
-            sys.stdout.write(b)
-            if (idx-1) % 2 == 0:
-                print ", ",
-        print "\n\n"
+        msg = self.read_message(MT_ALIVE_ID)
+        alive = alive_params._make(ALIVE_PARAMS.unpack_from(msg.payload))
+        print alive
+        return alive
     
     def send_version(self):
         self.send_command(MT_SEND_VERSION_ID)
     
     def version_data(self):
-        indata = sonar.read()
-    
-        while(indata != HEADER):
-            indata = sonar.read()
-    
-        version = []
-        version.append(binascii.hexlify(bytearray(indata)))
-    
-        indata = sonar.read()
-        while(indata != LF):
-            version.append(binascii.hexlify(bytearray(indata)))
-            indata = sonar.read()
-    
-        version.append(binascii.hexlify(bytearray(indata)))
-    
-        if (len(version) == MT_VERSION_DATA_LENGTH):
-            for idx, b in enumerate(version):
-                sys.stdout.write(b)
-                if ((idx-1) % 2)/2 == 0 and idx < len(version)-1:
-                    print ", ",
-            print "\n\n"
+        msg = self.read_message(MT_VERSION_DATA_ID)
+        version = version_data_params._make(
+            VERSION_DATA_PARAMS.unpack_from(msg.payload))
+        print version
+        return version
     
     def send_BBUser(self):
         self.send_command(MT_SEND_BB_USER_ID)
     
     def BBUser_data(self):
-        # NOT IMPLEMENTED
-        print "NOT IMPLEMENTED"
+        '''
+        Return the payload of the next mtBBUserData message.
+        '''
+        return self.read_message(MT_BB_USER_DATA_ID).payload
     
-    def head_command(self):
-        # NOT IMPLEMENTED
-        print "NOT IMPLEMENTED"
+    def head_command(self, range_m=30.0, n_bins=300, left_lim=0,
+            right_lim=BEARING_STEPS - 1, step_angle_size=STEP_LOW,
+            continuous=True, adc8on=True, gain=84, ad_span=38, ad_low=40):
+        '''
+        Configure the head with a mtHeadCommand and allocate the sweep image.
+        range_m is the range in metres, limits and step in 1/16 gradian.
+        '''
+        hd_ctrl = 0
+        if adc8on:
+            hd_ctrl |= HD_CTRL_ADC8ON
+        if continuous:
+            hd_ctrl |= HD_CTRL_CONT
+        # Sampling interval of the bins over the two way travel time.
+        ad_interval = int(round(2 * range_m / SOUND_SPEED / n_bins / 
+            AD_INTERVAL_UNIT))
+        self.params = head_command_params(v3b_params=0x1D, hd_ctrl=hd_ctrl,
+            hd_type=11, tx_n1=0, tx_n2=0, rx_n1=0, rx_n2=0, tx_pulse_len=20,
+            range_scale=int(round(range_m * 10)), left_lim=left_lim,
+            right_lim=right_lim, ad_span=ad_span, ad_low=ad_low, igain1=gain,
+            igain2=gain, slope1=0, slope2=0, mo_time=25,
+            step_angle_size=step_angle_size, ad_interval=ad_interval,
+            n_bins=n_bins, max_ad_buf=500, lockout=100, minor_axis_dir=1600,
+            major_axis_pan=1, ctl2=0, scan_z=0)
+        payload = HEAD_COMMAND_PARAMS.pack(*self.params)
+        # The V3B parameters of the second channel are not used.
+        payload += '\x00' * (MT_HEAD_COMMAND_LENGTH - MIN_MESSAGE_LENGTH - 
+            len(payload))
+        self.sonar.write(build_message(MT_HEAD_COMMAND_ID, payload))
+        if (self.sweep is None or self.sweep.n_bins != n_bins or 
+                self.sweep.step_angle_size != step_angle_size):
+            self.sweep = SweepImage(n_bins, step_angle_size)
     
     def send_data(self):
         self.send_command(MT_SEND_DATA)
     
     def head_data(self):
-        # NOT IMPLEMENTED
-        print "NOT IMPLEMENTED"
+        '''
+        Read the next mtHeadData message, store its scanline in the sweep
+        image and return its parameters.
+        '''
+        return self.decode_head_data(self.read_message(MT_HEAD_DATA_ID))
+
+    def decode_head_data(self, msg):
+        '''
+        Store the scanline of a mtHeadData message in the sweep image and
+        return its parameters.
+        '''
+        params = head_data_params._make(HEAD_DATA_PARAMS.unpack_from(msg.payload))
+        adc8on = params.hd_ctrl & HD_CTRL_ADC8ON
+        if self.sweep is None:
+            n_bins = params.dbytes if adc8on else 2 * params.dbytes
+            self.sweep = SweepImage(n_bins, max(params.step_angle_size, 1))
+        self.sweep.update(params.bearing, 
+            buffer(msg.payload, HEAD_DATA_PARAMS.size, params.dbytes), adc8on)
+        return params
         
     def bytes_to_hex(self, byte):
         #return byte.encode('hex', 16)
         return binascii.hexlify(bytearray(byte))
     
     def sonar_read(self, numberOfBytes):
-        inData = self.bytes_to_hex(sonar.read())
+        inData = self.bytes_to_hex(self.sonar.read())
         return inData
 
@@ -0,0 +1,240 @@
+#!/usr/bin/python
+
+'''
+Emulator of a Tritech sonar head for the sim:// pySerial URL handler.
+
+The model answers mtSendVersion, mtSendBBUser, mtHeadCommand, mtSendData and
+mtReboot like a real head, sends mtAlive once a second and produces
+mtHeadData scanlines of a rectangular pool at the acoustic ping rate. It
+makes it possible to run and benchmark the sonar code without hardware:
+
+    sonar = Sonar("sim://device=sonar_sim.SonarDevice/pingrate=25")
+
+Options (given in the URL, all optional):
+    pingrate   maximum number of pings per second, 0 = limited only by the
+               two way travel time of sound over the range (default 0)
+    range      range in metres until a mtHeadCommand sets it (default 30)
+    nbins      bins per scanline until a mtHeadCommand sets it (default 300)
+    width      width of the pool in metres (default 25)
+    length     length of the pool in metres (default 50)
+    noise      amplitude of the background noise, 0-255 (default 20)
+'''
+
+import math
+import struct
+
+from serial.urlhandler.protocol_sim import Device
+
+import sonar
+from sonar import (MessageDecoder, MIN_MESSAGE_LENGTH, MT_ALIVE_ID,
+    MT_SEND_VERSION_ID, MT_VERSION_DATA_ID, MT_SEND_BB_USER_ID,
+    MT_BB_USER_DATA_ID, MT_BB_USER_DATA_LENGTH, MT_SEND_DATA, MT_HEAD_DATA_ID,
+    MT_HEAD_COMMAND_ID, MT_REBOOT_ID, HEAD_COMMAND_PARAMS, HEAD_DATA_PARAMS,
+    VERSION_DATA_PARAMS, ALIVE_PARAMS, head_command_params, HD_CTRL_ADC8ON,
+    HD_CTRL_CONT, BEARING_STEPS, SOUND_SPEED)
+
+# Node number of the sonar head and of the host.
+SONAR_NODE = 2
+HOST_NODE = 255
+
+ALIVE_INTERVAL = 1.0
+
+# HeadInf bits of mtAlive.
+HEAD_INF_IN_SCAN = 0x20
+HEAD_INF_NO_PARAMS = 0x40
+HEAD_INF_SENT_CFG = 0x80
+
+# Sweep codes of mtHeadData.
+SWEEP_SCANNING = 0
+SWEEP_LEFT_LIMIT = 1
+SWEEP_RIGHT_LIMIT = 2
+
+DEVICE_TYPE = 11
+HEAD_STATUS = 0x11
+
+
+def build_message(cmd, payload=''):
+    '''
+    Frame a payload as a message sent by the sonar head.
+    '''
+    return sonar.build_message(cmd, payload, tx_nde=SONAR_NODE,
+        rx_nde=HOST_NODE, nde=SONAR_NODE)
+
+
+class SonarDevice(Device):
+    '''
+    Device model of a Tritech sonar head.
+    '''
+
+    def __init__(self, pingrate='0', range='30', nbins='300', width='25',
+            length='50', noise='20'):
+        self.ping_interval = 0.0
+        if float(pingrate) > 0:
+            self.ping_interval = 1.0 / float(pingrate)
+        self.width = float(width)
+        self.length = float(length)
+        self.noise = int(noise)
+        if self.width <= 0 or self.length <= 0 or not 0 <= self.noise <= 255:
+            raise ValueError('invalid pool geometry or noise level')
+
+        # The head scans continuously with 8 bit bins until it is configured.
+        self.params = head_command_params(v3b_params=0x1D,
+            hd_ctrl=HD_CTRL_ADC8ON | HD_CTRL_CONT, hd_type=DEVICE_TYPE,
+            tx_n1=0, tx_n2=0, rx_n1=0, rx_n2=0, tx_pulse_len=20,
+            range_scale=int(float(range) * 10), left_lim=0,
+            right_lim=BEARING_STEPS - 1, ad_span=38, ad_low=40, igain1=84,
+            igain2=84, slope1=0, slope2=0, mo_time=25, step_angle_size=16,
+            ad_interval=0, n_bins=int(nbins), max_ad_buf=500, lockout=100,
+            minor_axis_dir=1600, major_axis_pan=1, ctl2=0, scan_z=0)
+        if self.params.range_scale <= 0 or self.params.n_bins <= 0:
+            raise ValueError('range and nbins must be > 0')
+        self.configured = False
+
+        self.decoder = MessageDecoder()
+        self.bearing = 0
+        self.direction = 1
+        self.next_ping = 0.0
+        self.alive = False
+
+    def connection_made(self, link):
+        Device.connection_made(self, link)
+        self.alive = True
+        self.start_time = link.time()
+        self.next_ping = self.start_time
+        self.send_alive()
+
+    def connection_lost(self):
+        self.alive = False
+
+    def data_received(self, data):
+        for msg in self.decoder.feed(data):
+            self.handle_message(msg)
+
+    def handle_message(self, msg):
+        command = msg.command
+        if command == MT_SEND_VERSION_ID:
+            # System type, CPU id, program length and checksum.
+            self.link.write(build_message(MT_VERSION_DATA_ID,
+                VERSION_DATA_PARAMS.pack(DEVICE_TYPE, 0x53494D31, 0x8000, 0xBEEF)))
+        elif command == MT_SEND_BB_USER_ID:
+            self.link.write(build_message(MT_BB_USER_DATA_ID,
+                '\x00' * (MT_BB_USER_DATA_LENGTH - MIN_MESSAGE_LENGTH)))
+        elif command == MT_HEAD_COMMAND_ID:
+            if len(msg.payload) >= HEAD_COMMAND_PARAMS.size:
+                params = head_command_params._make(
+                    HEAD_COMMAND_PARAMS.unpack_from(msg.payload))
+                if params.range_scale > 0 and params.n_bins > 0:
+                    self.params = params
+                    self.configured = True
+                    self.bearing = self.clamp_bearing(self.bearing)
+        elif command == MT_SEND_DATA:
+            # The head answers with the next scanline as soon as the previous
+            # ping has returned.
+            now = self.link.time()
+            when = max(now, self.next_ping)
+            self.next_ping = when + self.ping_period()
+            self.link.call_later(when - now, self.send_head_data)
+        elif command == MT_REBOOT_ID:
+            self.configured = False
+            self.write_alive()
+
+    def ping_period(self):
+        range_m = self.params.range_scale / 10.0
+        return max(self.ping_interval, 2 * range_m / SOUND_SPEED)
+
+    def send_alive(self):
+        if self.alive:
+            self.write_alive()
+            self.link.call_later(ALIVE_INTERVAL, self.send_alive)
+
+    def write_alive(self):
+        head_time = int((self.link.time() - self.start_time) * 1000)
+        head_inf = HEAD_INF_SENT_CFG
+        if self.configured:
+            head_inf |= HEAD_INF_IN_SCAN
+        else:
+            head_inf |= HEAD_INF_NO_PARAMS
+        self.link.write(build_message(MT_ALIVE_ID, ALIVE_PARAMS.pack(
+            0x80, head_time & 0xFFFFFFFF, self.bearing, head_inf)))
+
+    def clamp_bearing(self, bearing):
+        if self.params.hd_ctrl & HD_CTRL_CONT:
+            return bearing % BEARING_STEPS
+        left, right = self.params.left_lim, self.params.right_lim
+        return min(max(bearing, min(left, right)), max(left, right))
+
+    def step(self):
+        '''
+        Move the transducer to the next bearing and return the sweep code.
+        '''
+        p = self.params
+        step = max(p.step_angle_size, 1)
+        if p.hd_ctrl & HD_CTRL_CONT:
+            self.bearing = (self.bearing + step) % BEARING_STEPS
+            return SWEEP_SCANNING
+        left, right = min(p.left_lim, p.right_lim), max(p.left_lim, p.right_lim)
+        self.bearing += self.direction * step
+        if self.bearing >= right:
+            self.bearing = right
+            self.direction = -1
+            return SWEEP_RIGHT_LIMIT
+        if self.bearing <= left:
+            self.bearing = left
+            self.direction = 1
+            return SWEEP_LEFT_LIMIT
+        return SWEEP_SCANNING
+
+    def wall_distance(self, bearing):
+        '''
+        Distance to the pool wall along a bearing. The head is in the middle
+        of the pool, bearing 3200 points along its length.
+        '''
+        angle = (bearing - BEARING_STEPS / 2) * 2 * math.pi / BEARING_STEPS
+        dx, dy = math.sin(angle), math.cos(angle)
+        distances = []
+        if abs(dx) > 1e-9:
+            distances.append(self.width / 2 / abs(dx))
+        if abs(dy) > 1e-9:
+            distances.append(self.length / 2 / abs(dy))
+        return min(distances)
+
+    def scanline(self, bearing):
+        '''
+        Echo intensities (0-255) of one ping: noise, a reverberation tail
+        close to the head and a strong return from the wall.
+        '''
+        p = self.params
+        rng = self.link.random
+        range_m = p.range_scale / 10.0
+        bin_size = range_m / p.n_bins
+        wall = self.wall_distance(bearing)
+        bins = []
+        for i in xrange(p.n_bins):
+            distance = (i + 0.5) * bin_size
+            level = rng.randint(0, self.noise) + 120 * math.exp(-distance)
+            offset = (distance - wall) / max(bin_size, 0.05)
+            if -3 < offset < 12:
+                level += 200 * math.exp(-abs(offset) / (1 if offset < 0 else 4))
+            bins.append(min(int(level), 255))
+        return bins
+
+    def send_head_data(self):
+        if not self.alive:
+            return
+        p = self.params
+        sweep_code = self.step()
+        bins = self.scanline(self.bearing)
+        if p.hd_ctrl & HD_CTRL_ADC8ON:
+            data = struct.pack('%dB' % len(bins), *bins)
+        else:
+            # Two 4 bit bins per byte, the first bin in the low nibble.
+            if len(bins) % 2:
+                bins.append(0)
+            data = ''.join([chr((bins[i] >> 4) | (bins[i + 1] & 0xF0))
+                for i in xrange(0, len(bins), 2)])
+        params = HEAD_DATA_PARAMS.pack(HEAD_DATA_PARAMS.size + len(data),
+            DEVICE_TYPE, HEAD_STATUS, sweep_code, p.hd_ctrl, p.range_scale,
+            p.tx_n1, p.igain1 & 0xFF, p.slope1, p.ad_span, p.ad_low, 0,
+            p.ad_interval, p.left_lim, p.right_lim, p.step_angle_size,
+            self.bearing, len(data))
+        self.link.write(build_message(MT_HEAD_DATA_ID, params + data))
@@ -0,0 +1,109 @@
+#!/usr/bin/python
+
+'''
+The 12 byte command frame sent to the ROV and the AUV:
+
+    START, roll, pitch, yaw, throttle, button, hat, 4 x manipulator, STOP
+
+The frame is kept in one bytearray that is written to the serial port as
+is. The setters clamp and round their values, so any number (e.g. a PID
+output) can be given and the frame always holds valid bytes.
+'''
+
+
+class CommandFrame(object):
+
+    # Signal the start of a packet.
+    START = 255
+    # Signal the end of a packet.
+    STOP = 251
+    # Deflection range of the axes.
+    MIN_DEFLECTION = 0
+    MAX_DEFLECTION = 250
+    CENTER = 125
+
+    LENGTH = 12
+
+    # Byte positions.
+    ROLL = 1
+    PITCH = 2
+    YAW = 3
+    THROTTLE = 4
+    BUTTON = 5
+    HAT = 6
+    MANIPULATOR = 7
+    NUMBER_OF_MANIPULATORS = 4
+
+    def __init__(self):
+        self.buffer = bytearray([
+            self.START,
+            self.CENTER,    # roll
+            self.CENTER,    # pitch
+            self.CENTER,    # yaw
+            self.CENTER,    # throttle
+            0,              # button
+            self.CENTER,    # hat
+            self.CENTER,    # manipulator
+            self.CENTER,    # manipulator
+            0,              # manipulator
+            0,              # manipulator
+            self.STOP
+        ])
+
+    def set_deflection(self, index, value):
+        '''
+        Store value rounded and clamped to MIN_DEFLECTION..MAX_DEFLECTION.
+        NaN is stored as CENTER.
+        '''
+        if value >= self.MAX_DEFLECTION:
+            self.buffer[index] = self.MAX_DEFLECTION
+        elif value > self.MIN_DEFLECTION:
+            self.buffer[index] = int(value + 0.5)
+        elif value <= self.MIN_DEFLECTION:
+            self.buffer[index] = self.MIN_DEFLECTION
+        else:
+            self.buffer[index] = self.CENTER
+
+    def set_roll(self, value):
+        self.set_deflection(self.ROLL, value)
+
+    def set_pitch(self, value):
+        self.set_deflection(self.PITCH, value)
+
+    def set_yaw(self, value):
+        self.set_deflection(self.YAW, value)
+
+    def set_throttle(self, value):
+        self.set_deflection(self.THROTTLE, value)
+
+    def set_button(self, button):
+        '''
+        Number of the pressed button, 0 for none.
+        '''
+        self.set_deflection(self.BUTTON, button)
+
+    def set_hat(self, position):
+        '''
+        Hat switch bits: up 1 << 3, down 1 << 2, left 1 << 1, right 1 << 0.
+        '''
+        self.buffer[self.HAT] = int(position) & 0x0F
+
+    def set_manipulator(self, n, value):
+        if not 0 <= n < self.NUMBER_OF_MANIPULATORS:
+            raise IndexError("no manipulator %d" % n)
+        self.set_deflection(self.MANIPULATOR + n, value)
+
+    def get(self, index):
+        return self.buffer[index]
+
+    def get_button(self):
+        return self.buffer[self.BUTTON]
+
+    def tolist(self):
+        return list(self.buffer)
+
+    def __len__(self):
+        return self.LENGTH
+
+    def __str__(self):
+        return str(self.tolist())
@@ -43,6 +43,9 @@ import time
 import sys
 import configs
 import logging
+import log_utils
+from command_frame import CommandFrame
+from latency import StageTimers, perf_counter_ns
 
 class ROV(object):
 
@@ -74,20 +77,8 @@ class ROV(object):
     def __init__(self):
         self.init_logging()
 
-        self.rov_data = [
-        self.START, # start byte
-        125,        # roll
-        125,        # pitch
-        125,        # yaw
-        125,        # throttle
-        0,          # button
-        125,        # hat
-        125,        # manipulator
-        125,        # manipulator
-        0,          # manipulator
-        0,          # manipulator
-        self.STOP   # stop byte
-    ]
+        self.frame = CommandFrame()
+        self.timers = StageTimers()
 
         self.initialize_joystick()
         self.connet_to_rov()
@@ -99,41 +90,20 @@ class ROV(object):
         }
 
     def init_logging(self):
+        self.logger, self.log_listener = log_utils.setup_logger(__name__,
+            "rov.log")
+        # Checked once, the loop skips building debug messages when off.
+        self.debug = self.logger.isEnabledFor(logging.DEBUG)
+
         cfg = configs.parse_config_section("Logging")
-        logging_enabled = cfg['enabled']
-        logging_level = cfg['level']
-        log_to_file = cfg['log_to_file']
-        log_to_console = cfg['log_to_console']
-
-        if logging_level.lower() == "critical":
-            level = logging.CRITICAL
-        elif logging_level.lower() == "info":
-            level = logging.INFO
-        elif logging_level.lower() == "warning":
-            level = logging.WARNING
-        elif logging_level.lower() == "error":
-            level = logging.ERROR
-        else:
-            level = logging.DEBUG
-
-        self.logger = logging.getLogger(__name__)
-        self.logger.setLevel(level)
-        log_formatter = logging.Formatter("[%(levelname)s]: %(message)s")
-
-        if log_to_file == "True":
-            # Truncate existing log.
-            with open('rov.log', 'w'):
-                pass
-            file_handler = logging.FileHandler("rov.log")
-            file_handler.setFormatter(log_formatter)
-            self.logger.addHandler(file_handler)
-        if log_to_console == "True":
-            console_handler = logging.StreamHandler()
-            console_handler.setFormatter(log_formatter)
-            self.logger.addHandler(console_handler)
-
-        if logging_enabled == "False":
-            logging.disable(logging.CRITICAL)
+        # Interval (s) between logged latency summaries.
+        self.latency_interval = float(cfg.get('latency_interval', 10))
+        # The state lines are logged when they change, else at most once per
+        # state_interval seconds.
+        self.state_interval = float(cfg.get('state_interval', 5))
+        self.state_logger = logging.getLogger(__name__ + ".state")
+        self.logged_state = None
+        self.next_state_log = 0.0
 
         self.logger.info("\n---------- Logging started %s, %s ----------\n", 
             time.strftime("%d.%m.%y"), time.strftime("%H:%M:%S"))
@@ -252,8 +222,9 @@ class ROV(object):
             absolute_deflection = abs(value_converted - center) * gain
             deflection = (value_converted - center) * gain
             
-            print "Center + Deflection = %d + %d = %d" % (center, deflection, 
-                (center + deflection))
+            if self.debug:
+                self.logger.debug("Center + Deflection = %d + %d = %d", 
+                    center, deflection, center + deflection)
 
             # Deadzone
             if (absolute_deflection <= dead_zone):
@@ -268,16 +239,17 @@ class ROV(object):
                 return right_max - val
 
     def prepare_joystick_data(self):
-        # Put the four joystick axes in the data array that will be sent to the 
+        # Put the four joystick axes in the command frame that will be sent to the
         # ROV.
 
         # Roll and pitch are the first two axes on the joystick.
         for a in range(0, 2):
-            self.rov_data[a+1] = self.compute_deflection(
+            self.frame.set_deflection(self.PILOT_AXIS_START + a, 
+                self.compute_deflection(
                 self.joystick.get_axis(a), 
                 flatten=self.flatten, 
                 dead_zone=self.dead_zone,
-                gain=self.gain)
+                gain=self.gain))
 
         # Throttle is the second axis on the joystick.
         throttle = self.compute_deflection(self.joystick.get_axis(3), 
@@ -295,22 +267,22 @@ class ROV(object):
 
         # The vehicle is very sensitive on this axis, therefore we halve
         # the deflection to improve handling.
-        self.rov_data[3] = yaw
+        self.frame.set_yaw(yaw)
 
         # We want to reverse the throttle axis to make it more intuitively
         # to fly the ROV.
-        self.rov_data[4] = - (throttle - (self.MAX_DEFLECTION))
+        self.frame.set_throttle(- (throttle - (self.MAX_DEFLECTION)))
 
-        self.rov_data[self.HAT_SWITCH_INDEX] = self.get_hat_switch_position()
+        self.frame.set_hat(self.get_hat_switch_position())
 
         # Reset the button value set in previous call.
-        self.rov_data[self.BUTTON_INDEX] = 0
+        self.frame.set_button(0)
 
         # Search for pressed buttons and stop when one is found.
-        # Put the button number in the rov data array.
+        # Put the button number in the command frame.
         for b in range(0, self.joystick.get_numbuttons()):
             if (self.joystick.get_button(b)) != 0:
-                self.rov_data[self.BUTTON_INDEX] = b+1
+                self.frame.set_button(b+1)
                 break
 
         if self.button_released(self.increase_gain_button):
@@ -326,11 +298,11 @@ class ROV(object):
     def button_released(self, button):
         button_released = False
         if self.button_pressed[button]:
-            if not self.rov_data[self.BUTTON_INDEX] == button:
+            if not self.frame.get_button() == button:
                 self.button_pressed[button] = False
                 button_released = True
         else:
-            if self.rov_data[self.BUTTON_INDEX] == button:
+            if self.frame.get_button() == button:
                 self.button_pressed[button] = True
 
         return button_released
@@ -361,37 +333,75 @@ class ROV(object):
         return int(str.encode('hex'), 16)
 
     def log_currenct_state(self):
-        self.logger.info("Gain: %.1f", self.gain)
-        self.logger.info("Flatten: %r", self.flatten)
-        self.logger.info("Dead zone: %d", self.dead_zone)
+        # Decided here rather than by a logging filter, which would only drop
+        # the records after they were built, three every iteration.
+        state = (self.gain, self.flatten, self.dead_zone)
+        now = time.time()
+        if now >= self.next_state_log:
+            last = (None, None, None)
+            self.next_state_log = now + self.state_interval
+        elif state != self.logged_state:
+            last = self.logged_state
+        else:
+            return
+        self.logged_state = state
+        if state[0] != last[0]:
+            self.state_logger.info("Gain: %.1f", self.gain)
+        if state[1] != last[1]:
+            self.state_logger.info("Flatten: %r", self.flatten)
+        if state[2] != last[2]:
+            self.state_logger.info("Dead zone: %d", self.dead_zone)
+
+    def log_latency(self):
+        self.logger.info("Loop latency: %s", self.timers)
+        self.timers.reset()
 
     def run(self):
+        timers = self.timers
+        next_summary = time.time() + self.latency_interval
         try:
             running = True
             while running:
+                t_start = perf_counter_ns()
                 self.log_currenct_state()
 
             # Wait for ROV to send stop byte.
                 indata = self.bytes_to_int(self.rov.read())
                 while(indata != self.STOP):
-                    print indata
+                    if self.debug:
+                        self.logger.debug("Input from ROV: %d", indata)
                     indata = self.bytes_to_int(self.rov.read())
+                t_stop = perf_counter_ns()
+                timers.record('wait_stop', t_stop - t_start)
 
                 # Poll joystick.
                 pygame.event.pump()
 
-                # Store joystick state in data in rov_data.
+                # Store joystick state in the command frame.
                 self.prepare_joystick_data()
+                t_joystick = perf_counter_ns()
+                timers.record('joystick', t_joystick - t_stop)
 
                 # Print the message for debugging purposes.
-                self.logger.debug("Transmitting data to ROV")
-                self.logger.debug(self.rov_data)
+                if self.debug:
+                    self.logger.debug("Transmitting data to ROV: %s", 
+                        self.frame.tolist())
                 # Write the data to the ROV.    
-                self.rov.write(self.rov_data)
+                self.rov.write(self.frame.buffer)
+                t_end = perf_counter_ns()
+                timers.record('write', t_end - t_joystick)
+                timers.record('loop', t_end - t_start)
+
+                if time.time() >= next_summary:
+                    self.log_latency()
+                    next_summary = time.time() + self.latency_interval
 
         except KeyboardInterrupt:
             self.joystick.quit()
             self.rov.close()
+        finally:
+            if self.log_listener is not None:
+                self.log_listener.stop()
 
 # ------------------------------ MAIN ----------------------------------- #
 
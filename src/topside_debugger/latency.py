@@ -0,0 +1,146 @@
+#!/usr/bin/python
+
+'''
+Latency statistics of the stages of a control loop.
+
+The stages are timed with perf_counter_ns() and recorded into a
+LatencyHistogram per stage (realtime.RateScheduler keeps its wakeup jitter
+in one too):
+
+    timers = StageTimers()
+    ...
+    t0 = perf_counter_ns()
+    self.rov.write(self.frame.buffer)
+    timers.record('write', perf_counter_ns() - t0)
+
+LatencyHistogram has log-linear buckets like an HDR histogram: the first
+SUB_BUCKETS nanoseconds get a bucket each, above that every power of two is
+split into SUB_BUCKETS / 2 buckets. Any recorded value is known to within
+about 3 %, recording is an index computation and an increment, and the
+memory does not grow with the number of samples.
+'''
+
+import time
+from collections import namedtuple
+
+try:
+    perf_counter_ns = time.perf_counter_ns
+except AttributeError:
+    # Python 2 has no nanosecond counter. The clock of pid.monotonic, not
+    # the wall clock, which NTP or date may step while a stage is timed.
+    from serial.serialutil import monotonic_ns as perf_counter_ns
+
+# Count, mean, median, 99th percentile and maximum of a stage, in ms.
+latency_summary = namedtuple("latency_summary", "count mean p50 p99 max")
+
+
+class LatencyHistogram(object):
+    '''
+    Histogram of durations in ns, from 0 to highest. Longer durations are
+    counted as highest.
+    '''
+
+    SUB_BUCKET_BITS = 6
+    SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+    HALF = SUB_BUCKETS >> 1
+
+    def __init__(self, highest=60 * 10**9):
+        self.highest = highest
+        self.counts = [0] * (self.index(highest) + 1)
+        self.reset()
+
+    def reset(self):
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def index(self, value):
+        if value < self.SUB_BUCKETS:
+            return value
+        shift = value.bit_length() - self.SUB_BUCKET_BITS
+        return self.SUB_BUCKETS + (shift - 1) * self.HALF + \
+            (value >> shift) - self.HALF
+
+    def upper_bound(self, index):
+        '''
+        Largest value counted in a bucket.
+        '''
+        if index < self.SUB_BUCKETS:
+            return index
+        shift, mantissa = divmod(index - self.SUB_BUCKETS, self.HALF)
+        return ((mantissa + self.HALF + 1) << (shift + 1)) - 1
+
+    def record(self, value):
+        value = min(max(int(value), 0), self.highest)
+        self.counts[self.index(value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        if self.min is None or value < self.min:
+            self.min = value
+
+    def percentile(self, p):
+        '''
+        Value (ns) that p percent of the recorded values do not exceed, 0
+        if nothing was recorded.
+        '''
+        if not self.count:
+            return 0
+        rank = max(1, int(p / 100.0 * self.count + 0.5))
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(self.upper_bound(i), self.max)
+        return self.max
+
+    def mean(self):
+        if not self.count:
+            return 0.0
+        return float(self.total) / self.count
+
+    def summary(self):
+        ms = 1e-6
+        return latency_summary(self.count, self.mean() * ms,
+            self.percentile(50) * ms, self.percentile(99) * ms,
+            self.max * ms)
+
+    def __str__(self):
+        return 'n=%d mean=%.2f p50=%.2f p99=%.2f max=%.2f ms' % self.summary()
+
+
+class StageTimers(object):
+    '''
+    One LatencyHistogram per stage name, created on first use. A stage must
+    be recorded by one thread only.
+    '''
+
+    def __init__(self):
+        self.stages = {}
+        self.order = []
+
+    def record(self, stage, elapsed_ns):
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            histogram = self.stages[stage] = LatencyHistogram()
+            self.order.append(stage)
+        histogram.record(elapsed_ns)
+
+    def snapshot(self):
+        '''
+        Return [(stage, latency_summary)] in the order the stages were
+        first recorded.
+        '''
+        return [(stage, self.stages[stage].summary()) for stage in self.order]
+
+    def reset(self):
+        for histogram in self.stages.values():
+            histogram.reset()
+
+    def __str__(self):
+        return ' | '.join('%s %s' % (stage, self.stages[stage])
+            for stage in self.order if self.stages[stage].count)
@@ -0,0 +1,289 @@
+#!/usr/bin/python
+
+'''
+Shipping of log records to the topside log receiver (logger_server.py).
+
+BatchingSocketHandler never blocks the thread that logs: emit() only puts
+the record in a bounded queue. A sender thread collects the records into
+batches, pickles each batch as one frame and sends it over TCP. When the
+link is down, the frames go to a bounded spool file and the thread
+reconnects with exponential backoff; the spool is sent first once the link
+is back.
+
+A frame is a 4 byte big endian header and the data. Plain
+logging.handlers.SocketHandler frames (one pickled record dict) have the
+data length in the header. Batches set BATCH in the header and their data
+is a pickled list of record dicts, zlib compressed if COMPRESSED is set:
+
+    header = BATCH | COMPRESSED | len(data)
+
+Records are pickled in the sender thread, their arguments must not be
+changed after the logging call.
+'''
+
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+import zlib
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    # Python 3, pickle.loads() takes memoryviews.
+    loads = pickle.loads
+else:
+    def loads(data):
+        # cPickle.loads() only takes strings, a cStringIO reads a buffer in
+        # place.
+        return pickle.load(StringIO(data))
+
+FRAME_HEADER = struct.Struct('>L')
+# Header flags. A SocketHandler frame never comes close to 1 GiB.
+BATCH = 0x80000000
+COMPRESSED = 0x40000000
+LENGTH_MASK = 0x3FFFFFFF
+
+
+def record_dict(record):
+    '''
+    Picklable dict of a record, as SocketHandler.makePickle makes it.
+    '''
+    if record.exc_info and not record.exc_text:
+        record.exc_text = logging.Formatter().formatException(record.exc_info)
+    d = dict(record.__dict__)
+    d['msg'] = record.getMessage()
+    d['args'] = None
+    d['exc_info'] = None
+    return d
+
+
+def encode_batch(records, compress=True):
+    '''
+    Frame a list of record dicts.
+    '''
+    data = pickle.dumps(records, 2)
+    flags = BATCH
+    if compress:
+        data = zlib.compress(data, 1)
+        flags |= COMPRESSED
+    return FRAME_HEADER.pack(flags | len(data)) + data
+
+
+def decode_frame(header, data):
+    '''
+    Return the record dicts of a frame, given its header (as unpacked from
+    FRAME_HEADER) and data. data may be a view of a receive buffer (a
+    memoryview, a buffer on Python 2), it is not copied.
+    '''
+    if not header & BATCH:
+        return [loads(data)]
+    if header & COMPRESSED:
+        data = zlib.decompress(data)
+    return loads(data)
+
+
+class BatchingSocketHandler(logging.Handler):
+    '''
+    Ships records in batches to host:port. A batch is sent when it holds
+    batch_size records or its oldest record is flush_interval seconds old.
+    Records arriving while queue_size records are waiting are dropped and
+    counted in dropped, as are frames that do not fit in the spool of
+    spool_size bytes. spool_file None disables the spool: frames that cannot
+    be sent are dropped.
+    '''
+
+    def __init__(self, host, port, batch_size=100, flush_interval=0.2,
+            compress=True, queue_size=10000, spool_file=None,
+            spool_size=10 * 1024 * 1024, max_backoff=30.0):
+        logging.Handler.__init__(self)
+        self.address = (host, port)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.compress = compress
+        self.spool_file = spool_file
+        self.spool_size = spool_size
+        self.max_backoff = max_backoff
+        self.queue = queue.Queue(queue_size)
+        self.sock = None
+        self.backoff = 0.0
+        self.next_attempt = 0.0
+        self.dropped = 0
+        self.sent = 0
+        self._closing = False
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def emit(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout=5.0):
+        '''
+        Send what is queued, waiting at most timeout seconds, and close.
+        '''
+        if not self._closing:
+            self._closing = True
+            self._thread.join(timeout)
+        logging.Handler.close(self)
+
+    def _run(self):
+        while not (self._closing and self.queue.empty()):
+            batch = self._collect()
+            if batch:
+                frame, count = self._encode(batch)
+                if count:
+                    self._ship(frame, count)
+            elif self._spooled():
+                # Nothing new, try to get rid of the spool.
+                self._ship(None, 0)
+        if self._spooled():
+            # Last chance before closing, whatever the backoff.
+            self.next_attempt = 0.0
+            self._ship(None, 0)
+        if self.sock is not None:
+            self.sock.close()
+
+    def _encode(self, batch):
+        '''
+        Frame the records of a batch, return the frame and the number of
+        records in it. Records that cannot be formatted (e.g. arguments not
+        matching the format string) or pickled are passed to handleError()
+        and left out, they must not stop the thread.
+        '''
+        records = []
+        dicts = []
+        for record in batch:
+            try:
+                dicts.append(record_dict(record))
+                records.append(record)
+            except Exception:
+                self.handleError(record)
+        try:
+            return encode_batch(dicts, self.compress), len(dicts)
+        except Exception:
+            pass
+        # Pickle the records one by one to find the bad ones.
+        good = []
+        for record, d in zip(records, dicts):
+            try:
+                pickle.dumps(d, 2)
+                good.append(d)
+            except Exception:
+                self.handleError(record)
+        return encode_batch(good, self.compress), len(good)
+
+    def _collect(self):
+        '''
+        Wait for the records of the next batch.
+        '''
+        batch = []
+        deadline = None
+        while len(batch) < self.batch_size:
+            if deadline is None:
+                timeout = self.flush_interval
+            else:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+            try:
+                batch.append(self.queue.get(True, timeout))
+            except queue.Empty:
+                break
+            if deadline is None:
+                deadline = time.time() + self.flush_interval
+        return batch
+
+    def _connect(self):
+        now = time.time()
+        if now < self.next_attempt:
+            return False
+        try:
+            self.sock = socket.create_connection(self.address, 5.0)
+            self.backoff = 0.0
+            return True
+        except socket.error:
+            self.sock = None
+            self.backoff = min(max(2 * self.backoff, 0.5), self.max_backoff)
+            self.next_attempt = now + self.backoff
+            return False
+
+    def _send(self, frame):
+        try:
+            self.sock.sendall(frame)
+            return True
+        except socket.error:
+            self.sock.close()
+            self.sock = None
+            return False
+
+    def _ship(self, frame, count):
+        '''
+        Send the spool and then frame (holding count records), spool the
+        frame if that is not possible.
+        '''
+        if self.sock is None and not self._connect():
+            self._spool(frame, count)
+            return
+        if self._spooled() and not self._send_spool():
+            self._spool(frame, count)
+            return
+        if frame is not None:
+            if self._send(frame):
+                self.sent += count
+            else:
+                self._spool(frame, count)
+
+    def _spooled(self):
+        return self.spool_file is not None and \
+            os.path.exists(self.spool_file) and \
+            os.path.getsize(self.spool_file) > 0
+
+    def _spool(self, frame, count):
+        if frame is None:
+            return
+        if self.spool_file is None:
+            self.dropped += count
+            return
+        size = 0
+        if os.path.exists(self.spool_file):
+            size = os.path.getsize(self.spool_file)
+        if size + len(frame) > self.spool_size:
+            self.dropped += count
+            return
+        with open(self.spool_file, 'ab') as f:
+            f.write(frame)
+
+    def _send_spool(self):
+        '''
+        Send the spooled frames in order. On failure the unsent ones are
+        kept, a frame that was partly sent is sent again.
+        '''
+        with open(self.spool_file, 'rb') as f:
+            data = f.read()
+        offset = 0
+        while offset < len(data):
+            header = FRAME_HEADER.unpack_from(data, offset)[0]
+            end = offset + FRAME_HEADER.size + (header & LENGTH_MASK)
+            if not self._send(data[offset:end]):
+                with open(self.spool_file, 'wb') as f:
+                    f.write(data[offset:])
+                return False
+            offset = end
+        open(self.spool_file, 'wb').close()
+        return True
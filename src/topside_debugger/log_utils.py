@@ -0,0 +1,131 @@
+#!/usr/bin/python
+
+'''
+Logging set up for the vehicle loops.
+
+setup_logger() configures a logger from the [Logging] config section. With
+background = True the logger only puts records in a queue, a QueueListener
+thread formats them and writes them to the console and the log file, so a
+control loop never waits for console or disk I/O. Records are queued
+unformatted: arguments must not be changed after the logging call, pass
+copies of mutable objects (e.g. frame.tolist()).
+'''
+
+import logging
+import logging.handlers
+import threading
+
+import configs
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+LEVELS = {
+    'critical': logging.CRITICAL,
+    'error': logging.ERROR,
+    'warning': logging.WARNING,
+    'info': logging.INFO,
+    'debug': logging.DEBUG,
+    }
+
+try:
+    from logging.handlers import QueueHandler, QueueListener
+except ImportError:
+    # Python 2 has neither, these provide the part of their interface used
+    # here.
+    class QueueHandler(logging.Handler):
+
+        def __init__(self, queue):
+            logging.Handler.__init__(self)
+            self.queue = queue
+
+        def enqueue(self, record):
+            self.queue.put_nowait(record)
+
+        def prepare(self, record):
+            return record
+
+        def emit(self, record):
+            try:
+                self.enqueue(self.prepare(record))
+            except Exception:
+                self.handleError(record)
+
+    class QueueListener(object):
+
+        _sentinel = None
+
+        def __init__(self, queue, *handlers):
+            self.queue = queue
+            self.handlers = handlers
+            self._thread = None
+
+        def start(self):
+            self._thread = threading.Thread(target=self._monitor)
+            self._thread.daemon = True
+            self._thread.start()
+
+        def _monitor(self):
+            while True:
+                record = self.queue.get()
+                if record is self._sentinel:
+                    break
+                for handler in self.handlers:
+                    if record.levelno >= handler.level:
+                        handler.handle(record)
+
+        def stop(self):
+            self.queue.put_nowait(self._sentinel)
+            self._thread.join()
+            self._thread = None
+
+
+class DeferredQueueHandler(QueueHandler):
+    '''
+    QueueHandler that leaves the formatting to the listener thread. The
+    standard one formats the message before queueing it.
+    '''
+
+    def prepare(self, record):
+        return record
+
+
+def setup_logger(name, log_file):
+    '''
+    Configure logger name from the [Logging] section. Returns the logger
+    and the QueueListener, None unless background is enabled. Stop the
+    listener before exiting to write out the queued records.
+    '''
+    cfg = configs.parse_config_section("Logging")
+
+    logger = logging.getLogger(name)
+    logger.setLevel(LEVELS.get(cfg['level'].lower(), logging.DEBUG))
+    log_formatter = logging.Formatter("[%(levelname)s]: %(message)s")
+
+    handlers = []
+    if cfg['log_to_file'] == "True":
+        # Truncate existing log.
+        with open(log_file, 'w'):
+            pass
+        handlers.append(logging.FileHandler(log_file))
+    if cfg['log_to_console'] == "True":
+        handlers.append(logging.StreamHandler())
+    for handler in handlers:
+        handler.setFormatter(log_formatter)
+
+    listener = None
+    if cfg.get('background', "False") == "True" and handlers:
+        records = queue.Queue()
+        logger.addHandler(DeferredQueueHandler(records))
+        listener = QueueListener(records, *handlers)
+        listener.start()
+    else:
+        for handler in handlers:
+            logger.addHandler(handler)
+
+    if cfg['enabled'] == "False":
+        logging.disable(logging.CRITICAL)
+
+    return logger, listener
@@ -1,11 +1,15 @@
 #!/usr/bin/python
 
 import logging, logging.handlers
+from log_shipping import BatchingSocketHandler
 
 rootLogger = logging.getLogger('')
 rootLogger.setLevel(logging.DEBUG)
-socketHandler = logging.handlers.SocketHandler('localhost',
-                    logging.handlers.DEFAULT_TCP_LOGGING_PORT)
+# The records are queued and sent in batches by a background thread. While
+# the topside cannot be reached they are kept in the spool file.
+socketHandler = BatchingSocketHandler('localhost',
+                    logging.handlers.DEFAULT_TCP_LOGGING_PORT,
+                    spool_file='log_spool.bin')
 # don't bother with a formatter, since a socket handler sends the event as
 # an unformatted pickle
 rootLogger.addHandler(socketHandler)
@@ -22,4 +26,7 @@ vision = logging.getLogger("auv.vision")
 sensors.debug("Wrote mtSendBBUser (14 bytes) to sonar.")
 sensors.info("Sonar configured to channel 2 (675 kHz).")
 vision.warning("Encountered low light environment.")
-vision.critical("Lost connection with camera 2!")
\ No newline at end of file
+vision.critical("Lost connection with camera 2!")
+
+# Send what is still queued.
+socketHandler.close()
@@ -1,45 +1,223 @@
 #!/usr/bin/python
 
-import cPickle
+'''
+TCP log receiver for the records of logging.handlers.SocketHandler and
+log_shipping.BatchingSocketHandler clients.
+
+All connections are served by one thread. The sockets are watched with
+selectors (epoll, kqueue, ...) on Python 3, epoll on Python 2 under Linux,
+else select(). Each connection receives straight into its own buffer and
+decodes the complete frames from views of it, without copying them; the
+records of everything that arrived in one round are then logged in one
+batch.
+'''
+
+import errno
 import logging
 import logging.handlers
-import SocketServer
-import struct
+import select
+import socket
 
+from log_shipping import FRAME_HEADER, LENGTH_MASK, decode_frame
 
-class LogRecordStreamHandler(SocketServer.StreamRequestHandler):
-    """Handler for a streaming logging request.
+try:
+    import selectors
+except ImportError:
+    selectors = None
 
-    This basically logs the record using whatever logging policy is
-    configured locally.
-    """
+# Frames longer than this are taken for garbage and close the connection.
+MAX_FRAME = 64 * 1024 * 1024
+
+try:
+    # Python 2: zlib and cPickle (through cStringIO) take buffer objects,
+    # not memoryviews.
+    frame_view = buffer
+except NameError:
+    def frame_view(data, offset, size):
+        return memoryview(data)[offset:offset + size]
+
+
+class Selector(object):
+    '''
+    Read readiness of sockets, each registered with a callback. Uses
+    selectors where available (Python 3.4+), else epoll on Linux, and
+    select() as the last resort; select() cannot watch file descriptors
+    from FD_SETSIZE (1024) on.
+    '''
+
+    def __init__(self):
+        self.callbacks = {}
+        self.selector = None
+        self.epoll = None
+        if selectors is not None:
+            self.selector = selectors.DefaultSelector()
+        elif hasattr(select, 'epoll'):
+            self.epoll = select.epoll()
+            # file descriptor -> callback
+            self.fds = {}
+
+    def register(self, sock, callback):
+        self.callbacks[sock] = callback
+        if self.selector is not None:
+            self.selector.register(sock, selectors.EVENT_READ, callback)
+        elif self.epoll is not None:
+            self.fds[sock.fileno()] = callback
+            self.epoll.register(sock.fileno(), select.EPOLLIN)
+
+    def unregister(self, sock):
+        del self.callbacks[sock]
+        if self.selector is not None:
+            self.selector.unregister(sock)
+        elif self.epoll is not None:
+            del self.fds[sock.fileno()]
+            self.epoll.unregister(sock.fileno())
 
-    def handle(self):
-        """
-        Handle multiple requests - each expected to be a 4-byte length,
-        followed by the LogRecord in pickle format. Logs the record
-        according to whatever policy is configured locally.
-        """
-        while 1:
-            chunk = self.connection.recv(4)
-            if len(chunk) < 4:
+    def select(self, timeout=None):
+        '''
+        Wait for sockets to become readable, return their callbacks.
+        '''
+        if self.selector is not None:
+            return [key.data for key, mask in self.selector.select(timeout)]
+        if self.epoll is not None:
+            try:
+                events = self.epoll.poll(-1 if timeout is None else timeout)
+            except IOError as e:
+                if e.errno == errno.EINTR:
+                    return []
+                raise
+            # Errors and hang ups are reported as readable, the callbacks
+            # find out by reading.
+            return [self.fds[fd] for fd, event in events if fd in self.fds]
+        ready = select.select(list(self.callbacks), [], [], timeout)[0]
+        return [self.callbacks[sock] for sock in ready]
+
+
+class LogConnection(object):
+    '''
+    A client connection. Frames are a 4-byte length followed by a pickled
+    LogRecord dict, or a batch of them (see log_shipping).
+    '''
+
+    RECV_SIZE = 65536
+
+    def __init__(self, server, sock, address):
+        self.server = server
+        self.sock = sock
+        self.address = address
+        # Received data is buffer[:end], the frames start at 0.
+        self.buffer = bytearray(self.RECV_SIZE)
+        self.end = 0
+
+    def readable(self):
+        buf = self.buffer
+        try:
+            # The view is gone after the call, compact() may then resize
+            # the buffer.
+            n = self.sock.recv_into(memoryview(buf)[self.end:])
+        except socket.error as e:
+            if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return
+            n = 0
+        if not n:
+            self.close()
+            return
+        self.end += n
+        offset = 0
+        while self.end - offset >= FRAME_HEADER.size:
+            header = FRAME_HEADER.unpack_from(buf, offset)[0]
+            length = header & LENGTH_MASK
+            if length > MAX_FRAME:
+                logging.warning("Frame of %d bytes from %s, closing", length,
+                    self.address)
+                self.close()
+                return
+            start = offset + FRAME_HEADER.size
+            if start + length > self.end:
                 break
-            slen = struct.unpack(">L", chunk)[0]
-            chunk = self.connection.recv(slen)
-            while len(chunk) < slen:
-                chunk = chunk + self.connection.recv(slen - len(chunk))
-            obj = self.un_pickle(chunk)
-            record = logging.makeLogRecord(obj)
-            self.handle_log_record(record)
+            try:
+                self.server.pending.extend(decode_frame(header,
+                    frame_view(buf, start, length)))
+            except Exception:
+                logging.exception("Bad frame from %s", self.address)
+            offset = start + length
+        self.compact(offset)
 
-    def un_pickle(self, data):
-        return cPickle.loads(data)
+    def compact(self, offset):
+        '''
+        Move the incomplete frame from offset to the start of the buffer and
+        size the buffer for it.
+        '''
+        buf = self.buffer
+        rest = self.end - offset
+        if offset and rest:
+            buf[:rest] = buf[offset:self.end]
+        self.end = rest
+        size = self.RECV_SIZE
+        if rest >= FRAME_HEADER.size:
+            size = max(size, FRAME_HEADER.size +
+                (FRAME_HEADER.unpack_from(buf)[0] & LENGTH_MASK))
+        if len(buf) < size:
+            buf.extend(bytearray(size - len(buf)))
+        elif len(buf) > size:
+            # Give the memory of a long frame back.
+            del buf[size:]
+
+    def close(self):
+        self.server.selector.unregister(self.sock)
+        self.sock.close()
+
+
+class LogRecordSocketReceiver(object):
+    """TCP socket-based logging receiver serving any number of clients on
+    one thread.
+    """
+
+    def __init__(self, host='localhost',
+                 port=logging.handlers.DEFAULT_TCP_LOGGING_PORT):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((host, port))
+        self.socket.listen(128)
+        self.socket.setblocking(False)
+        self.selector = Selector()
+        self.selector.register(self.socket, self.accept)
+        # Record dicts received but not logged yet.
+        self.pending = []
+        self.abort = 0
+        self.logname = None
+        # stop() wakes the loop up through a socket pair, without one the
+        # loop checks for abort every second.
+        self.timeout = 1
+        if hasattr(socket, 'socketpair'):
+            self.wakeup, self.wakeup_writer = socket.socketpair()
+            self.wakeup.setblocking(False)
+            self.selector.register(self.wakeup, self.drain_wakeup)
+            self.timeout = None
+
+    def accept(self):
+        try:
+            sock, address = self.socket.accept()
+        except socket.error:
+            return
+        sock.setblocking(False)
+        connection = LogConnection(self, sock, address)
+        self.selector.register(sock, connection.readable)
+
+    def drain_wakeup(self):
+        try:
+            self.wakeup.recv(4096)
+        except socket.error:
+            pass
+
+    def handle_log_records(self, records):
+        for obj in records:
+            self.handle_log_record(logging.makeLogRecord(obj))
 
     def handle_log_record(self, record):
         # if a name is specified, we use the named logger rather than the one
         # implied by the record.
-        if self.server.logname is not None:
-            name = self.server.logname
+        if self.logname is not None:
+            name = self.logname
         else:
             name = record.name
         logger = logging.getLogger(name)
@@ -49,30 +227,18 @@ class LogRecordStreamHandler(SocketServer.StreamRequestHandler):
         # cycles and network bandwidth!
         logger.handle(record)
 
-class LogRecordSocketReceiver(SocketServer.ThreadingTCPServer):
-    """simple TCP socket-based logging receiver suitable for testing.
-    """
-
-    allow_reuse_address = 1
-
-    def __init__(self, host='localhost',
-                 port=logging.handlers.DEFAULT_TCP_LOGGING_PORT,
-                 handler=LogRecordStreamHandler):
-        SocketServer.ThreadingTCPServer.__init__(self, (host, port), handler)
-        self.abort = 0
-        self.timeout = 1
-        self.logname = None
-
     def serve_until_stopped(self):
-        import select
-        abort = 0
-        while not abort:
-            rd, wr, ex = select.select([self.socket.fileno()],
-                                       [], [],
-                                       self.timeout)
-            if rd:
-                self.handle_request()
-            abort = self.abort
+        while not self.abort:
+            for callback in self.selector.select(self.timeout):
+                callback()
+            if self.pending:
+                records, self.pending = self.pending, []
+                self.handle_log_records(records)
+
+    def stop(self):
+        self.abort = 1
+        if self.timeout is None:
+            self.wakeup_writer.send(b'\0')
 
 def main():
     logging.basicConfig(
@@ -82,4 +248,4 @@ def main():
     tcpserver.serve_until_stopped()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,315 @@
+#!/usr/bin/python
+
+'''
+Sensor hub: one process owns the serial ports of the IMU, the AUV link, the
+power Arduino and the sonar, reads each of them in its own thread and
+publishes the newest sample of every sensor in shared memory. Any number of
+processes (PID loop, topside, logger) can read the samples at the same time
+without talking to the ports:
+
+    store = SensorStore("auv_sensors")
+    seq, timestamp, imu = store.read("imu")
+
+Every channel is a slot guarded by a sequence lock. The writer makes the
+sequence number odd, writes the sample and makes it even again. A reader
+unpacks the slot straight from the shared memory and retries if the number
+was odd or changed meanwhile, so the writer never waits for readers and
+readers never take a lock.
+
+The shared memory is a file in /dev/shm (the temporary directory where
+there is none) mapped by every process.
+'''
+
+import errno
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from collections import namedtuple
+
+import configs
+import telemetry
+
+MAGIC = b'HUB1'
+STORE_HEADER = struct.Struct('<4sI')
+# Sequence number and time (time.time()) of the sample.
+SLOT_HEADER = struct.Struct('<Id')
+
+power_state = namedtuple("power_state", "voltage")
+sonar_state = namedtuple("sonar_state", "bearing range_scale dbytes pings")
+
+# Channels in the order of their slots. Readers and the hub must agree on
+# this table, change the layout version when changing it.
+CHANNELS = (
+    ('imu', struct.Struct('<ff'), telemetry.imu_state),
+    ('vehicle', telemetry.RECORDS[telemetry.TYPE_VEHICLE_STATE][0],
+        telemetry.vehicle_state),
+    ('power', struct.Struct('<f'), power_state),
+    ('sonar', struct.Struct('<HHHI'), sonar_state),
+    )
+LAYOUT_VERSION = 1
+
+# Spins of a reader before it gives up on a slot that is being written.
+READ_RETRIES = 1000
+
+# Seconds a port read may block, the readers check for stop() in between.
+PORT_TIMEOUT = 1.0
+
+
+class SharedMemory(object):
+    '''
+    Named shared memory block with a writable buffer.
+    '''
+
+    def __init__(self, name, size=0, create=False):
+        self.name = name
+        directory = '/dev/shm' if os.path.isdir('/dev/shm') else \
+            tempfile.gettempdir()
+        self.path = os.path.join(directory, name)
+        flags = os.O_RDWR
+        if create:
+            # A block left behind by a hub that was killed would keep the
+            # new one from starting. Readers still mapping it keep their
+            # copy until they reopen the store.
+            try:
+                os.unlink(self.path)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+            flags |= os.O_CREAT | os.O_EXCL
+        fd = os.open(self.path, flags, 0o600)
+        try:
+            if create:
+                os.ftruncate(fd, size)
+            self.buf = mmap.mmap(fd, 0)
+        finally:
+            os.close(fd)
+
+    def close(self):
+        self.buf.close()
+
+    def unlink(self):
+        os.unlink(self.path)
+
+
+class SensorStore(object):
+    '''
+    The newest sample of every channel. The hub creates the store, the
+    consumers open it by name.
+    '''
+
+    def __init__(self, name, create=False):
+        self.slots = {}
+        offset = STORE_HEADER.size
+        for channel, layout, record in CHANNELS:
+            self.slots[channel] = (offset, layout, record)
+            # Keep the slots 8 byte aligned.
+            offset += (SLOT_HEADER.size + layout.size + 7) & ~7
+        self.memory = SharedMemory(name, offset, create)
+        self.buf = self.memory.buf
+        if create:
+            STORE_HEADER.pack_into(self.buf, 0, MAGIC, LAYOUT_VERSION)
+        elif STORE_HEADER.unpack_from(self.buf) != (MAGIC, LAYOUT_VERSION):
+            self.close()
+            raise ValueError('%s is not a sensor store of this version' % name)
+
+    def close(self):
+        self.buf = None
+        self.memory.close()
+
+    def unlink(self):
+        self.memory.unlink()
+
+    def write(self, channel, values, timestamp=None):
+        '''
+        Publish a sample. Only one thread may write a channel.
+        '''
+        if timestamp is None:
+            timestamp = time.time()
+        offset, layout, _ = self.slots[channel]
+        buf = self.buf
+        seq = SLOT_HEADER.unpack_from(buf, offset)[0]
+        SLOT_HEADER.pack_into(buf, offset, (seq + 1) & 0xFFFFFFFF, timestamp)
+        layout.pack_into(buf, offset + SLOT_HEADER.size, *values)
+        SLOT_HEADER.pack_into(buf, offset, (seq + 2) & 0xFFFFFFFF, timestamp)
+
+    def read(self, channel):
+        '''
+        Return (seq, timestamp, record) of the newest sample of a channel.
+        seq counts the samples written (times two), it is 0 and record is
+        None before the first one. Returns None if the slot could not be
+        read consistently, i.e. its writer died while writing.
+        '''
+        offset, layout, record = self.slots[channel]
+        buf = self.buf
+        retries = READ_RETRIES
+        while retries:
+            retries -= 1
+            seq, timestamp = SLOT_HEADER.unpack_from(buf, offset)
+            if seq & 1:
+                continue
+            values = layout.unpack_from(buf, offset + SLOT_HEADER.size)
+            if SLOT_HEADER.unpack_from(buf, offset)[0] == seq:
+                if seq == 0:
+                    return 0, timestamp, None
+                return seq, timestamp, record._make(values)
+        return None
+
+
+class SensorHub(object):
+    '''
+    Reads the sensors of the [SensorHub] config section into a store. A
+    port left empty in the config disables its sensor. Ports that cannot be
+    opened or fail while reading are logged and opened again.
+    '''
+
+    def __init__(self):
+        cfg = configs.parse_config_section("SensorHub")
+        self.cfg = cfg
+        self.logger = logging.getLogger(__name__)
+        self.running = False
+        self.threads = []
+        self.store = SensorStore(cfg['store'], create=True)
+
+    def open_port(self, name):
+        '''
+        Open the port of sensor name ('imu', 'auv' or 'power'), retrying
+        every second until it can be opened. Returns None if the hub is
+        stopped meanwhile.
+        '''
+        import serial
+        port = self.cfg[name + '_port']
+        while self.running:
+            try:
+                return serial.serial_for_url(port,
+                    baudrate=int(self.cfg[name + '_baud_rate']),
+                    timeout=PORT_TIMEOUT, writeTimeout=PORT_TIMEOUT)
+            except (OSError, serial.SerialException) as e:
+                self.logger.warning("Could not open %s port %s: %s", name,
+                    port, e)
+                time.sleep(1)
+        return None
+
+    def keep_reading(self, name, read):
+        '''
+        Run read(port) on the port of sensor name until the hub stops. The
+        port is reopened whenever it fails, e.g. when a USB adapter is
+        unplugged.
+        '''
+        import serial
+        while self.running:
+            port = self.open_port(name)
+            if port is None:
+                break
+            self.logger.info("Reading %s from %s", name, port.portstr)
+            try:
+                read(port)
+            except (OSError, serial.SerialException) as e:
+                self.logger.warning("Lost %s port: %s, reconnecting", name, e)
+                time.sleep(1)
+            finally:
+                port.close()
+
+    def read_imu(self, imu):
+        while self.running:
+            imu.write('\n')
+            try:
+                heading, depth = imu.readline().split(",")
+                self.store.write('imu', (float(heading), float(depth)))
+            except ValueError:
+                continue
+
+    def read_vehicle(self, auv):
+        decoder = telemetry.TelemetryDecoder()
+        while self.running:
+            data = auv.read(1)
+            waiting = auv.inWaiting()
+            if waiting:
+                data += auv.read(waiting)
+            for record in decoder.feed(data):
+                if isinstance(record, telemetry.vehicle_state):
+                    self.store.write('vehicle', record)
+
+    def read_power(self, arduino):
+        while self.running:
+            try:
+                self.store.write('power', (float(arduino.readline()),))
+            except ValueError:
+                continue
+
+    def read_sonar(self, name):
+        # The sonar code lives in src/sonar, it has to be on the path.
+        import serial
+        from sonar import Sonar
+        from acquisition import PingScheduler
+        port = self.cfg['sonar_port']
+        pings = [0]
+        def publish(params, sweep):
+            if not self.running:
+                # The decoder of a stopped scheduler may lag behind.
+                return
+            pings[0] += 1
+            self.store.write('sonar', (params.bearing, params.range_scale,
+                params.dbytes, pings[0]))
+        while self.running:
+            try:
+                sonar = Sonar(port)
+                sonar.head_command()
+            except (OSError, serial.SerialException) as e:
+                self.logger.warning("Could not open sonar port %s: %s", port,
+                    e)
+                time.sleep(1)
+                continue
+            self.logger.info("Reading sonar from %s", port)
+            scheduler = PingScheduler(sonar, publish)
+            scheduler.start()
+            while self.running and scheduler.error is None:
+                time.sleep(0.5)
+            scheduler.stop()
+            sonar.close()
+            if scheduler.error is not None:
+                self.logger.warning("Lost sonar port: %s, reconnecting",
+                    scheduler.error)
+                time.sleep(1)
+
+    def start(self):
+        self.running = True
+        readers = (('imu', self.keep_reading, (self.read_imu,)),
+            ('auv', self.keep_reading, (self.read_vehicle,)),
+            ('power', self.keep_reading, (self.read_power,)),
+            ('sonar', self.read_sonar, ()))
+        for name, target, args in readers:
+            if self.cfg.get(name + '_port'):
+                thread = threading.Thread(target=target, args=(name,) + args)
+                thread.daemon = True
+                thread.start()
+                self.threads.append(thread)
+
+    def stop(self):
+        '''
+        Stop the readers and wait for them before the store goes away.
+        '''
+        self.running = False
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        self.store.close()
+        self.store.unlink()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO,
+        format="%(asctime)s %(levelname)-8s %(message)s")
+    hub = SensorHub()
+    hub.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        hub.stop()
+
+if __name__ == "__main__":
+    main()
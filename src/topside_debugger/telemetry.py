@@ -0,0 +1,209 @@
+#!/usr/bin/python
+
+'''
+Framed and checksummed protocol for the vehicle link.
+
+A message is
+
+    version (1 byte), type (1 byte), sequence number (1 byte), payload,
+    CRC-16/CCITT-FALSE of everything before it (2 bytes, little endian)
+
+COBS encoded and followed by a 0 byte. COBS removes all 0 bytes from the
+encoded message, so 0 only ever marks the end of a frame: the receiver
+resynchronises at the next 0 whatever the payload holds, and a damaged
+frame costs only itself.
+
+The payloads are fixed layouts, see RECORDS. TelemetryDecoder turns a byte
+stream into these records and counts bad frames and lost messages.
+'''
+
+import struct
+from collections import namedtuple
+
+PROTOCOL_VERSION = 1
+
+DELIMITER = 0
+
+HEADER = struct.Struct('<BBB')
+CRC = struct.Struct('<H')
+# Version, type, sequence number and CRC.
+OVERHEAD = HEADER.size + CRC.size
+
+# Message types.
+TYPE_COMMAND = 1
+TYPE_VEHICLE_STATE = 2
+TYPE_IMU_STATE = 3
+
+# Command frame contents: roll, pitch, yaw, throttle, button, hat and the
+# four manipulators.
+command = namedtuple("command",
+    "roll pitch yaw throttle button hat m1 m2 m3 m4")
+# Vehicle telemetry: heading, pitch and roll (0.01 degree), depth (mm),
+# battery voltage (mV) and status bits.
+vehicle_state = namedtuple("vehicle_state",
+    "heading pitch roll depth voltage status")
+# IMU heading (degrees) and depth (m).
+imu_state = namedtuple("imu_state", "heading depth")
+
+RECORDS = {
+    TYPE_COMMAND: (struct.Struct('<10B'), command),
+    TYPE_VEHICLE_STATE: (struct.Struct('<hhhiHB'), vehicle_state),
+    TYPE_IMU_STATE: (struct.Struct('<ff'), imu_state),
+    }
+
+
+def _crc_table():
+    table = []
+    for byte in range(256):
+        crc = byte << 8
+        for _ in range(8):
+            if crc & 0x8000:
+                crc = ((crc << 1) ^ 0x1021) & 0xFFFF
+            else:
+                crc = (crc << 1) & 0xFFFF
+        table.append(crc)
+    return table
+
+CRC_TABLE = _crc_table()
+
+
+def crc16(data, crc=0xFFFF):
+    '''
+    CRC-16/CCITT-FALSE of a bytearray.
+    '''
+    table = CRC_TABLE
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFF) ^ table[(crc >> 8) ^ byte]
+    return crc
+
+
+def cobs_encode(data):
+    '''
+    COBS encode a bytearray. The result contains no 0 bytes.
+    '''
+    out = bytearray([0])
+    code_index = 0
+    code = 1
+    for byte in data:
+        if byte:
+            out.append(byte)
+            code += 1
+        if not byte or code == 0xFF:
+            out[code_index] = code
+            code_index = len(out)
+            out.append(0)
+            code = 1
+    out[code_index] = code
+    return out
+
+
+def cobs_decode(data):
+    '''
+    Decode a COBS encoded bytearray without the delimiter. Raises
+    ValueError if the encoding is invalid.
+    '''
+    out = bytearray()
+    i = 0
+    n = len(data)
+    while i < n:
+        code = data[i]
+        if code == 0 or i + code > n:
+            raise ValueError('invalid COBS code')
+        out += data[i + 1:i + code]
+        i += code
+        if code < 0xFF and i < n:
+            out.append(0)
+    return out
+
+
+class TelemetryEncoder(object):
+    '''
+    Frames messages, numbering them.
+    '''
+
+    def __init__(self):
+        self.seq = 0
+
+    def encode(self, msg_type, payload):
+        body = bytearray(HEADER.pack(PROTOCOL_VERSION, msg_type, self.seq))
+        body += payload
+        body += CRC.pack(crc16(body))
+        self.seq = (self.seq + 1) & 0xFF
+        frame = cobs_encode(body)
+        frame.append(DELIMITER)
+        return frame
+
+    def encode_record(self, msg_type, record):
+        layout = RECORDS[msg_type][0]
+        return self.encode(msg_type, layout.pack(*record))
+
+    def encode_command(self, frame):
+        '''
+        Frame the contents of a CommandFrame, without its START and STOP.
+        '''
+        return self.encode(TYPE_COMMAND, frame.buffer[1:-1])
+
+
+class TelemetryDecoder(object):
+    '''
+    Incremental decoder. feed() takes data in chunks of any size and returns
+    the records of the complete frames, as namedtuples of RECORDS. Messages
+    of unknown types are returned as (type, payload) tuples.
+    '''
+
+    # Longest frame accepted, longer ones are dropped as garbage.
+    MAX_FRAME = 1024
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.last_seq = None
+        # Frames that failed to decode, and messages missing according to
+        # the sequence numbers.
+        self.errors = 0
+        self.lost = 0
+
+    def feed(self, data):
+        buf = self.buffer
+        buf += data
+        records = []
+        start = 0
+        while True:
+            end = buf.find(b'\x00', start)
+            if end < 0:
+                break
+            if end > start:
+                record = self._decode(buf[start:end])
+                if record is not None:
+                    records.append(record)
+            start = end + 1
+        del buf[:start]
+        if len(buf) > self.MAX_FRAME:
+            self.errors += 1
+            del buf[:]
+        return records
+
+    def _decode(self, frame):
+        try:
+            body = cobs_decode(frame)
+        except ValueError:
+            self.errors += 1
+            return None
+        if len(body) < OVERHEAD or crc16(body[:-CRC.size]) != \
+                CRC.unpack_from(body, len(body) - CRC.size)[0]:
+            self.errors += 1
+            return None
+        version, msg_type, seq = HEADER.unpack_from(body)
+        if version != PROTOCOL_VERSION:
+            self.errors += 1
+            return None
+        if self.last_seq is not None:
+            self.lost += (seq - self.last_seq - 1) & 0xFF
+        self.last_seq = seq
+        payload = body[HEADER.size:-CRC.size]
+        if msg_type in RECORDS:
+            layout, record = RECORDS[msg_type]
+            if len(payload) != layout.size:
+                self.errors += 1
+                return None
+            return record._make(layout.unpack_from(payload))
+        return (msg_type, bytes(payload))